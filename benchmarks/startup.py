@@ -0,0 +1,86 @@
+"""
+Startup benchmark for the command-line interface.
+
+Times no-op invocations of main.py (no valid sources, and a configuration that
+is already up to date) against a bare interpreter start, so regressions in
+import cost are easy to spot:
+
+    python benchmarks/startup.py [--runs 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def time_command(cmd, env, runs):
+    """Return the wall-clock times (ms) of running cmd runs times"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, cwd=REPO_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def write_config(path, download_dir, **overrides):
+    config = {
+        "download_dir": str(download_dir),
+        "overwrite": False,
+        "verbosity": "warning",
+        "xeno": {"api_key": "", "location": None, "country": "", "max_per_species": 3,
+                 "better_than_rating": "C", "min_length_seconds": None, "max_length_seconds": 300},
+        "ebird": {"api_key": "", "region_code": "", "backup_region_codes": [], "max_per_species": 3}
+    }
+    config.update(overrides)
+    with open(path, "w") as f:
+        json.dump(config, f)
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(REPO_DIR))
+    from birdcall_core.state import mark_run_complete
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+
+        no_sources_config = os.path.join(tmp, "no_sources.json")
+        write_config(no_sources_config, Path(tmp) / "downloads")
+
+        # A valid configuration whose last run is recorded as recent
+        up_to_date_config = os.path.join(tmp, "up_to_date.json")
+        config = write_config(up_to_date_config, Path(tmp) / "downloads", min_run_interval_hours=24)
+        config["xeno"]["country"] = "malaysia"
+        with open(up_to_date_config, "w") as f:
+            json.dump(config, f)
+        mark_run_complete(config)
+
+        cases = [
+            ("python -c pass", [sys.executable, "-c", "pass"], env),
+            ("main.py (no valid sources)", [sys.executable, "main.py"],
+             {**env, "BIRDCALL_CONFIG": no_sources_config}),
+            ("main.py (up to date)", [sys.executable, "main.py"],
+             {**env, "BIRDCALL_CONFIG": up_to_date_config}),
+        ]
+
+        print(f"{'case':<32} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+        for name, cmd, case_env in cases:
+            timings = time_command(cmd, case_env, args.runs)
+            print(f"{name:<32} {statistics.median(timings):>10.1f} {min(timings):>10.1f} {max(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Process-wide bandwidth limiting for bird call downloader.
+
+All file downloads go through a single BandwidthLimiter. The total rate
+(bytes per second) is split evenly between the sources that are currently
+downloading (e.g. "xeno" and "ebird"); when one source finishes, its share is
+handed to the others. The total rate can vary by time of day.
+
+Configured from config["bandwidth"]:
+
+    "bandwidth": {
+        "bytes_per_second": null,
+        "schedule": [
+            {"start": "09:00", "end": "18:00", "bytes_per_second": 1000000}
+        ]
+    }
+
+A schedule entry applies between its start and end times (local time; entries
+may wrap past midnight). Outside every schedule entry bytes_per_second applies;
+null or 0 means unlimited.
+"""
+import time
+import threading
+from datetime import datetime
+
+# Largest single sleep while waiting for bandwidth, so schedule changes and
+# redistributed shares take effect promptly
+MAX_WAIT_SECONDS = 1.0
+
+
+def _parse_time(value):
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class BandwidthLimiter:
+    """Token-bucket limiter whose capacity is shared fairly between active sources"""
+
+    def __init__(self, bytes_per_second=None, schedule=None, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._active = {}       # source -> number of active sessions
+        self._next_free = {}    # source -> clock time when its last reservation is paid off
+        self.configure(bytes_per_second, schedule)
+
+    def configure(self, bytes_per_second=None, schedule=None):
+        """Replace the default rate and time-of-day schedule"""
+        parsed = []
+        for entry in schedule or []:
+            parsed.append((_parse_time(entry["start"]), _parse_time(entry["end"]),
+                           entry.get("bytes_per_second")))
+        with self._lock:
+            self.bytes_per_second = bytes_per_second
+            self.schedule = parsed
+
+    def current_rate(self, now=None):
+        """Total bytes per second allowed right now, or None for unlimited"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.schedule:
+            in_window = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if in_window:
+                return rate or None
+        return self.bytes_per_second or None
+
+    def register(self, source):
+        """Mark a source as actively downloading, so it receives a share of the bandwidth"""
+        with self._lock:
+            self._active[source] = self._active.get(source, 0) + 1
+
+    def unregister(self, source):
+        """Mark a source as finished; its share is redistributed to the other sources"""
+        with self._lock:
+            if source not in self._active:
+                return
+            self._active[source] -= 1
+            if self._active[source] <= 0:
+                del self._active[source]
+                self._next_free.pop(source, None)
+
+    def throttle(self, source, num_bytes):
+        """
+        Account for num_bytes transferred by source, sleeping as needed to keep the
+        source within its share of the current rate.
+        """
+        while True:
+            rate = self.current_rate()
+            if not rate:
+                return
+            with self._lock:
+                share = rate / max(1, len(self._active))
+                now = self._clock()
+                next_free = max(self._next_free.get(source, now), now)
+                wait = next_free - now
+                if wait <= 0:
+                    # Reserve the bandwidth for these bytes and return straight away;
+                    # the next call waits until the reservation is paid off
+                    self._next_free[source] = next_free + num_bytes / share
+                    return
+            time.sleep(min(wait, MAX_WAIT_SECONDS))
+
+
+_limiter = BandwidthLimiter()
+
+
+def get_limiter():
+    """Return the process-wide limiter"""
+    return _limiter
+
+
+def configure_bandwidth(config):
+    """Apply config["bandwidth"] to the process-wide limiter"""
+    settings = config.get("bandwidth", {})
+    _limiter.configure(settings.get("bytes_per_second"), settings.get("schedule"))
+    return _limiter
@@ -0,0 +1,53 @@
+"""
+Per-species checkpoints for the eBird download loop.
+
+As each species finishes (every selected recording downloaded or already on
+disk), its eBird code is added to download_dir/.ebird_checkpoint.json, written
+atomically. If the run is interrupted, the next run with the same settings
+skips the completed species without any catalog request and carries on from the
+first unfinished one. The checkpoint is removed once the loop runs to the end.
+"""
+from pathlib import Path
+from .state import read_json_state, write_json_state, config_fingerprint
+
+CHECKPOINT_FILENAME = ".ebird_checkpoint.json"
+
+
+def _checkpoint_scope(config):
+    """The settings that decide which recordings each species gets"""
+    ebird = config["ebird"]
+    return {
+        "region_code": ebird.get("region_code"),
+        "backup_region_codes": ebird.get("backup_region_codes"),
+        "max_per_species": ebird.get("max_per_species"),
+        "species": config.get("species") or [],
+        "incremental": config.get("incremental", False),
+        "overwrite": config.get("overwrite", False),
+        "shards": bool(config.get("shards", {}).get("enabled", False))
+    }
+
+
+class SpeciesCheckpoint:
+    """Set of completed species codes, persisted after every species"""
+
+    def __init__(self, config):
+        self.path = Path(config["download_dir"]).expanduser() / CHECKPOINT_FILENAME
+        self.key = config_fingerprint(_checkpoint_scope(config))
+        state = read_json_state(self.path, default={})
+        if isinstance(state, dict) and state.get("key") == self.key:
+            self.completed = set(state.get("completed", []))
+        else:
+            self.completed = set()
+
+    def is_done(self, species_code):
+        return species_code in self.completed
+
+    def mark_done(self, species_code):
+        """Record a completed species"""
+        self.completed.add(species_code)
+        write_json_state(self.path, {"key": self.key, "completed": sorted(self.completed)})
+
+    def clear(self):
+        """Forget all progress once a run has finished"""
+        self.completed = set()
+        self.path.unlink(missing_ok=True)
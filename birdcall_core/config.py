@@ -6,6 +6,8 @@ import json
 import logging
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # Verbosity level mapping
 VERBOSITY_LEVELS = {
     "debug": logging.DEBUG,
@@ -16,7 +18,9 @@ VERBOSITY_LEVELS = {
 }
 
 def get_config_path():
-    """Get the path to the config.json file"""
+    """Get the path to the config.json file (overridable with the BIRDCALL_CONFIG environment variable)"""
+    if os.environ.get("BIRDCALL_CONFIG"):
+        return os.environ["BIRDCALL_CONFIG"]
     script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(script_dir, "config.json")
 
@@ -28,11 +32,14 @@ def load_config():
             config = json.load(f)
             return config
     except (FileNotFoundError, json.JSONDecodeError) as e:
-        logging.error(f"Error loading config: {str(e)}")
+        logger.error(f"Error loading config: {str(e)}")
         return {
             "download_dir": str(Path.home() / "Downloads" / "BirdCalls"),
             "overwrite": False,
             "verbosity": "warning",
+            "min_run_interval_hours": None,
+            "incremental": False,
+            "species": [],
             "xeno": {
                 "api_key": "",
                 "location": None,
@@ -40,13 +47,82 @@ def load_config():
                 "max_per_species": 3,
                 "better_than_rating": "C",
                 "min_length_seconds": None,
-                "max_length_seconds": 300
+                "max_length_seconds": 300,
+                "tiered": False,
+                "query_workers": 4
             },
             "ebird": {
                 "api_key": "",
                 "region_code": "",
                 "backup_region_codes": [],
-                "max_per_species": 3
+                "max_per_species": 3,
+                "catalog_workers": 1,
+                "parse_processes": 0
+            },
+            "bandwidth": {
+                "bytes_per_second": None,
+                "schedule": []
+            },
+            "schedule": {
+                "order": "coverage",
+                "species_weights": {}
+            },
+            "metadata": {
+                "enabled": False,
+                "csv": False,
+                "parquet": False
+            },
+            "shards": {
+                "enabled": False,
+                "max_bytes": 1073741824
+            },
+            "logging": {
+                "json": False,
+                "repeat_interval_seconds": 60
+            },
+            "storage": {
+                "backend": "local",
+                "bucket": "",
+                "prefix": "",
+                "endpoint_url": None,
+                "region": None,
+                "part_size": 8388608,
+                "max_concurrency": 4
+            },
+            "sizes": {
+                "measure": False,
+                "head_workers": 16,
+                "max_bytes": None
+            },
+            "features": {
+                "enabled": False,
+                "decoder": "ffmpeg",
+                "sample_rate": 22050,
+                "n_fft": 1024,
+                "hop_length": 512,
+                "n_mels": 64,
+                "fmin": 0,
+                "fmax": None,
+                "max_seconds": None,
+                "dtype": "float16",
+                "batch_size": 32,
+                "processes": 2
+            },
+            "hosts": {
+                "max_concurrency": 4,
+                "connect_timeout": 10,
+                "read_timeout": 30,
+                "failure_threshold": 5,
+                "retry_after_seconds": 30,
+                "max_retry_after_seconds": 600,
+                "max_outage_seconds": 1800,
+                "per_host": {
+                    "xeno-canto.org/api/": {"max_concurrency": 2},
+                    "xeno-canto.org": {"max_concurrency": 8},
+                    "api.ebird.org": {"max_concurrency": 2},
+                    "media.ebird.org": {"max_concurrency": 4},
+                    "cdn.download.ams.birds.cornell.edu": {"max_concurrency": 16}
+                }
             }
         }
 
@@ -58,7 +134,7 @@ def save_config(config_data):
             json.dump(config_data, f, indent=2)
         return True
     except Exception as e:
-        logging.error(f"Error saving config: {str(e)}")
+        logger.error(f"Error saving config: {str(e)}")
         return False
 
 def get_log_level(config=None):
@@ -68,3 +144,15 @@ def get_log_level(config=None):
     
     verbosity = config.get("verbosity", "info").lower()
     return VERBOSITY_LEVELS.get(verbosity, logging.INFO)
+
+def get_logging_options(config=None):
+    """Get the setup_logger options (JSON lines, repeat interval) from config["logging"]"""
+    if config is None:
+        config = load_config()
+
+    settings = config.get("logging", {})
+    repeat_interval = settings.get("repeat_interval_seconds")
+    return {
+        "json_lines": bool(settings.get("json", False)),
+        "repeat_interval": 60 if repeat_interval is None else repeat_interval
+    }
@@ -1,96 +1,256 @@
 """
 Core download functionality for bird call downloader.
 """
-import os
 import json
 import time
 import logging
-import requests
+import functools
 from pathlib import Path
-from bs4 import BeautifulSoup
 from .utils import sanitize_filename, download_file
-
-def collect_xeno_downloads(config, progress_callback=None):
+from .manifest import Manifest
+from .inventory import Inventory
+from .checkpoint import SpeciesCheckpoint
+from .metadata import create_metadata_writer, xeno_metadata, ebird_metadata
+from .shards import create_shard_writer
+from .storage import create_storage
+from .features import acquire_feature_extractor
+from .sizes import get_size_settings, fetch_sizes
+from .bandwidth import configure_bandwidth
+from .hosts import configure_hosts, get_scheduler
+from .progress import ProgressTracker
+from .sync import (
+    xeno_target_key, get_last_sync, record_sync,
+    xeno_since_date, merge_xeno_candidates, count_held_files, remove_held_recording
+)
+from .schedule import get_schedule_settings, species_weight, coverage_order, order_by_weight
+from .targets import get_target_species, resolve_targets, target_names, xeno_target_tags
+from .profiling import phase
+
+logger = logging.getLogger(__name__)
+
+XC_API_URL = "https://xeno-canto.org/api/3/recordings"
+
+# Xeno-Canto quality ratings, best first
+QUALITY_RATINGS = "ABCDE"
+
+
+def build_xeno_query(config, quality=None, extra=None):
     """
-    Query Xeno-Canto and build the list of recordings that would be downloaded,
-    WITHOUT downloading anything.
+    Build the list of Xeno-Canto search tags for the configured search.
 
     Args:
         config (dict): Configuration dictionary
-        progress_callback (callable, optional): Function to call with progress updates.
-            Used by the download path for the metadata-fetch phase (0.0-0.1).
-
-    Returns:
-        tuple: (download_args_list, species_count) where download_args_list is a list of
-            [save_dir, file_name, download_url] entries and species_count is the number of
-            distinct species with at least one recording to download.
-
-    Raises:
-        ValueError: If required search parameters or the API key are missing.
+        quality (str, optional): Restrict to exactly this rating instead of
+            "better than better_than_rating"
+        extra (list, optional): Additional search tags, e.g. ["gen:Passer", "sp:domesticus"]
     """
-    if progress_callback is None:
-        progress_callback = lambda x: None  # No-op function
-
-    download_dir = Path(config["download_dir"]).expanduser()
-    download_dir_xc = download_dir / "XC"
-
-    # Extract Xeno-Canto settings
-    xeno_api_key = config["xeno"]["api_key"]
     xeno_location = config["xeno"]["location"]
     xeno_country = config["xeno"]["country"]
     xeno_better_than = config["xeno"]["better_than_rating"]
     xeno_min_length = config["xeno"]["min_length_seconds"]
     xeno_max_length = config["xeno"]["max_length_seconds"]
-    max_per_species = config["xeno"]["max_per_species"]
-
-    # Ensure at least one search parameter is specified
-    if not xeno_country and not xeno_location:
-        raise ValueError("Either country or location must be specified for Xeno-Canto downloads.")
+    xeno_since = config["xeno"].get("since")
 
-    if not xeno_api_key:
-        raise ValueError("Xeno-Canto API key is required.")
-
-    # Prepare API query
-    base_url = "https://xeno-canto.org/api/3/recordings"
     query_params = ["grp:\"birds\""]
 
     if xeno_location:
         query_params.append(f"loc:{xeno_location}")
     if xeno_country:
         query_params.append(f"cnt:{xeno_country}")
-    if xeno_better_than:
+    if quality:
+        query_params.append(f"q:{quality}")
+    elif xeno_better_than:
         query_params.append(f"q:\">{xeno_better_than}\"")
     if xeno_min_length:
         query_params.append(f"len_gt:{xeno_min_length}")
     if xeno_max_length:
         query_params.append(f"len_lt:{xeno_max_length}")
+    if xeno_since:
+        query_params.append(f"since:{xeno_since}")
+
+    return query_params + (extra or [])
+
+
+def fetch_xeno_page(query_params, api_key, page=1):
+    """Fetch one page of Xeno-Canto search results"""
+    with phase("xeno_search"):
+        response = get_scheduler().get(f"{XC_API_URL}?query={'+'.join(query_params)}&key={api_key}&page={page}")
+        return response.json()
+
+
+def fetch_xeno_recordings(query_params, api_key, progress_callback=None, first_page=None):
+    """
+    Fetch every page of a Xeno-Canto search.
+
+    Args:
+        query_params (list): Search tags from build_xeno_query
+        api_key (str): Xeno-Canto API key
+        progress_callback (callable, optional): Called with the fraction of pages fetched
+        first_page (dict, optional): Already-fetched page 1, to avoid requesting it again
+
+    Returns:
+        list: Recording dicts from all pages
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
 
     # Make initial request to get page count
-    logging.info(f"Fetching Xeno-Canto data with params {query_params}...")
-    response = requests.get(f"{base_url}?query={'+'.join(query_params)}&key={xeno_api_key}", timeout=30)
-    data = response.json()
+    if first_page is None:
+        logger.info(f"Fetching Xeno-Canto data with params {query_params}...")
+        first_page = fetch_xeno_page(query_params, api_key)
 
-    num_pages = data.get("numPages", 0)
-    logging.info(f"Found {num_pages} pages of Xeno-Canto data")
+    num_pages = int(first_page.get("numPages", 0) or 0)
+    logger.info(f"Found {num_pages} pages of Xeno-Canto data")
 
     if num_pages == 0:
-        logging.warning("No recordings found on Xeno-Canto")
-        return [], 0
+        return []
+
+    all_recordings = list(first_page.get("recordings", []))
+
+    # Fetch remaining pages
+    for idx in range(1, num_pages):
+        progress_callback(idx / num_pages)
+        logger.info(f"Loading Xeno-Canto recordings page {idx+1}/{num_pages}...")
+        all_recordings += fetch_xeno_page(query_params, api_key, page=idx + 1)["recordings"]
+
+    return all_recordings
+
+
+def _collect_xeno_tiered(config, progress_callback):
+    """
+    Fetch recordings tier by tier (A, then B, ...), stopping once every species in
+    scope has max_per_species recordings.
+
+    One request on the full search gives numSpecies, the number of species in scope.
+    Each quality tier is then searched country-wide while some species have not been
+    seen yet. Once every species has been seen, species that still lack recordings
+    are searched individually (gen/sp tags) whenever that takes fewer requests than
+    paging through the rest of the tier.
+
+    Returns:
+        list: Recording dicts (unsorted, possibly more than max_per_species per species)
+    """
+    api_key = config["xeno"]["api_key"]
+    max_per_species = config["xeno"]["max_per_species"]
+    better_than = config["xeno"]["better_than_rating"]
+
+    if better_than and better_than in QUALITY_RATINGS:
+        tiers = QUALITY_RATINGS[:QUALITY_RATINGS.index(better_than)]
+    else:
+        tiers = QUALITY_RATINGS
+
+    scope = fetch_xeno_page(build_xeno_query(config), api_key)
+    request_count = 1
+    if not int(scope.get("numRecordings", 0) or 0):
+        logger.warning("No recordings found on Xeno-Canto")
+        return []
+    num_species = int(scope.get("numSpecies", 0) or 0)  # 0 if the API doesn't say
+    logger.info(f"Tiered Xeno-Canto search: {scope.get('numRecordings')} recordings, "
+                 f"{num_species or 'unknown number of'} species in scope")
 
     all_recordings = []
+    seen_ids = set()
+    counts = {}        # species -> downloadable recordings found so far
+    species_tags = {}  # species -> (genus, species epithet)
 
-    # Fetch all pages
-    for idx in range(num_pages):
-        progress_percent = (idx / max(1, num_pages)) * 0.1
-        progress_callback(progress_percent)
-        logging.info(f"Loading Xeno-Canto recordings page {idx+1}/{num_pages}...")
+    def add(recordings):
+        for rec in recordings:
+            if rec.get("id") in seen_ids:
+                continue
+            seen_ids.add(rec.get("id"))
+            all_recordings.append(rec)
+            if rec.get("file") and rec.get("en"):
+                counts[rec["en"]] = counts.get(rec["en"], 0) + 1
+                species_tags.setdefault(rec["en"], (rec.get("gen"), rec.get("sp")))
+
+    for tier_idx, tier in enumerate(tiers):
+        progress_callback(tier_idx / len(tiers))
+        all_seen = bool(num_species) and len(counts) >= num_species
+        lacking = [species for species, count in counts.items() if count < max_per_species]
+        if all_seen and not lacking:
+            break
+
+        tier_query = build_xeno_query(config, quality=tier)
+        first_page = fetch_xeno_page(tier_query, api_key)
+        request_count += 1
+        num_pages = int(first_page.get("numPages", 0) or 0)
+        logger.info(f"Quality {tier}: {num_pages} pages, {len(lacking)} species still lacking")
+        if num_pages == 0:
+            continue
+
+        if all_seen and len(lacking) < num_pages - 1:
+            # Cheaper to ask for the lacking species one by one
+            add(rec for rec in first_page.get("recordings", []) if rec.get("en") in lacking)
+            for species in lacking:
+                if counts.get(species, 0) >= max_per_species:
+                    continue
+                genus, epithet = species_tags[species]
+                if not genus or not epithet:
+                    continue
+                species_query = build_xeno_query(config, quality=tier, extra=[f"gen:{genus}", f"sp:{epithet}"])
+                species_first_page = fetch_xeno_page(species_query, api_key)
+                request_count += int(species_first_page.get("numPages", 1) or 1)
+                add(fetch_xeno_recordings(species_query, api_key, first_page=species_first_page))
+        else:
+            request_count += max(0, num_pages - 1)
+            add(fetch_xeno_recordings(tier_query, api_key, first_page=first_page))
+
+    logger.info(f"Tiered Xeno-Canto search finished after {request_count} metadata requests")
+    return all_recordings
+
+
+def _collect_xeno_targeted(config, targets, progress_callback):
+    """
+    Search Xeno-Canto once per target species, with up to config["xeno"]["query_workers"]
+    searches in flight at a time.
 
-        rec_response = requests.get(f"{base_url}?query={'+'.join(query_params)}&key={xeno_api_key}&page={idx + 1}", timeout=30)
-        rec_data = rec_response.json()
-        all_recordings += rec_data["recordings"]
+    Targets are looked up in the eBird taxonomy when an eBird API key is configured, so
+    that common names and eBird codes can be searched by scientific name.
+
+    Returns:
+        list: Recording dicts of the target species only
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    api_key = config["xeno"]["api_key"]
+    ebird_api_key = config.get("ebird", {}).get("api_key")
+    taxonomy = _fetch_ebird_taxonomy_records(ebird_api_key) if ebird_api_key else None
+    resolved = resolve_targets(targets, taxonomy)
+
+    searches = []
+    for entry in resolved:
+        tags = xeno_target_tags(entry)
+        if tags is None:
+            logger.warning(f"Cannot search Xeno-Canto for unknown species '{entry['target']}'")
+            continue
+        searches.append((entry["target"], target_names([entry]), build_xeno_query(config, extra=tags)))
+
+    logger.info(f"Searching Xeno-Canto for {len(searches)} target species...")
+    all_recordings = []
+    with ThreadPoolExecutor(max_workers=max(1, config["xeno"].get("query_workers", 4))) as executor:
+        futures = [executor.submit(fetch_xeno_recordings, query, api_key) for _, _, query in searches]
+        for i, ((target, names, _), future) in enumerate(zip(searches, futures)):
+            progress_callback(i / max(1, len(searches)))
+            recordings = future.result()
+            # A common-name search can match more than the exact species
+            matched = [rec for rec in recordings if (rec.get("en") or "").lower() in names
+                       or f"{rec.get('gen', '')} {rec.get('sp', '')}".lower() in names]
+            if not matched:
+                logger.warning(f"No Xeno-Canto recordings found for '{target}'")
+            all_recordings.extend(matched)
+
+    return all_recordings
+
+
+def select_xeno_recordings(all_recordings, config):
+    """
+    Keep the best max_per_species downloadable recordings of each species and order
+    them according to config["schedule"].
+    """
+    max_per_species = config["xeno"]["max_per_species"]
 
     # Group recordings by species
-    logging.info("Processing recordings by species...")
+    logger.info("Processing recordings by species...")
     recordings_by_species = {}
     for rec in all_recordings:
         species = rec["en"]
@@ -107,15 +267,94 @@ def collect_xeno_downloads(config, progress_callback=None):
     for species, recordings in recordings_by_species.items():
         filtered_recordings.extend(recordings[:max_per_species])
 
-    download_args_list = [
-        [Path(download_dir_xc / sanitize_filename(rec["en"])),
-        f"({rec['q']}) {rec['en']}; {rec['loc']}; {rec['rec']}; XC{rec['id']}.mp3",
-        rec["file"]]
-        for rec in filtered_recordings if rec["file"] and rec["en"]
-    ]
+    filtered_recordings = [rec for rec in filtered_recordings if rec["file"] and rec["en"]]
+
+    # Order downloads: round-robin across species, or species by species
+    schedule_order, weights = get_schedule_settings(config)
+    weight_key = lambda rec: species_weight(weights, rec["en"], f"{rec.get('gen', '')} {rec.get('sp', '')}")
+    if schedule_order == "coverage":
+        return coverage_order(filtered_recordings, lambda rec: rec["en"], weight_key)
+    return sorted(filtered_recordings, key=lambda rec: -weight_key(rec))
+
+
+def collect_xeno_recordings(config, progress_callback=None):
+    """
+    Query Xeno-Canto and select the recordings that would be downloaded,
+    WITHOUT downloading anything.
+
+    Args:
+        config (dict): Configuration dictionary
+        progress_callback (callable, optional): Function to call with progress updates.
+            Used by the download path for the metadata-fetch phase (0.0-0.1).
+
+    Returns:
+        list: Xeno-Canto API recording dicts, at most max_per_species per species, best
+            quality first within each species and ordered according to config["schedule"]
+            (coverage-first by default). Recordings without a file URL or English name
+            are dropped.
+
+    Raises:
+        ValueError: If required search parameters or the API key are missing.
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    targets = get_target_species(config)
+
+    # Ensure at least one search parameter is specified
+    if not config["xeno"]["country"] and not config["xeno"]["location"] and not targets:
+        raise ValueError("Either country, location or a species list must be specified for Xeno-Canto downloads.")
+
+    if not config["xeno"]["api_key"]:
+        raise ValueError("Xeno-Canto API key is required.")
+
+    metadata_progress = lambda x: progress_callback(x * 0.1)
+
+    if targets:
+        all_recordings = _collect_xeno_targeted(config, targets, metadata_progress)
+    elif config["xeno"].get("tiered", False):
+        all_recordings = _collect_xeno_tiered(config, metadata_progress)
+    else:
+        all_recordings = fetch_xeno_recordings(build_xeno_query(config), config["xeno"]["api_key"],
+                                               metadata_progress)
+        if not all_recordings:
+            logger.warning("No recordings found on Xeno-Canto")
+
+    return select_xeno_recordings(all_recordings, config)
+
+
+def xeno_download_args(rec, download_dir_xc):
+    """Build the [save_dir, file_name, download_url] entry for a Xeno-Canto recording"""
+    return [Path(download_dir_xc / sanitize_filename(rec["en"])),
+            f"({rec['q']}) {rec['en']}; {rec['loc']}; {rec['rec']}; XC{rec['id']}.mp3",
+            rec["file"]]
+
+
+def collect_xeno_downloads(config, progress_callback=None):
+    """
+    Query Xeno-Canto and build the list of recordings that would be downloaded,
+    WITHOUT downloading anything.
+
+    Args:
+        config (dict): Configuration dictionary
+        progress_callback (callable, optional): Function to call with progress updates.
+            Used by the download path for the metadata-fetch phase (0.0-0.1).
+
+    Returns:
+        tuple: (download_args_list, species_count) where download_args_list is a list of
+            [save_dir, file_name, download_url] entries and species_count is the number of
+            distinct species with at least one recording to download.
+
+    Raises:
+        ValueError: If required search parameters or the API key are missing.
+    """
+    download_dir_xc = Path(config["download_dir"]).expanduser() / "XC"
+    recordings = collect_xeno_recordings(config, progress_callback)
+
+    download_args_list = [xeno_download_args(rec, download_dir_xc) for rec in recordings]
 
     # Count distinct species that actually contribute at least one downloadable recording
-    species_count = len({rec["en"] for rec in filtered_recordings if rec["file"] and rec["en"]})
+    species_count = len({rec["en"] for rec in recordings})
 
     return download_args_list, species_count
 
@@ -125,11 +364,58 @@ def preview_xeno_download(config):
     Compute how many species and recordings would be downloaded from Xeno-Canto,
     without downloading any files.
 
+    With sizes measured (config["sizes"]), the total size of the files is added as
+    "bytes" (files whose size is unknown count as 0).
+
     Returns:
-        dict: {"species": int, "calls": int, "exact": True}
+        dict: {"species": int, "calls": int, "exact": True[, "bytes": int]}
     """
     download_args_list, species_count = collect_xeno_downloads(config)
-    return {"species": species_count, "calls": len(download_args_list), "exact": True}
+    preview = {"species": species_count, "calls": len(download_args_list), "exact": True}
+
+    measure, head_workers, _ = get_size_settings(config)
+    if measure:
+        sizes = fetch_sizes([args[2] for args in download_args_list], head_workers)
+        preview["bytes"] = sum(size or 0 for size in sizes.values())
+    return preview
+
+
+def estimate_xeno_download(config):
+    """
+    Estimate the Xeno-Canto preview from the first page of results only (one request).
+
+    Page 1 of a search already carries numRecordings and numSpecies for the whole
+    search, so the estimate is numSpecies species and at most
+    min(numRecordings, numSpecies x max_per_species) recordings. It can be high
+    when some species have fewer than max_per_species recordings, or when
+    recordings lack a file or English name. With a species list no request is
+    made: every target counts as one species with max_per_species recordings.
+    preview_xeno_download gives the exact numbers.
+
+    Returns:
+        dict: {"species": int, "calls": int, "recordings_found": int or None, "exact": False}
+
+    Raises:
+        ValueError: If required search parameters or the API key are missing.
+    """
+    targets = get_target_species(config)
+    max_per_species = config["xeno"]["max_per_species"]
+
+    if not config["xeno"]["country"] and not config["xeno"]["location"] and not targets:
+        raise ValueError("Either country, location or a species list must be specified for Xeno-Canto downloads.")
+
+    if not config["xeno"]["api_key"]:
+        raise ValueError("Xeno-Canto API key is required.")
+
+    if targets:
+        return {"species": len(targets), "calls": len(targets) * max_per_species,
+                "recordings_found": None, "exact": False}
+
+    first_page = fetch_xeno_page(build_xeno_query(config), config["xeno"]["api_key"])
+    num_recordings = int(first_page.get("numRecordings", 0) or 0)
+    num_species = int(first_page.get("numSpecies", 0) or 0)
+    calls = min(num_recordings, num_species * max_per_species) if num_species else num_recordings
+    return {"species": num_species, "calls": calls, "recordings_found": num_recordings, "exact": False}
 
 
 def run_xeno_download(config, progress_callback=None):
@@ -138,179 +424,549 @@ def run_xeno_download(config, progress_callback=None):
 
     Args:
         config (dict): Configuration dictionary
-        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0)
+        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0,
+            or events; see birdcall_core.progress)
 
     Returns:
         int: Number of files downloaded
     """
-    # Set up default progress callback if none provided
-    if progress_callback is None:
-        progress_callback = lambda x: None  # No-op function
-
+    progress = ProgressTracker(progress_callback, source="xeno")
     overwrite = config["overwrite"]
+    download_dir_xc = Path(config["download_dir"]).expanduser() / "XC"
+    manifest = Manifest(config["download_dir"])
+    inventory = Inventory(config["download_dir"])
+    metadata_writer = create_metadata_writer(config)
+    shard_writer = create_shard_writer(config, "xeno")
+    storage = None
+    feature_extractor = None
+    limiter = configure_bandwidth(config)
+    limiter.register("xeno")
+    configure_hosts(config)
     download_count = 0
 
+    # Incremental mode: only ask for recordings uploaded since the last successful sync
+    incremental = config.get("incremental", False)
+    sync_key = xeno_target_key(config)
+    sync_started = time.time()
+    last_sync = get_last_sync(config, sync_key) if incremental else None
+    displaced = {}  # Candidate id -> held recording it replaces (incremental mode)
+
     try:
-        download_args_list, _ = collect_xeno_downloads(config, progress_callback)
+        storage = create_storage(config)
+        feature_extractor = acquire_feature_extractor(config)
+        if last_sync:
+            since = xeno_since_date(last_sync)
+            logger.info(f"Incremental Xeno-Canto sync: recordings uploaded since {since}")
+            search_config = {**config, "xeno": {**config["xeno"], "since": since}}
+            recordings = collect_xeno_recordings(search_config, progress.update)
+            with phase("library_scan"):
+                recordings, displaced = merge_xeno_candidates(recordings, storage, download_dir_xc,
+                                                              config["xeno"]["max_per_species"])
+            if shard_writer:
+                displaced = {}  # Merging only sees the per-file layout; shards are never pruned
+        else:
+            recordings = collect_xeno_recordings(config, progress.update)
+        download_args_list = [xeno_download_args(rec, download_dir_xc) for rec in recordings]
+
+        if metadata_writer:
+            # Only recordings that are not held yet; the catalog is append-only
+            keys = [f"XC{rec['id']}" if shard_writer else storage.key_for(args[0] / sanitize_filename(args[1]))
+                    for rec, args in zip(recordings, download_args_list)]
+            held = {key for key in keys if shard_writer.has(key)} if shard_writer else storage.exists_many(keys)
+            for rec, (save_dir, file_name, _), key in zip(recordings, download_args_list, keys):
+                if key not in held:
+                    planned_path = None if shard_writer else save_dir / sanitize_filename(file_name)
+                    metadata_writer.write("planned", xeno_metadata(rec), planned_path)
 
         # Download files with progress updates
         num_downloads = len(download_args_list)
-        logging.info(f"Downloading {num_downloads} Xeno-Canto recordings...")
-        progress_callback(0.1)  # Mark completion of preparation phase
+        logger.info(f"Downloading {num_downloads} Xeno-Canto recordings...")
+        progress.span(0.1, 1.0, num_downloads)  # Preparation phase done; files move the rest
         
-        for i, args in enumerate(download_args_list):
-            progress_percent = 0.1 + ((i / max(1, num_downloads)) * 0.7)
-            progress_callback(progress_percent)
-            
-            req = download_file(*args, overwrite=overwrite)
+        for rec, args in zip(recordings, download_args_list):
+            if shard_writer:
+                key = f"XC{rec['id']}"
+                req = shard_writer.download(key, args[2], xeno_metadata(rec), overwrite=overwrite, source="xeno",
+                                            progress=progress)
+                save_path = shard_writer.path_of(key)
+            else:
+                req = download_file(*args, overwrite=overwrite, manifest=manifest, source="xeno",
+                                    inventory=inventory, storage=storage, progress=progress)
+                save_path = args[0] / sanitize_filename(args[1])
+                if feature_extractor:
+                    feature_extractor.submit(save_path)
+                # Drop the recording this one replaces, once it is safely held
+                if rec["id"] in displaced and storage.exists(storage.key_for(save_path)):
+                    remove_held_recording(storage, displaced[rec["id"]], manifest, inventory)
             if req:
                 download_count += 1
+                if metadata_writer:
+                    metadata_writer.write("downloaded", xeno_metadata(rec), save_path)
                 time.sleep(0.5)  # Rate limiting but faster than before
         
-        logging.info(f"Completed Xeno-Canto downloads: {download_count} files")
-        progress_callback(1.0)
+        logger.info(f"Completed Xeno-Canto downloads: {download_count} files")
+        if incremental:
+            # Only move the sync point forward once every candidate is on disk, so
+            # failed downloads are retried by the next sync
+            if shard_writer:
+                complete = all(shard_writer.has(f"XC{rec['id']}") for rec in recordings)
+            else:
+                keys = [storage.key_for(args[0] / sanitize_filename(args[1])) for args in download_args_list]
+                complete = len(storage.exists_many(keys)) == len(set(keys))
+            if complete:
+                record_sync(config, sync_key, sync_started)
+            else:
+                logger.warning("Some Xeno-Canto downloads failed; keeping the previous sync point")
+        progress.close()
         return download_count
         
     except Exception as e:
-        logging.error(f"Error in Xeno-Canto download: {str(e)}")
-        progress_callback(1.0)
+        logger.error(f"Error in Xeno-Canto download: {str(e)}")
+        progress.close(error=str(e))
         return download_count
 
+    finally:
+        limiter.unregister("xeno")
+        inventory.close()
+        if storage:
+            storage.close()
+        if feature_extractor:
+            feature_extractor.release()
+        if shard_writer:
+            shard_writer.close()
+        if metadata_writer:
+            metadata_writer.close()
+
+ML_DOWNLOAD_URL = "https://cdn.download.ams.birds.cornell.edu/api/v2/asset/{asset}/mp3"
+
+
+def fetch_ebird_species_codes(config):
+    """
+    Get the eBird species codes for the configured region.
+
+    Raises:
+        ValueError: If the API key or region code is missing.
+        RuntimeError: If the species list cannot be retrieved.
+    """
+    api_key = config["ebird"]["api_key"]
+    region_code = config["ebird"]["region_code"]
+
+    if not api_key:
+        raise ValueError("eBird API key is required for Macaulay Library downloads.")
+    if not region_code:
+        raise ValueError("eBird region code is required for Macaulay Library downloads.")
+
+    logger.info(f"Fetching species list for region {region_code}...")
+    base_url_sp_list = f"https://api.ebird.org/v2/product/spplist/{region_code}"
+    with phase("ebird_api"):
+        response_sp_list = get_scheduler().get(f"{base_url_sp_list}?key={api_key}")
+
+    try:
+        ebird_taxon_codes = response_sp_list.json()
+    except json.JSONDecodeError:
+        raise RuntimeError("Failed to get species list. Check your API key and region code.")
+
+    if not isinstance(ebird_taxon_codes, list):
+        raise RuntimeError("Failed to get species list. Check your API key and region code.")
+
+    return filter_ebird_species(ebird_taxon_codes, config)
+
+
+@functools.lru_cache(maxsize=4)
+def _fetch_ebird_taxonomy_records(api_key):
+    """Fetch the eBird taxonomy once per process as (species_code, common_name, scientific_name) tuples"""
+    taxonomy_url = f"https://api.ebird.org/v2/ref/taxonomy/ebird?key={api_key}&fmt=json"
+    with phase("ebird_api"):
+        response_taxonomy = get_scheduler().get(taxonomy_url)
+    return tuple((x["speciesCode"], x["comName"], x.get("sciName")) for x in response_taxonomy.json())
+
+
+def fetch_ebird_taxonomy(config):
+    """Get a mapping of eBird species code to common name"""
+    return {code: common for code, common, _ in _fetch_ebird_taxonomy_records(config["ebird"]["api_key"])}
+
+
+def filter_ebird_species(ebird_taxon_codes, config):
+    """
+    Keep only the species codes in config["species"] (all of them when no species
+    list is configured). Makes no catalog requests.
+    """
+    targets = get_target_species(config)
+    if not targets:
+        return ebird_taxon_codes
+
+    taxonomy = _fetch_ebird_taxonomy_records(config["ebird"]["api_key"])
+    resolved = resolve_targets(targets, taxonomy)
+    names = target_names(resolved)
+    by_code = {code: (common, scientific) for code, common, scientific in taxonomy}
+
+    filtered = []
+    for code in ebird_taxon_codes:
+        common, scientific = by_code.get(code, (None, None))
+        if names & {name.lower() for name in (code, common, scientific) if name}:
+            filtered.append(code)
+
+    for entry in resolved:
+        if not entry["code"]:
+            logger.warning(f"Unknown eBird species '{entry['target']}'")
+        elif entry["code"] not in filtered:
+            logger.info(f"Target species '{entry['target']}' is not on the {config['ebird']['region_code']} list")
+    logger.info(f"Species filter: {len(filtered)} of {len(ebird_taxon_codes)} regional species targeted")
+    return filtered
+
+
+def parse_catalog_page(html):
+    """
+    Extract recordings from a Macaulay Library catalog results page.
+
+    Returns:
+        list: (asset_id, observer, location) tuples in page order; observer and
+            location are None when missing from the card.
+    """
+    from bs4 import BeautifulSoup
+
+    bs = BeautifulSoup(html, features="html.parser")
+    assets = []
+    for entry in bs.find_all("li", class_="ResultsGrid-card"):
+        user_date_loc = entry.find("div", class_="userDateLoc")
+        links = user_date_loc.find_all("a") if user_date_loc else []
+        spans = user_date_loc.find_all("span") if user_date_loc else []
+        assets.append((
+            entry.find('div', attrs={'data-asset-id': True})['data-asset-id'],
+            links[0].text if links else None,
+            spans[-1].text if spans else None
+        ))
+    return assets
+
+
+class CatalogParser:
+    """
+    Parses Macaulay Library catalog pages, either in the calling thread or, when
+    processes > 0, in a process pool so that BeautifulSoup work is not limited by
+    the GIL. Worker processes return only compact (asset_id, observer, location)
+    tuples. Safe to share between threads.
+    """
+
+    def __init__(self, processes=0):
+        self._executor = None
+        if processes:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Spawn rather than fork: the pool is started while download and catalog
+            # threads hold locks, which a forked child would inherit
+            self._executor = ProcessPoolExecutor(max_workers=processes,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+
+    def parse(self, html):
+        if self._executor is None:
+            return parse_catalog_page(html)
+        return self._executor.submit(parse_catalog_page, html).result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def map_ebird_species(ebird_taxon_codes, config, parser):
+    """
+    Select assets for many species, fetching catalog pages on
+    config["ebird"]["catalog_workers"] threads.
+
+    Returns:
+        iterator: select_ebird_assets results in the order of ebird_taxon_codes. Catalog
+            fetches run at most two species per worker ahead of the consumer.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, config["ebird"].get("catalog_workers", 1))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    codes = iter(ebird_taxon_codes)
+    futures = deque()
+
+    def top_up():
+        while len(futures) < 2 * workers:
+            code = next(codes, None)
+            if code is None:
+                return
+            futures.append(executor.submit(select_ebird_assets, code, config, parser))
+
+    try:
+        top_up()
+        while futures:
+            result = futures.popleft().result()
+            top_up()
+            yield result
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def select_ebird_assets(ebird_taxon_code, config, parser=None):
+    """
+    Scrape the Macaulay Library catalog for the best-rated recordings of one species,
+    falling back to the backup regions when the primary region has too few.
+
+    Args:
+        ebird_taxon_code (str): eBird species code
+        config (dict): Configuration dictionary
+        parser (CatalogParser, optional): Where to parse catalog pages (defaults to inline)
+
+    Returns:
+        list: Up to max_per_species (asset_id, observer, location, region) tuples, where
+            region is the region code the asset was found under (None for worldwide).
+    """
+    region_code = config["ebird"]["region_code"]
+    backup_regions = config["ebird"]["backup_region_codes"]
+    max_per_species = config["ebird"]["max_per_species"]
+
+    selected = []
+    selected_ids = set()
+    backup_regions_iter = iter(backup_regions + [None])
+    region = region_code
+
+    query = f"taxonCode={ebird_taxon_code}&mediaType=audio&sort=rating_rank_desc&view=grid"
+
+    # Search for recordings, using backup regions if needed
+    while len(selected) < max_per_species:
+        query_region = f"&regionCode={region}" if region else ""
+        with phase("catalog_fetch"):
+            response = get_scheduler().get(f"https://media.ebird.org/catalog?{query}{query_region}")
+        with phase("catalog_parse"):
+            assets = parser.parse(response.text) if parser else parse_catalog_page(response.text)
+
+        for asset, observer, location in assets:
+            if asset in selected_ids:
+                continue
+            selected.append((asset, observer, location, region))
+            selected_ids.add(asset)
+            if len(selected) >= max_per_species:
+                break
+
+        # Move to next region if needed
+        try:
+            region = next(backup_regions_iter)
+        except StopIteration:
+            break
+
+    return selected
+
+
+def _held_ml_files(storage, download_dir_ml, species):
+    with phase("library_scan"):
+        return count_held_files(storage, download_dir_ml / sanitize_filename(species))
+
+
+def ebird_download_args(species, asset, observer, location, download_dir_ml):
+    """Build the [save_dir, file_name, download_url] entry for a Macaulay Library asset"""
+    return [Path(download_dir_ml / sanitize_filename(species)),
+            f"{species}; {location if location else ''}; {observer if observer else ''}; ML{asset}.mp3",
+            ML_DOWNLOAD_URL.format(asset=asset)]
+
+
+def collect_ebird_assets(config, progress_callback=None):
+    """
+    Scrape the Macaulay Library catalog for every species in the region and select
+    the recordings that would be downloaded, WITHOUT downloading anything.
+
+    Returns:
+        list: Dicts with species, species_code, asset, observer, location and region keys,
+            ordered according to config["schedule"] (coverage-first by default).
+
+    Raises:
+        ValueError: If the API key or region code is missing.
+        RuntimeError: If the species list cannot be retrieved.
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    ebird_taxon_codes = fetch_ebird_species_codes(config)
+    taxonomy = fetch_ebird_taxonomy(config)
+    total_species = len(ebird_taxon_codes)
+
+    schedule_order, weights = get_schedule_settings(config)
+    ebird_taxon_codes = order_by_weight(
+        ebird_taxon_codes, lambda code: species_weight(weights, taxonomy.get(code), code))
+
+    # Skip species not found in taxonomy
+    ebird_taxon_codes = [code for code in ebird_taxon_codes if code in taxonomy]
+
+    selected = []
+    parser = CatalogParser(config["ebird"].get("parse_processes", 0))
+    try:
+        selections = map_ebird_species(ebird_taxon_codes, config, parser)
+        for i, (ebird_taxon_code, assets) in enumerate(zip(ebird_taxon_codes, selections)):
+            progress_callback(i / max(1, total_species))
+            species = taxonomy[ebird_taxon_code]
+            logger.info(f"Scraped catalog {i+1}/{len(ebird_taxon_codes)}: {species}")
+            for asset, observer, location, region in assets:
+                selected.append({
+                    "species": species,
+                    "species_code": ebird_taxon_code,
+                    "asset": asset,
+                    "observer": observer,
+                    "location": location,
+                    "region": region
+                })
+    finally:
+        parser.close()
+
+    progress_callback(1.0)
+    if schedule_order == "coverage":
+        return coverage_order(selected, lambda item: item["species_code"],
+                              lambda item: species_weight(weights, item["species"], item["species_code"]))
+    return selected
+
+
 def run_ebird_download(config, progress_callback=None):
     """
     Download recordings from eBird/Macaulay Library.
     
     Args:
         config (dict): Configuration dictionary
-        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0)
+        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0,
+            or events; see birdcall_core.progress)
     
     Returns:
         int: Number of files downloaded
     """
-    # Set up default progress callback if none provided
-    if progress_callback is None:
-        progress_callback = lambda x: None  # No-op function
-    
+    progress = ProgressTracker(progress_callback, source="ebird")
     download_dir = Path(config["download_dir"]).expanduser()
     download_dir_ml = download_dir / "ML"
     overwrite = config["overwrite"]
+    manifest = Manifest(download_dir)
+    inventory = Inventory(download_dir)
+    metadata_writer = create_metadata_writer(config)
+    shard_writer = create_shard_writer(config, "ebird")
+    storage = None
+    feature_extractor = None
+    limiter = configure_bandwidth(config)
+    limiter.register("ebird")
+    configure_hosts(config)
     download_count = 0
+    incremental = config.get("incremental", False)
+    max_per_species = config["ebird"]["max_per_species"]
+    checkpoint = SpeciesCheckpoint(config)
+    parser = None
+    selections = None
     
     try:
-        # Extract eBird settings
-        api_key = config["ebird"]["api_key"]
-        region_code = config["ebird"]["region_code"]
-        backup_regions = config["ebird"]["backup_region_codes"]
-        max_per_species = config["ebird"]["max_per_species"]
-        
-        if not api_key:
-            logging.error("eBird API key is required for Macaulay Library downloads.")
-            progress_callback(1.0)
-            return 0
-            
-        if not region_code:
-            logging.error("eBird region code is required for Macaulay Library downloads.")
-            progress_callback(1.0)
-            return 0
-        
-        # Get species list for the region
-        logging.info(f"Fetching species list for region {region_code}...")
-        base_url_sp_list = f"https://api.ebird.org/v2/product/spplist/{region_code}"
-        response_sp_list = requests.get(f"{base_url_sp_list}?key={api_key}", timeout=30)
-        
+        storage = create_storage(config)
+        feature_extractor = acquire_feature_extractor(config)
         try:
-            ebird_taxon_codes = response_sp_list.json()
-        except json.JSONDecodeError:
-            error_msg = f"Failed to get species list. Check your API key and region code."
-            logging.error(error_msg)
-            progress_callback(1.0)
+            ebird_taxon_codes = fetch_ebird_species_codes(config)
+        except (ValueError, RuntimeError) as e:
+            logger.error(str(e))
+            progress.close(error=str(e))
             return 0
         
         # Get taxonomy information
-        taxonomy_url = f"https://api.ebird.org/v2/ref/taxonomy/ebird?key={api_key}&fmt=json"
-        response_taxonomy = requests.get(taxonomy_url, timeout=30)
-        taxonomy = {x["speciesCode"]: x["comName"] for x in response_taxonomy.json()}
+        taxonomy = fetch_ebird_taxonomy(config)
+
+        # Scrape and download higher-priority species first. Catalog results are
+        # downloaded as each species is scraped; use plan/apply for full
+        # round-robin ordering across species.
+        _, weights = get_schedule_settings(config)
+        ebird_taxon_codes = order_by_weight(
+            ebird_taxon_codes, lambda code: species_weight(weights, taxonomy.get(code), code))
         
         # Prepare for download
         total_species = len(ebird_taxon_codes)
         
-        progress_callback(0.0)
+        progress.update(0.0)
         
-        # Process each species
+        # Work out which species need a catalog request
+        species_todo = []
         for i, ebird_taxon_code in enumerate(ebird_taxon_codes):
-            progress_percent = i / total_species
-            progress_callback(progress_percent)
-            
-            downloaded_assets = []
-            backup_regions_iter = iter(backup_regions + [None])
-            
             try:
                 species = taxonomy[ebird_taxon_code]
             except KeyError:
                 # Skip if species not found in taxonomy
                 continue
+
+            # Species finished by an interrupted run with the same settings need no catalog request
+            if checkpoint.is_done(ebird_taxon_code):
+                logger.debug(f"Skipping {species}: completed before the last run was interrupted")
+                continue
+
+            # Incremental mode: species that already have enough recordings need no catalog request
+            if incremental and _held_ml_files(storage, download_dir_ml, species) >= max_per_species:
+                logger.debug(f"Skipping {species}: already holds {max_per_species} recordings")
+                continue
+
+            species_todo.append((i, ebird_taxon_code, species))
+
+        if checkpoint.completed:
+            logger.info(f"Resuming eBird download: {len(checkpoint.completed)} species already completed")
+
+        # Process each species; catalog pages are fetched ahead on worker threads
+        parser = CatalogParser(config["ebird"].get("parse_processes", 0))
+        selections = map_ebird_species([code for _, code, _ in species_todo], config, parser)
+        for (i, ebird_taxon_code, species), assets in zip(species_todo, selections):
+            # The species' recordings move the progress from its position to the next one
+            progress.span(i / total_species, (i + 1) / total_species, len(assets))
                 
-            # Sanitize species name for directory path
-            sanitized_species = sanitize_filename(species)
-            logging.info(f"Processing {i+1}/{total_species}: {species}")
-            
-            query = f"taxonCode={ebird_taxon_code}&mediaType=audio&sort=rating_rank_desc&view=grid"
-            query_region = f"&regionCode={region_code}"
+            logger.info(f"Processing {i+1}/{total_species}: {species}")
             
-            # Search for recordings, using backup regions if needed
-            while len(downloaded_assets) < max_per_species:
-                response = requests.get(f"https://media.ebird.org/catalog?{query}{query_region}", timeout=30)
-                bs = BeautifulSoup(response.text, features="html.parser")
-                entries = bs.find_all("li", class_="ResultsGrid-card")
-                
-                # If no entries found, try next region
-                if not entries:
-                    try:
-                        next_region = next(backup_regions_iter)
-                        query_region = f"&regionCode={next_region}" if next_region else ""
-                        continue
-                    except StopIteration:
-                        break
-                
-                assets = [
-                    [entry.find('div', attrs={'data-asset-id': True})['data-asset-id'],
-                    entry.find("div", class_="userDateLoc").find_all("a")[0].text if entry.find("div", class_="userDateLoc").find_all("a") else None,
-                    entry.find("div", class_="userDateLoc").find_all("span")[-1].text if entry.find("div", class_="userDateLoc").find_all("span") else None]
-                    for entry in entries
-                ]
+            # Download each selected asset
+            species_complete = True
+            for asset, observer, location, region in assets:
+                args = ebird_download_args(species, asset, observer, location, download_dir_ml)
+                save_path = None if shard_writer else args[0] / sanitize_filename(args[1])
+                asset_metadata = ebird_metadata(species, ebird_taxon_code, asset, observer, location,
+                                                args[2], region)
+                if metadata_writer and not (shard_writer.has(f"ML{asset}") if shard_writer
+                                            else storage.exists(storage.key_for(save_path))):
+                    metadata_writer.write("planned", asset_metadata, save_path)
                 
-                # Download each asset
-                for asset, observer, location in assets:
-                    if asset in downloaded_assets:
-                        continue
-                    
-                    download_url = f"https://cdn.download.ams.birds.cornell.edu/api/v2/asset/{asset}/mp3"
-                    filename = f"{species}; {location if location else ''}; {observer if observer else ''}; ML{asset}.mp3"
-                    
-                    req = download_file(download_dir_ml / sanitized_species, filename, download_url, overwrite=overwrite)
-                    if req:
-                        download_count += 1
-                    downloaded_assets.append(asset)
-                    
-                    if len(downloaded_assets) >= max_per_species:
-                        break
-                
-                # Move to next region if needed
-                try:
-                    next_region = next(backup_regions_iter)
-                    query_region = f"&regionCode={next_region}" if next_region else ""
-                except StopIteration:
-                    break
+                if shard_writer:
+                    req = shard_writer.download(f"ML{asset}", args[2], asset_metadata, overwrite=overwrite,
+                                                source="ebird", progress=progress)
+                    save_path = shard_writer.path_of(f"ML{asset}")
+                else:
+                    req = download_file(*args, overwrite=overwrite, manifest=manifest, source="ebird",
+                                        inventory=inventory, storage=storage, progress=progress)
+                    if feature_extractor:
+                        feature_extractor.submit(save_path)
+                if req:
+                    download_count += 1
+                    if metadata_writer:
+                        metadata_writer.write("downloaded", asset_metadata, save_path)
+                elif not (shard_writer.has(f"ML{asset}") if shard_writer
+                          else storage.exists(storage.key_for(save_path))):
+                    species_complete = False  # Failed rather than skipped as already held
+
+            if species_complete:
+                checkpoint.mark_done(ebird_taxon_code)
         
-        logging.info(f"Completed eBird/ML downloads: {download_count} files")
-        progress_callback(1.0)
+        logger.info(f"Completed eBird/ML downloads: {download_count} files")
+        checkpoint.clear()
+        progress.close()
         return download_count
         
     except Exception as e:
-        logging.error(f"Error in eBird download: {str(e)}")
-        progress_callback(1.0)
+        logger.error(f"Error in eBird download: {str(e)}")
+        progress.close(error=str(e))
         return download_count
 
+    finally:
+        if selections is not None:
+            selections.close()
+        if parser:
+            parser.close()
+        limiter.unregister("ebird")
+        inventory.close()
+        if storage:
+            storage.close()
+        if feature_extractor:
+            feature_extractor.release()
+        if shard_writer:
+            shard_writer.close()
+        if metadata_writer:
+            metadata_writer.close()
+
 
 def preview_ebird_download(config):
     """
@@ -330,26 +986,6 @@ def preview_ebird_download(config):
         ValueError: If the API key or region code is missing.
         RuntimeError: If the species list cannot be retrieved.
     """
-    api_key = config["ebird"]["api_key"]
-    region_code = config["ebird"]["region_code"]
     max_per_species = config["ebird"]["max_per_species"]
-
-    if not api_key:
-        raise ValueError("eBird API key is required for Macaulay Library downloads.")
-    if not region_code:
-        raise ValueError("eBird region code is required for Macaulay Library downloads.")
-
-    logging.info(f"Fetching species list for region {region_code} (preview)...")
-    base_url_sp_list = f"https://api.ebird.org/v2/product/spplist/{region_code}"
-    response_sp_list = requests.get(f"{base_url_sp_list}?key={api_key}", timeout=30)
-
-    try:
-        ebird_taxon_codes = response_sp_list.json()
-    except json.JSONDecodeError:
-        raise RuntimeError("Failed to get species list. Check your API key and region code.")
-
-    if not isinstance(ebird_taxon_codes, list):
-        raise RuntimeError("Failed to get species list. Check your API key and region code.")
-
-    species_count = len(ebird_taxon_codes)
+    species_count = len(fetch_ebird_species_codes(config))
     return {"species": species_count, "max_calls": species_count * max_per_species, "exact": False}
@@ -0,0 +1,484 @@
+"""
+Log-mel spectrogram feature extraction for bird call downloader.
+
+With config["features"]["enabled"] set, every recording is turned into a
+log-mel spectrogram while the downloads are still running: the download
+threads hand each file to a process-wide FeatureExtractor, which groups files
+into batches and sends each batch to a process pool. A batch is decoded to
+mono float32 by a pluggable decoder, framed, and run through one vectorised
+NumPy STFT and mel projection for all of its clips together.
+
+Each batch is written to one memory-mapped array, download_dir/features/
+mel-000000.npy, mel-000001.npy, ..., of shape (frames, n_mels), with the
+frames of its clips one after another. features/index.jsonl has one line per
+recording with the array file, first frame and frame count (see
+read_features), plus the source file's size and mtime and a fingerprint of
+the feature settings. A file whose entry still matches is skipped, so
+re-running only processes new, changed or re-configured files. The whole
+library can be (re)processed with python main.py features.
+
+    "features": {
+        "enabled": false,
+        "decoder": "ffmpeg",
+        "sample_rate": 22050,
+        "n_fft": 1024,
+        "hop_length": 512,
+        "n_mels": 64,
+        "fmin": 0,
+        "fmax": null,
+        "max_seconds": null,
+        "dtype": "float16",
+        "batch_size": 32,
+        "processes": 2
+    }
+
+decoder is "ffmpeg" (the ffmpeg binary on PATH), "soundfile" (libsndfile
+1.1+, pip install soundfile) or "module:function" for a custom callable taking
+(path, sample_rate, max_seconds) and returning a 1-D float32 array. Requires
+NumPy (pip install numpy).
+"""
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from .state import config_fingerprint
+
+logger = logging.getLogger(__name__)
+
+FEATURES_DIRNAME = "features"
+FEATURE_INDEX_FILENAME = "index.jsonl"
+AUDIO_SUFFIXES = (".mp3",)
+
+DEFAULT_FEATURE_SETTINGS = {
+    "enabled": False,
+    "decoder": "ffmpeg",
+    "sample_rate": 22050,
+    "n_fft": 1024,
+    "hop_length": 512,
+    "n_mels": 64,
+    "fmin": 0,
+    "fmax": None,
+    "max_seconds": None,
+    "dtype": "float16",
+    "batch_size": 32,
+    "processes": 2
+}
+
+# Settings that change the features (the rest only change how they are computed)
+_FEATURE_PARAMS = ("decoder", "sample_rate", "n_fft", "hop_length", "n_mels", "fmin", "fmax",
+                   "max_seconds", "dtype")
+
+# A partial batch is sent after this many seconds without new files
+BATCH_FLUSH_SECONDS = 2.0
+
+# STFT frames transformed at once (bounds the memory of a batch of long clips)
+FRAME_BLOCK = 8192
+
+_CHUNK_RE = re.compile(r"^mel-(\d+)\.npy$")
+
+
+def get_feature_settings(config):
+    """config["features"] merged over the defaults"""
+    return {**DEFAULT_FEATURE_SETTINGS, **config.get("features", {})}
+
+
+def decode_ffmpeg(path, sample_rate, max_seconds=None):
+    """Decode any audio file to mono float32 at sample_rate with the ffmpeg binary"""
+    import subprocess
+    import numpy as np
+
+    command = ["ffmpeg", "-nostdin", "-v", "error", "-i", str(path)]
+    if max_seconds:
+        command += ["-t", str(max_seconds)]
+    command += ["-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    result = subprocess.run(command, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def decode_soundfile(path, sample_rate, max_seconds=None):
+    """Decode with libsndfile (MP3 needs libsndfile 1.1+), resampling linearly if needed"""
+    import numpy as np
+    import soundfile
+
+    with soundfile.SoundFile(str(path)) as f:
+        frames = int(max_seconds * f.samplerate) if max_seconds else -1
+        audio = f.read(frames, dtype="float32", always_2d=True).mean(axis=1)
+        native_rate = f.samplerate
+    if native_rate != sample_rate and len(audio):
+        positions = np.arange(int(len(audio) * sample_rate / native_rate)) * (native_rate / sample_rate)
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+
+DECODERS = {"ffmpeg": decode_ffmpeg, "soundfile": decode_soundfile}
+
+
+def get_decoder(name):
+    """Look up a decoder by name, or import "module:function" """
+    if name in DECODERS:
+        return DECODERS[name]
+    if ":" not in name:
+        raise ValueError(f"Unknown decoder '{name}'. Choose from: {', '.join(DECODERS)} or module:function")
+    import importlib
+
+    module_name, _, function_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels, fmin=0.0, fmax=None):
+    """Triangular mel filters (HTK mel scale), shape (n_mels, n_fft // 2 + 1)"""
+    import numpy as np
+
+    fmax = fmax or sample_rate / 2
+    mel_min, mel_max = (2595.0 * np.log10(1.0 + f / 700.0) for f in (fmin, fmax))
+    hz = 700.0 * (10.0 ** (np.linspace(mel_min, mel_max, n_mels + 2) / 2595.0) - 1.0)
+    fft_freqs = np.linspace(0, sample_rate / 2, n_fft // 2 + 1)
+
+    lower, center, upper = hz[:-2, None], hz[1:-1, None], hz[2:, None]
+    rising = (fft_freqs - lower) / (center - lower)
+    falling = (upper - fft_freqs) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def log_mel_batch(signals, settings, filterbank=None):
+    """
+    Log-mel spectrograms of many clips, computed together.
+
+    The frames of all clips are stacked and transformed in blocks of up to
+    FRAME_BLOCK frames: one windowed rfft, one power spectrum and one matrix
+    product with the mel filterbank per block, whatever the number of clips.
+
+    Args:
+        signals (list): 1-D float32 arrays at settings["sample_rate"]
+        settings (dict): From get_feature_settings
+        filterbank (ndarray, optional): Precomputed mel_filterbank
+
+    Returns:
+        list: float32 arrays of shape (frames, n_mels), one per signal
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    n_fft, hop = settings["n_fft"], settings["hop_length"]
+    if filterbank is None:
+        filterbank = mel_filterbank(settings["sample_rate"], n_fft, settings["n_mels"],
+                                    settings["fmin"], settings["fmax"])
+    window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+    frame_views = []
+    for signal in signals:
+        if len(signal) < n_fft:
+            signal = np.pad(signal, (0, n_fft - len(signal)))
+        frame_views.append(sliding_window_view(signal, n_fft)[::hop])
+    counts = [len(frames) for frames in frame_views]
+    output = np.empty((sum(counts), filterbank.shape[0]), dtype=np.float32)
+
+    position = 0
+    pieces = []
+    pending = 0
+
+    def transform():
+        nonlocal position, pieces, pending
+        frames = np.concatenate(pieces) * window
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        output[position:position + len(frames)] = np.log(power @ filterbank.T + 1e-10)
+        position += len(frames)
+        pieces, pending = [], 0
+
+    for frames in frame_views:
+        start = 0
+        while start < len(frames):
+            piece = frames[start:start + FRAME_BLOCK - pending]
+            pieces.append(piece)
+            pending += len(piece)
+            start += len(piece)
+            if pending >= FRAME_BLOCK:
+                transform()
+    if pieces:
+        transform()
+
+    return np.split(output, np.cumsum(counts)[:-1])
+
+
+def _extract_batch(items, settings, out_path):
+    """
+    Decode a batch of files and write their features to one .npy array (runs in a pool process).
+
+    Args:
+        items (list): (rel_path, file_path, size, mtime) tuples
+        settings (dict): From get_feature_settings
+        out_path (str): Array file to create
+
+    Returns:
+        tuple: (index entries, [(rel_path, error), ...])
+    """
+    import numpy as np
+
+    decoder = get_decoder(settings["decoder"])
+    decoded, failures = [], []
+    for item in items:
+        try:
+            signal = decoder(item[1], settings["sample_rate"], settings["max_seconds"])
+            if settings["max_seconds"]:
+                signal = signal[:int(settings["max_seconds"] * settings["sample_rate"])]
+            if not len(signal):
+                raise ValueError("no audio decoded")
+            decoded.append((item, signal))
+        except Exception as e:
+            failures.append((item[0], str(e)))
+
+    if not decoded:
+        return [], failures
+
+    features = log_mel_batch([signal for _, signal in decoded], settings)
+    total = sum(len(clip) for clip in features)
+    array = np.lib.format.open_memmap(out_path, mode="w+", dtype=settings["dtype"],
+                                      shape=(total, settings["n_mels"]))
+    entries = []
+    start = 0
+    for ((rel_path, _, size, mtime), _), clip in zip(decoded, features):
+        array[start:start + len(clip)] = clip
+        entries.append({"path": rel_path, "file": os.path.basename(out_path), "start": start,
+                        "frames": len(clip), "size": size, "mtime": mtime})
+        start += len(clip)
+    array.flush()
+    del array
+    return entries, failures
+
+
+def load_feature_index(download_dir):
+    """
+    Read the feature index.
+
+    Returns:
+        dict: Relative path -> latest entry {"path", "file", "start", "frames", "size", "mtime", "params"}
+    """
+    entries = {}
+    path = Path(download_dir).expanduser() / FEATURES_DIRNAME / FEATURE_INDEX_FILENAME
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial line from an interrupted run
+                entries[entry["path"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_features(download_dir, entry):
+    """The (frames, n_mels) features of an index entry, memory-mapped from its array file"""
+    import numpy as np
+
+    array = np.load(Path(download_dir).expanduser() / FEATURES_DIRNAME / entry["file"], mmap_mode="r")
+    return array[entry["start"]:entry["start"] + entry["frames"]]
+
+
+class FeatureExtractor:
+    """Batches submitted files and extracts their features on a process pool"""
+
+    def __init__(self, config):
+        self.settings = get_feature_settings(config)
+        self.root = Path(config["download_dir"]).expanduser()
+        self.dir = self.root / FEATURES_DIRNAME
+        self.index_path = self.dir / FEATURE_INDEX_FILENAME
+        self.params = config_fingerprint({key: self.settings[key] for key in _FEATURE_PARAMS})[:16]
+        self.extracted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.closed = False
+        self._users = 0
+        self._lock = threading.Lock()
+        self._index = load_feature_index(self.root)
+        self._queued = set()
+        self._queue = queue.Queue()
+
+        os.makedirs(self.dir, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(_CHUNK_RE.match, os.listdir(self.dir)) if match]
+        self._next_chunk = max(numbers, default=-1) + 1
+
+        get_decoder(self.settings["decoder"])  # Fail early on a bad decoder name
+        processes = self.settings["processes"]
+        self._executor = None
+        self._in_flight = None
+        if processes:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawn rather than fork: the pool can be started from a download thread while
+            # other threads hold locks (logging, limiter, host scheduler, HTTP pools), which
+            # a forked child would inherit. _extract_batch and custom decoders must therefore
+            # be importable at module level.
+            self._executor = ProcessPoolExecutor(max_workers=processes,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            self._in_flight = threading.BoundedSemaphore(processes * 2)
+        self._thread = threading.Thread(target=self._run, name="features", daemon=True)
+        self._thread.start()
+
+    def is_up_to_date(self, rel_path, size, mtime):
+        entry = self._index.get(rel_path)
+        return bool(entry) and entry.get("params") == self.params and \
+            entry.get("size") == size and entry.get("mtime") == mtime
+
+    def submit(self, file_path):
+        """Queue a file for extraction unless its features are up to date (never blocks)"""
+        file_path = Path(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return  # Not downloaded
+        rel_path = Path(os.path.relpath(file_path, self.root)).as_posix()
+        with self._lock:
+            if rel_path in self._queued:
+                return
+            if self.is_up_to_date(rel_path, st.st_size, st.st_mtime):
+                self.skipped += 1
+                return
+            self._queued.add(rel_path)
+        self._queue.put((rel_path, str(file_path), st.st_size, st.st_mtime))
+
+    def pending(self):
+        """Number of submitted files not yet processed"""
+        with self._lock:
+            return len(self._queued)
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get(timeout=BATCH_FLUSH_SECONDS)
+            except queue.Empty:
+                item = False
+            if item:
+                batch.append(item)
+                if len(batch) < self.settings["batch_size"]:
+                    continue
+            # Full batch, no new files for a while, or closing
+            if batch:
+                self._dispatch(batch)
+                batch = []
+            if item is None:
+                break
+
+    def _dispatch(self, batch):
+        out_path = str(self.dir / f"mel-{self._next_chunk:06d}.npy")
+        self._next_chunk += 1
+        if self._executor is None:
+            try:
+                self._record(batch, *_extract_batch(batch, self.settings, out_path))
+            except Exception as e:
+                self._record(batch, [], [(item[0], str(e)) for item in batch])
+            return
+
+        self._in_flight.acquire()
+        future = self._executor.submit(_extract_batch, batch, self.settings, out_path)
+
+        def done(future):
+            try:
+                self._record(batch, *future.result())
+            except Exception as e:
+                self._record(batch, [], [(item[0], str(e)) for item in batch])
+            finally:
+                self._in_flight.release()
+
+        future.add_done_callback(done)
+
+    def _record(self, batch, entries, failures):
+        for rel_path, error in failures:
+            logger.warning(f"Feature extraction failed for {rel_path}: {error}")
+        with self._lock:
+            if entries:
+                with open(self.index_path, "a", encoding="utf-8") as f:
+                    for entry in entries:
+                        entry["params"] = self.params
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        self._index[entry["path"]] = entry
+            self.extracted += len(entries)
+            self.failed += len(failures)
+            self._queued.difference_update(item[0] for item in batch)
+
+    def close(self):
+        """Process everything submitted so far and stop the pool. Returns the counts."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        logger.info(f"Feature extraction: {self.extracted} extracted, {self.skipped} up to date, "
+                    f"{self.failed} failed")
+        return {"extracted": self.extracted, "skipped": self.skipped, "failed": self.failed}
+
+    def release(self):
+        """Stop using a shared extractor from acquire_feature_extractor; the last user closes it"""
+        with _shared_lock:
+            self._users -= 1
+            last = self._users <= 0
+            if last:
+                self.closed = True
+        if last:
+            self.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def acquire_feature_extractor(config):
+    """
+    The process-wide FeatureExtractor that download threads submit files to, created on
+    first use. Call release() on it when done.
+
+    Returns:
+        FeatureExtractor or None: None when extraction is disabled, or when recordings
+            are not stored as local files (sharded output or object storage)
+    """
+    global _shared
+
+    if not get_feature_settings(config)["enabled"]:
+        return None
+    if config.get("shards", {}).get("enabled") or config.get("storage", {}).get("backend", "local") != "local":
+        logger.warning("Feature extraction needs local per-file downloads; skipping it for this run")
+        return None
+
+    with _shared_lock:
+        if _shared is None or _shared.closed:
+            _shared = FeatureExtractor(config)
+        _shared._users += 1
+        return _shared
+
+
+def extract_library_features(config, progress_callback=None):
+    """
+    Extract features for every recording under download_dir/XC and download_dir/ML
+    that is not up to date.
+
+    Returns:
+        dict: {"extracted", "skipped", "failed"}
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    extractor = FeatureExtractor(config)
+    try:
+        for source in ("XC", "ML"):
+            for dir_path, _, file_names in os.walk(extractor.root / source):
+                for file_name in file_names:
+                    if file_name.lower().endswith(AUDIO_SUFFIXES):
+                        extractor.submit(Path(dir_path) / file_name)
+
+        total = extractor.pending()
+        logger.info(f"Extracting features for {total} recordings ({extractor.skipped} up to date)...")
+        while extractor.pending():
+            progress_callback(1 - extractor.pending() / max(1, total))
+            time.sleep(0.5)
+    finally:
+        counts = extractor.close()
+    progress_callback(1.0)
+    return counts
@@ -0,0 +1,320 @@
+"""
+Per-host request scheduling for bird call downloader.
+
+The downloader talks to five upstream services: the Xeno-Canto search API and
+recording files (both on xeno-canto.org), the eBird API (api.ebird.org), the
+Macaulay Library catalog (media.ebird.org) and the Macaulay Library audio CDN
+(cdn.download.ams.birds.cornell.edu). Every request goes through the
+process-wide HostScheduler, which gives each service its own:
+
+- concurrency pool: at most max_concurrency requests in flight, so a slow
+  service only ties up its own slots and never the threads of another stage
+- timeouts: connect_timeout and read_timeout seconds
+- circuit breaker: after failure_threshold consecutive failures (connection
+  errors, timeouts, 5xx and 429 responses) the service is marked down.
+  Requests to it wait instead of piling up more timeouts, and after
+  retry_after_seconds a single probe request is let through. If the probe
+  succeeds the service is back; if not, the wait doubles, up to
+  max_retry_after_seconds. Once a service has been down for
+  max_outage_seconds, requests to it fail straight away with HostUnavailable
+  (still probing on schedule) so the stage can finish with the rest.
+
+Configured from config["hosts"]; per_host entries override the defaults (and
+the built-in per_host entries below) and are matched on host name and,
+optionally, path prefix (the longest match wins). Hosts not listed get a pool
+of their own with the defaults:
+
+    "hosts": {
+        "max_concurrency": 4,
+        "connect_timeout": 10,
+        "read_timeout": 30,
+        "failure_threshold": 5,
+        "retry_after_seconds": 30,
+        "max_retry_after_seconds": 600,
+        "max_outage_seconds": 1800,
+        "per_host": {
+            "xeno-canto.org/api/": {"max_concurrency": 2},
+            "xeno-canto.org": {"max_concurrency": 8},
+            "api.ebird.org": {"max_concurrency": 2},
+            "media.ebird.org": {"max_concurrency": 4},
+            "cdn.download.ams.birds.cornell.edu": {"max_concurrency": 16}
+        }
+    }
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST_SETTINGS = {
+    "max_concurrency": 4,
+    "connect_timeout": 10,
+    "read_timeout": 30,
+    "failure_threshold": 5,
+    "retry_after_seconds": 30,
+    "max_retry_after_seconds": 600,
+    "max_outage_seconds": 1800
+}
+
+DEFAULT_PER_HOST = {
+    "xeno-canto.org/api/": {"max_concurrency": 2},
+    "xeno-canto.org": {"max_concurrency": 8},
+    "api.ebird.org": {"max_concurrency": 2},
+    "media.ebird.org": {"max_concurrency": 4},
+    "cdn.download.ams.birds.cornell.edu": {"max_concurrency": 16}
+}
+
+# HTTP statuses that count as the host failing rather than the request being wrong
+FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+# Largest single sleep while waiting for a host to be probed, so waiting
+# threads notice a successful probe promptly
+MAX_WAIT_SECONDS = 1.0
+
+
+class HostUnavailable(RuntimeError):
+    """A host has been failing for longer than max_outage_seconds"""
+
+
+def is_host_failure(error):
+    """
+    Whether an exception raised while talking to a host counts against it.
+
+    Returns:
+        bool or None: True for connection errors, timeouts and failure statuses,
+            False for other HTTP errors (the host answered), None for exceptions
+            that say nothing about the host
+    """
+    import requests
+
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in FAILURE_STATUSES
+    if isinstance(error, requests.RequestException):
+        return True
+    return None
+
+
+class HostPool:
+    """Concurrency slots, timeouts and circuit breaker of one upstream service"""
+
+    CLOSED, OPEN = "up", "down"
+
+    def __init__(self, name, settings, clock=time.monotonic):
+        self.name = name
+        self.settings = settings
+        self.max_concurrency = max(1, settings["max_concurrency"])
+        self.timeout = (settings["connect_timeout"], settings["read_timeout"])
+        self.failure_threshold = max(1, settings["failure_threshold"])
+        self.retry_after = settings["retry_after_seconds"]
+        self.max_retry_after = max(self.retry_after, settings["max_retry_after_seconds"])
+        self.max_outage = settings["max_outage_seconds"]
+        self._clock = clock
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0           # Consecutive failures
+        self.in_flight = 0
+        self._backoff = self.retry_after
+        self._retry_at = 0.0        # Clock time of the next probe while down
+        self._down_since = None
+        self._probing = False
+
+    def acquire(self):
+        """
+        Wait for a free slot (and, while the host is down, for its next probe).
+
+        Returns:
+            bool: True if this request is the probe of a host that is down
+
+        Raises:
+            HostUnavailable: If the host has been down for longer than max_outage_seconds
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                if self.state == self.CLOSED:
+                    probe = False
+                    break
+                if now >= self._retry_at and not self._probing:
+                    self._probing = probe = True
+                    break
+                if self.max_outage is not None and now - self._down_since >= self.max_outage:
+                    raise HostUnavailable(f"{self.name} has been unavailable for "
+                                          f"{int(now - self._down_since)} seconds")
+                wait = self._retry_at - now if now < self._retry_at else MAX_WAIT_SECONDS
+            time.sleep(min(wait, MAX_WAIT_SECONDS))
+
+        self._slots.acquire()
+        with self._lock:
+            self.in_flight += 1
+        return probe
+
+    def release(self, failure, probe=False):
+        """
+        Give back a slot and record the request's outcome.
+
+        Args:
+            failure (bool or None): Whether the host failed (None when the outcome
+                says nothing about the host)
+            probe (bool): The value acquire returned
+        """
+        with self._lock:
+            self.in_flight -= 1
+            now = self._clock()
+            if probe:
+                self._probing = False
+            if failure:
+                self.failures += 1
+                if probe:
+                    self._backoff = min(self._backoff * 2, self.max_retry_after)
+                    self._retry_at = now + self._backoff
+                    logger.warning(f"{self.name} is still failing; next retry in {self._backoff:.0f} seconds")
+                elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                    self.state = self.OPEN
+                    self._backoff = self.retry_after
+                    self._retry_at = now + self._backoff
+                    self._down_since = now
+                    logger.warning(f"{self.name} failed {self.failures} times in a row; pausing requests "
+                                   f"to it for {self._backoff:.0f} seconds")
+            elif failure is False:
+                if self.state == self.OPEN:
+                    logger.info(f"{self.name} is responding again after "
+                                f"{int(now - self._down_since)} seconds")
+                self.state = self.CLOSED
+                self.failures = 0
+                self._backoff = self.retry_after
+                self._down_since = None
+        self._slots.release()
+
+    def status(self):
+        """Snapshot of the pool for logs and status pages"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "failures": self.failures,
+                "retry_in": max(0.0, self._retry_at - self._clock()) if self.state == self.OPEN else None
+            }
+
+
+class HostScheduler:
+    """Routes each request to the HostPool of its service"""
+
+    def __init__(self, settings=None, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pools = {}
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """
+        Replace the host settings. Pools whose settings are unchanged keep their
+        state, so configuring again between runs does not forget a host that is down.
+        """
+        settings = settings or {}
+        defaults = {key: settings.get(key, value) for key, value in DEFAULT_HOST_SETTINGS.items()}
+        per_host = {**DEFAULT_PER_HOST, **(settings.get("per_host") or {})}
+
+        routes = []
+        for pattern, overrides in per_host.items():
+            host, _, path = pattern.partition("/")
+            routes.append((host.lower(), "/" + path, pattern, {**defaults, **(overrides or {})}))
+        # Longest pattern first, so "xeno-canto.org/api/" is tried before "xeno-canto.org"
+        routes.sort(key=lambda route: len(route[2]), reverse=True)
+
+        with self._lock:
+            self.defaults = defaults
+            self._routes = routes
+            self._pools = {name: pool for name, pool in self._pools.items()
+                           if pool.settings == self._settings_for(name)}
+
+    def _settings_for(self, name):
+        for _, _, pattern, settings in self._routes:
+            if pattern == name:
+                return settings
+        return self.defaults
+
+    def _route(self, url):
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        path = parts.path or "/"
+        for route_host, route_path, pattern, _ in self._routes:
+            if (host == route_host or host.endswith("." + route_host)) and path.startswith(route_path):
+                return pattern
+        return host
+
+    def pool_for(self, url):
+        """The HostPool that requests to url go through"""
+        with self._lock:
+            name = self._route(url)
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = self._pools[name] = HostPool(name, self._settings_for(name), self._clock)
+            return pool
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Hold a slot of url's host for the duration of the block, e.g. while a
+        streamed response is read. Exceptions raised in the block are recorded
+        against the host as is_host_failure classifies them.
+
+        Yields:
+            HostPool: The pool, for its timeout
+        """
+        pool = self.pool_for(url)
+        probe = pool.acquire()
+        try:
+            yield pool
+        except Exception as e:
+            pool.release(is_host_failure(e), probe)
+            raise
+        except BaseException:
+            pool.release(None, probe)
+            raise
+        pool.release(False, probe)
+
+    def get(self, url, **kwargs):
+        """
+        requests.get through url's host pool, with the host's timeouts unless given.
+        A failure status counts against the host but the response is still returned.
+        """
+        import requests
+
+        pool = self.pool_for(url)
+        probe = pool.acquire()
+        try:
+            response = requests.get(url, **{"timeout": pool.timeout, **kwargs})
+        except Exception as e:
+            pool.release(is_host_failure(e), probe)
+            raise
+        except BaseException:
+            pool.release(None, probe)
+            raise
+        pool.release(response.status_code in FAILURE_STATUSES, probe)
+        return response
+
+    def status(self):
+        """Status of every pool used so far, by host"""
+        with self._lock:
+            pools = list(self._pools.values())
+        return {pool.name: pool.status() for pool in pools}
+
+
+_scheduler = HostScheduler()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler"""
+    return _scheduler
+
+
+def configure_hosts(config):
+    """Apply config["hosts"] to the process-wide scheduler"""
+    _scheduler.configure(config.get("hosts"))
+    return _scheduler
@@ -0,0 +1,176 @@
+"""
+Library inventory index for bird call downloader.
+
+A small SQLite database at download_dir/.inventory.sqlite3 holds one row per
+downloaded file (source, species, size, mtime). download_file updates it as each
+file is written, so per-species counts, total bytes and per-source breakdowns
+can be answered without walking the download directory. reconcile() rebuilds
+the index from disk when it may have drifted (files added or deleted by hand,
+or a library downloaded before the index existed).
+
+Only files under the local download_dir are indexed: downloads written to the
+s3 storage backend are not recorded, and reconcile() does not list the bucket.
+"""
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+INVENTORY_FILENAME = ".inventory.sqlite3"
+SOURCE_DIRS = ("XC", "ML")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    species TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_source_species ON files (source, species);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class Inventory:
+    """Thread-safe index of the files in a download directory"""
+
+    def __init__(self, download_dir):
+        self.root = Path(download_dir).expanduser()
+        self.path = self.root / INVENTORY_FILENAME
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def _split(self, file_path):
+        """Return (relative_path, source, species) for a file inside the download directory"""
+        rel_path = Path(os.path.relpath(Path(file_path).expanduser(), self.root)).as_posix()
+        parts = rel_path.split("/")
+        source = parts[0] if len(parts) > 1 else ""
+        species = parts[1] if len(parts) > 2 else ""
+        return rel_path, source, species
+
+    def record(self, file_path, size=None, mtime=None):
+        """Add or update the entry for a file that has just been written"""
+        rel_path, source, species = self._split(file_path)
+        if size is None or mtime is None:
+            st = os.stat(file_path)
+            size, mtime = st.st_size, st.st_mtime
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO files (path, source, species, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                             (rel_path, source, species, size, mtime))
+
+    def remove(self, file_path):
+        """Drop the entry for a file that has been deleted"""
+        rel_path, _, _ = self._split(file_path)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+
+    def summary(self, source=None):
+        """
+        Summarise the library from the index.
+
+        Args:
+            source (str, optional): Restrict to "XC" or "ML"
+
+        Returns:
+            dict: {"total_files", "total_bytes", "total_species", "sources": {source: {...}},
+                "species": [{"source", "species", "files", "bytes"}], "last_reconciled"}
+        """
+        where, params = ("WHERE source = ?", (source,)) if source else ("", ())
+        with self._lock:
+            conn = self._connection()
+            species_rows = conn.execute(
+                f"SELECT source, species, COUNT(*), SUM(size) FROM files {where} "
+                f"GROUP BY source, species ORDER BY source, species", params).fetchall()
+            last_reconciled = conn.execute("SELECT value FROM meta WHERE key = 'last_reconciled'").fetchone()
+
+        sources = {}
+        for row_source, _, files, size in species_rows:
+            entry = sources.setdefault(row_source, {"files": 0, "bytes": 0, "species": 0})
+            entry["files"] += files
+            entry["bytes"] += size or 0
+            entry["species"] += 1
+
+        return {
+            "total_files": sum(s["files"] for s in sources.values()),
+            "total_bytes": sum(s["bytes"] for s in sources.values()),
+            "total_species": len({species for _, species, _, _ in species_rows}),
+            "sources": sources,
+            "species": [
+                {"source": row_source, "species": species, "files": files, "bytes": size or 0}
+                for row_source, species, files, size in species_rows
+            ],
+            "last_reconciled": float(last_reconciled[0]) if last_reconciled else None
+        }
+
+    def reconcile(self):
+        """
+        Rebuild the index from the files on disk.
+
+        Returns:
+            dict: {"added", "removed", "updated", "unchanged"} file counts
+        """
+        on_disk = {}
+        for source in SOURCE_DIRS:
+            source_dir = self.root / source
+            if not source_dir.is_dir():
+                continue
+            with os.scandir(source_dir) as species_it:
+                for species_entry in species_it:
+                    if not species_entry.is_dir(follow_symlinks=False):
+                        continue
+                    with os.scandir(species_entry.path) as file_it:
+                        for entry in file_it:
+                            if not entry.is_file(follow_symlinks=False) or entry.name.endswith(".part"):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                            rel_path = f"{source}/{species_entry.name}/{entry.name}"
+                            on_disk[rel_path] = (source, species_entry.name, st.st_size, st.st_mtime)
+
+        with self._lock:
+            conn = self._connection()
+            indexed = {path: (size, mtime) for path, size, mtime in
+                       conn.execute("SELECT path, size, mtime FROM files")}
+            removed = [path for path in indexed if path not in on_disk]
+            changed = [
+                (path, *values) for path, values in on_disk.items()
+                if indexed.get(path) != (values[2], values[3])
+            ]
+            with conn:
+                conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, source, species, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                    changed)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_reconciled', ?)",
+                             (str(time.time()),))
+
+        added = sum(1 for path, *_ in changed if path not in indexed)
+        return {
+            "added": added,
+            "removed": len(removed),
+            "updated": len(changed) - added,
+            "unchanged": len(on_disk) - len(changed)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,103 @@
+"""
+Download manifest for bird call downloader.
+
+The manifest is an append-only JSON Lines file stored at the root of the
+download directory. Every successfully downloaded file gets one line with its
+path (relative to the download directory), size, SHA-256 hash and source URL,
+plus the server's ETag, Last-Modified and Content-Length when it sent them
+(used to revalidate the file with a conditional request on overwrite runs).
+Later lines for the same path supersede earlier ones; a line with "removed"
+records that the file was deleted on purpose.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+
+class Manifest:
+    """Append-only record of downloaded files, shared by all download threads."""
+
+    def __init__(self, download_dir):
+        self.root = Path(download_dir).expanduser()
+        self.path = self.root / MANIFEST_FILENAME
+        self._lock = threading.Lock()
+        self._entries = None    # Loaded on the first get()
+
+    def relative_path(self, file_path):
+        """Return file_path relative to the download directory, using forward slashes"""
+        return Path(os.path.relpath(Path(file_path).expanduser(), self.root)).as_posix()
+
+    def record(self, file_path, size, sha256, url, validators=None):
+        """
+        Append an entry for a file that has just been written.
+
+        validators (dict, optional): "etag", "last_modified" and "content_length"
+        from the response (see birdcall_core.utils.response_validators)
+        """
+        entry = {
+            "path": self.relative_path(file_path),
+            "size": size,
+            "sha256": sha256,
+            "url": url,
+            "time": int(time.time()),
+            **(validators or {})
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if self._entries is not None:
+                self._entries[entry["path"]] = entry
+        return entry
+
+    def forget(self, file_path):
+        """Append a line recording that file_path was deleted on purpose"""
+        entry = {"path": self.relative_path(file_path), "removed": True, "time": int(time.time())}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if self._entries is not None:
+                self._entries.pop(entry["path"], None)
+
+    def get(self, file_path):
+        """Most recent entry for file_path, or None. The manifest is read once and then kept up to date."""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self.load()
+            return self._entries.get(self.relative_path(file_path))
+
+    def load(self):
+        """
+        Read the manifest.
+
+        Returns:
+            dict: Mapping of relative path to its most recent entry. Malformed
+                lines (e.g. a partial line from an interrupted run) are skipped.
+        """
+        entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry.get("removed"):
+                            entries.pop(entry["path"], None)
+                        else:
+                            entries[entry["path"]] = entry
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error reading manifest {self.path}: {str(e)}")
+        return entries
@@ -0,0 +1,214 @@
+"""
+Per-recording metadata catalog for bird call downloader.
+
+With config["metadata"]["enabled"] set, every planned (not yet held) and
+downloaded recording is streamed as one JSON object per line into an
+append-only metadata.jsonl file at the root of the download directory, so
+training pipelines can filter recordings by species, quality, location,
+recordist, date, etc. without parsing filenames. The JSONL catalog can be
+exported to CSV, or to Parquet when pyarrow is installed.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILENAME = "metadata.jsonl"
+
+# Fixed column order shared by all sources so that exports have a stable schema
+COLUMNS = [
+    "status", "time", "source", "id", "path", "url",
+    "species", "scientific_name", "species_code", "subspecies",
+    "quality", "type", "sex", "stage", "length",
+    "recordist", "location", "country", "lat", "lon", "alt",
+    "date", "recording_time", "uploaded", "license", "also", "remarks",
+    "sample_rate", "region"
+]
+
+_FLOAT_COLUMNS = ("lat", "lon")
+_INT_COLUMNS = ("time",)
+
+# Rows buffered per Parquet row group / CSV flush when exporting
+EXPORT_BATCH_SIZE = 10000
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def xeno_metadata(rec):
+    """Extract catalog fields from a Xeno-Canto API v3 recording dict"""
+    gen_sp = " ".join(part for part in (rec.get("gen"), rec.get("sp")) if part)
+    also = rec.get("also")
+    return {
+        "source": "XC",
+        "id": f"XC{rec.get('id')}",
+        "url": rec.get("file"),
+        "species": rec.get("en"),
+        "scientific_name": gen_sp or None,
+        "subspecies": rec.get("ssp") or None,
+        "quality": rec.get("q") or None,
+        "type": rec.get("type") or None,
+        "sex": rec.get("sex") or None,
+        "stage": rec.get("stage") or None,
+        "length": rec.get("length") or None,
+        "recordist": rec.get("rec") or None,
+        "location": rec.get("loc") or None,
+        "country": rec.get("cnt") or None,
+        "lat": _to_float(rec.get("lat")),
+        "lon": _to_float(rec.get("lon", rec.get("lng"))),
+        "alt": rec.get("alt") or None,
+        "date": rec.get("date") or None,
+        "recording_time": rec.get("time") or None,
+        "uploaded": rec.get("uploaded") or None,
+        "license": rec.get("lic") or None,
+        "also": "; ".join(a for a in also if a) if isinstance(also, list) else also or None,
+        "remarks": rec.get("rmk") or None,
+        "sample_rate": rec.get("smp") or None,
+    }
+
+
+def ebird_metadata(species, species_code, asset, observer, location, url, region=None):
+    """Build catalog fields for a Macaulay Library asset scraped from the catalog"""
+    return {
+        "source": "ML",
+        "id": f"ML{asset}",
+        "url": url,
+        "species": species,
+        "species_code": species_code,
+        "recordist": observer,
+        "location": location,
+        "region": region,
+    }
+
+
+class MetadataWriter:
+    """Thread-safe append-only writer for the metadata catalog"""
+
+    def __init__(self, download_dir, parquet=False, csv_export=False):
+        self.root = Path(download_dir).expanduser()
+        self.path = self.root / METADATA_FILENAME
+        self.parquet = parquet
+        self.csv_export = csv_export
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, status, fields, file_path=None):
+        """
+        Append one record.
+
+        Args:
+            status (str): "planned" or "downloaded"
+            fields (dict): Output of xeno_metadata() or ebird_metadata()
+            file_path (Path, optional): Where the recording is (or will be) saved
+        """
+        record = {column: None for column in COLUMNS}
+        record.update(fields)
+        record["status"] = status
+        record["time"] = int(time.time())
+        if file_path is not None:
+            record["path"] = Path(os.path.relpath(Path(file_path).expanduser(), self.root)).as_posix()
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.root, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """Close the catalog and write any configured exports"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+        if self.csv_export:
+            export_csv(self.path, self.path.with_suffix(".csv"))
+        if self.parquet:
+            export_parquet(self.path, self.path.with_suffix(".parquet"))
+
+
+def iter_metadata(path, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of at most batch_size records from a metadata JSONL file"""
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from an interrupted run
+            batch.append({column: record.get(column) for column in COLUMNS})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def export_csv(jsonl_path, csv_path):
+    """Export the metadata catalog to CSV"""
+    if not os.path.exists(jsonl_path):
+        return False
+    tmp_path = f"{csv_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for batch in iter_metadata(jsonl_path):
+            writer.writerows(batch)
+    os.replace(tmp_path, csv_path)
+    logger.info(f"Exported metadata catalog to {csv_path}")
+    return True
+
+
+def export_parquet(jsonl_path, parquet_path):
+    """Export the metadata catalog to Parquet, one row group per batch. Requires pyarrow."""
+    if not os.path.exists(jsonl_path):
+        return False
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        logger.warning("pyarrow is not installed; skipping Parquet metadata export")
+        return False
+
+    schema = pa.schema([
+        (column, pa.float64() if column in _FLOAT_COLUMNS
+         else pa.int64() if column in _INT_COLUMNS
+         else pa.string())
+        for column in COLUMNS
+    ])
+
+    tmp_path = f"{parquet_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for batch in iter_metadata(jsonl_path):
+            for record in batch:
+                for column in COLUMNS:
+                    value = record[column]
+                    if value is not None and column not in _FLOAT_COLUMNS + _INT_COLUMNS:
+                        record[column] = str(value)
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    os.replace(tmp_path, parquet_path)
+    logger.info(f"Exported metadata catalog to {parquet_path}")
+    return True
+
+
+def create_metadata_writer(config):
+    """Return a MetadataWriter configured from config["metadata"], or None if disabled"""
+    settings = config.get("metadata", {})
+    if not settings.get("enabled", False):
+        return None
+    return MetadataWriter(
+        config["download_dir"],
+        parquet=settings.get("parquet", False),
+        csv_export=settings.get("csv", False)
+    )
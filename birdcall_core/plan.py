@@ -0,0 +1,276 @@
+"""
+Plan/apply workflow for bird call downloader.
+
+A plan is the complete list of recordings a run would download, computed from
+the Xeno-Canto API and the Macaulay Library catalog, and saved as gzipped JSON.
+Applying a plan downloads its files without making any API or catalog
+requests, so a plan can be built once and applied on other machines or re-run
+cheaply after an interruption.
+
+Save directories are stored relative to the download directory, so a plan can
+be applied into a different download_dir than the one it was built for.
+"""
+import gzip
+import json
+import time
+import logging
+from pathlib import Path
+from .bandwidth import configure_bandwidth
+from .inventory import Inventory
+from .features import acquire_feature_extractor
+from .hosts import configure_hosts
+from .manifest import Manifest
+from .progress import ProgressTracker
+from .metadata import create_metadata_writer, xeno_metadata, ebird_metadata
+from .shards import create_shard_writer, load_shard_index
+from .sizes import get_size_settings, fetch_sizes, apply_byte_budget, free_bytes, format_bytes
+from .storage import create_storage
+from .utils import sanitize_filename, download_file
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+PLAN_SOURCES = ("xeno", "ebird")
+
+# Free space left untouched when applying a plan with measured sizes
+DISK_HEADROOM_BYTES = 64 * 1024 * 1024
+
+
+def build_plan(config, sources=PLAN_SOURCES, progress_callback=None):
+    """
+    Build a download plan.
+
+    Args:
+        config (dict): Configuration dictionary
+        sources (iterable): Which of "xeno" and "ebird" to plan
+        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0)
+
+    Returns:
+        dict: {"version", "created", "xeno": [...], "ebird": [...]} where each entry is
+            {"dir", "name", "url", "meta"}. When sizes are measured (config["sizes"]),
+            entries also have "size" and the plan has "bytes", "unknown_sizes", "held",
+            "held_bytes" and, with a byte budget, "dropped".
+    """
+    from .downloader import (
+        collect_xeno_recordings, xeno_download_args,
+        collect_ebird_assets, ebird_download_args
+    )
+
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    configure_hosts(config)
+    sources = list(sources)
+    plan = {"version": PLAN_VERSION, "created": int(time.time()), "xeno": [], "ebird": []}
+    measure, head_workers, max_bytes = get_size_settings(config)
+    # Measuring sizes gets the last fifth of the progress bar
+    search_share = 0.8 if measure else 1.0
+
+    for idx, source in enumerate(sources):
+        # Scale each source's progress into its share of the overall bar
+        source_progress = lambda x, idx=idx: progress_callback((idx + x) / len(sources) * search_share)
+
+        if source == "xeno":
+            recordings = collect_xeno_recordings(config, lambda x: source_progress(x * 10))
+            for rec in recordings:
+                save_dir, file_name, url = xeno_download_args(rec, Path("XC"))
+                plan["xeno"].append({"dir": save_dir.as_posix(), "name": file_name,
+                                     "url": url, "meta": xeno_metadata(rec)})
+            logger.info(f"Planned {len(plan['xeno'])} Xeno-Canto recordings")
+
+        elif source == "ebird":
+            for item in collect_ebird_assets(config, source_progress):
+                save_dir, file_name, url = ebird_download_args(
+                    item["species"], item["asset"], item["observer"], item["location"], Path("ML"))
+                meta = ebird_metadata(item["species"], item["species_code"], item["asset"],
+                                      item["observer"], item["location"], url, item["region"])
+                plan["ebird"].append({"dir": save_dir.as_posix(), "name": file_name,
+                                      "url": url, "meta": meta})
+            logger.info(f"Planned {len(plan['ebird'])} eBird/ML recordings")
+
+        else:
+            raise ValueError(f"Unknown plan source: {source}")
+
+    if measure:
+        # With overwrite every file is downloaded again, so none counts as held
+        storage = None if config["overwrite"] else create_storage(config)
+        try:
+            measure_plan(plan, sources, head_workers, max_bytes,
+                         lambda x: progress_callback(search_share + x * (1 - search_share)),
+                         held_size=held_sizer(config, storage) if storage else None)
+        finally:
+            if storage:
+                storage.close()
+
+    progress_callback(1.0)
+    return plan
+
+
+def held_sizer(config, storage):
+    """
+    Return a function giving the size of a planned entry already held in
+    config["download_dir"] (in the shards, or else in storage), or None.
+    """
+    if config.get("shards", {}).get("enabled", False):
+        index = load_shard_index(config["download_dir"])
+        return lambda entry: index[entry["meta"]["id"]]["size"] if entry["meta"]["id"] in index else None
+
+    download_dir = Path(config["download_dir"]).expanduser()
+    return lambda entry: storage.size(storage.key_for(download_dir / entry["dir"] / sanitize_filename(entry["name"])))
+
+
+def measure_plan(plan, sources, head_workers, max_bytes=None, progress_callback=None, held_size=None):
+    """
+    Add each entry's size (from concurrent HEAD requests) and the plan's total "bytes",
+    then trim the plan to max_bytes if given, recording how many entries were "dropped".
+
+    Entries for which held_size(entry) returns a size are already downloaded: they
+    get that size without a HEAD request, are never dropped, and count towards
+    "held" and "held_bytes" instead of "bytes" and the budget.
+    """
+    held = set()
+    to_measure = []
+    for entry in (entry for source in sources for entry in plan[source]):
+        size = held_size(entry) if held_size else None
+        if size is not None:
+            entry["size"] = size
+            held.add(id(entry))
+        else:
+            to_measure.append(entry)
+
+    logger.info(f"Measuring {len(to_measure)} planned files ({len(held)} already held)...")
+    sizes = fetch_sizes([entry["url"] for entry in to_measure], head_workers, progress_callback)
+    for entry in to_measure:
+        entry["size"] = sizes.get(entry["url"])
+
+    if max_bytes is not None:
+        kept, dropped, kept_bytes = apply_byte_budget(
+            {source: [entry for entry in plan[source] if id(entry) not in held] for source in sources}, max_bytes)
+        kept_ids = {id(entry) for entries in kept.values() for entry in entries}
+        for source in sources:
+            plan[source] = [entry for entry in plan[source] if id(entry) in held or id(entry) in kept_ids]
+        plan["dropped"] = dropped
+        if dropped:
+            logger.warning(f"Byte budget of {format_bytes(max_bytes)} reached: dropped {dropped} "
+                           f"lower-priority recordings, keeping {format_bytes(kept_bytes)}")
+
+    to_download = [entry for source in sources for entry in plan[source] if id(entry) not in held]
+    plan["bytes"] = sum(entry["size"] or 0 for entry in to_download)
+    plan["unknown_sizes"] = sum(1 for entry in to_download if entry["size"] is None)
+    plan["held"] = len(held)
+    plan["held_bytes"] = sum(entry["size"] for source in sources for entry in plan[source] if id(entry) in held)
+
+
+def save_plan(plan, path):
+    """Write a plan as gzipped JSON"""
+    path = Path(path).expanduser()
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, separators=(",", ":"))
+    tmp_path.replace(path)
+    return path
+
+
+def load_plan(path):
+    """
+    Read a plan written by save_plan.
+
+    Raises:
+        ValueError: If the file is not a plan of a supported version.
+    """
+    with gzip.open(Path(path).expanduser(), "rt", encoding="utf-8") as f:
+        plan = json.load(f)
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan file: {path}")
+    return plan
+
+
+def apply_plan(config, plan, source, progress_callback=None):
+    """
+    Download the entries of one source from a plan. Makes no API or catalog requests.
+
+    Args:
+        config (dict): Configuration dictionary (download_dir and overwrite are used)
+        plan (dict): Plan returned by build_plan or load_plan
+        source (str): "xeno" or "ebird"
+        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0,
+            or events; see birdcall_core.progress)
+
+    Returns:
+        int: Number of files downloaded
+    """
+    progress = ProgressTracker(progress_callback, source=source)
+    download_dir = Path(config["download_dir"]).expanduser()
+    overwrite = config["overwrite"]
+    manifest = Manifest(download_dir)
+    inventory = Inventory(download_dir)
+    shard_writer = create_shard_writer(config, source)
+    metadata_writer = create_metadata_writer(config)
+    storage = None
+    feature_extractor = None
+    limiter = configure_bandwidth(config)
+    limiter.register(source)
+    configure_hosts(config)
+    entries = plan.get(source, [])
+    download_count = 0
+
+    try:
+        storage = create_storage(config)
+        feature_extractor = acquire_feature_extractor(config)
+        logger.info(f"Applying plan: {len(entries)} {source} recordings...")
+        progress.span(0.0, 1.0, len(entries), [entry.get("size") for entry in entries])
+        stopped = None
+        for i, entry in enumerate(entries):
+            save_dir = download_dir / entry["dir"]
+
+            # Stop cleanly rather than filling the disk (needs measured sizes, see build_plan)
+            if entry.get("size") and (shard_writer or storage.is_local) and \
+                    entry["size"] + DISK_HEADROOM_BYTES > free_bytes(download_dir):
+                if shard_writer:
+                    held = shard_writer.has(entry["meta"]["id"])
+                else:
+                    held = storage.exists(storage.key_for(save_dir / sanitize_filename(entry["name"])))
+                if overwrite or not held:
+                    stopped = (f"not enough free disk space for {entry['name']} "
+                               f"({format_bytes(entry['size'])}); {len(entries) - i} recordings not downloaded")
+                    logger.error(f"Stopping {source} plan: {stopped}")
+                    break
+
+            if shard_writer:
+                downloaded = shard_writer.download(entry["meta"]["id"], entry["url"], entry["meta"],
+                                                   overwrite=overwrite, source=source, progress=progress)
+                save_path = shard_writer.path_of(entry["meta"]["id"])
+            else:
+                downloaded = download_file(save_dir, entry["name"], entry["url"], overwrite=overwrite,
+                                           manifest=manifest, source=source, inventory=inventory,
+                                           storage=storage, progress=progress)
+                save_path = save_dir / sanitize_filename(entry["name"])
+                if feature_extractor:
+                    feature_extractor.submit(save_path)
+            if downloaded:
+                download_count += 1
+                if metadata_writer:
+                    metadata_writer.write("downloaded", entry["meta"], save_path)
+                if source == "xeno":
+                    time.sleep(0.5)  # Same rate limiting as run_xeno_download
+
+        logger.info(f"Completed {source} plan: {download_count} files")
+        progress.close(error=stopped)
+        return download_count
+
+    except Exception as e:
+        logger.error(f"Error applying {source} plan: {str(e)}")
+        progress.close(error=str(e))
+        return download_count
+
+    finally:
+        limiter.unregister(source)
+        inventory.close()
+        if storage:
+            storage.close()
+        if feature_extractor:
+            feature_extractor.release()
+        if shard_writer:
+            shard_writer.close()
+        if metadata_writer:
+            metadata_writer.close()
@@ -0,0 +1,228 @@
+"""
+Profiling mode for bird call downloader.
+
+When a profile is running (python main.py --profile, or the profile toggle in
+the web interface) the download code reports named phases through phase():
+
+    with phase("catalog_fetch"):
+        response = requests.get(...)
+
+Each phase accumulates its call count, wall time and CPU time (of the thread
+running it). On top of that the download threads are profiled either
+deterministically with cProfile (mode "cprofile") or by a stack sampler that
+looks at every thread every SAMPLE_INTERVAL seconds (mode "sample"). With
+memory=True, tracemalloc also records peak memory and the top allocation sites;
+it slows a run down considerably, so it is off by default.
+
+From Python 3.12 cProfile runs on sys.monitoring, which allows only one active
+profiler per process, so "cprofile" mode falls back to "sample" there.
+
+Results are written next to the log files:
+
+    profile_<name>_<timestamp>.json        phase timings (and memory peaks)
+    profile_<name>_<timestamp>_<thread>.prof   cProfile stats (snakeviz, python -m pstats)
+    profile_<name>_<timestamp>.collapsed   sampled stacks (speedscope, flamegraph.pl)
+    profile_<name>_<timestamp>_memory.txt  top allocation sites (memory=True only)
+
+When no profile is running phase() returns a shared no-op context manager.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Seconds between stack samples in "sample" mode
+SAMPLE_INTERVAL = 0.005
+
+# Allocation sites listed in the memory report
+MEMORY_TOP_SITES = 25
+
+_NO_PHASE = contextlib.nullcontext()
+_active = None
+
+
+def phase(name):
+    """Context manager timing a named phase of the running profile (no-op when not profiling)"""
+    if _active is None:
+        return _NO_PHASE
+    return _active.phase(name)
+
+
+class Profiler:
+    """Collects phase timings, thread profiles and memory peaks for one run"""
+
+    def __init__(self, log_dir, name, mode="cprofile", memory=False):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'. Choose from: {', '.join(PROFILE_MODES)}")
+        if mode == "cprofile" and sys.version_info >= (3, 12):
+            # One cProfile per thread needs sys.setprofile, which cProfile no longer uses
+            logger.warning("cProfile cannot profile several threads at once on Python 3.12+; "
+                           "using the sampling profiler instead")
+            mode = "sample"
+        self.log_dir = log_dir
+        self.mode = mode
+        self.memory = memory
+        self.prefix = os.path.join(log_dir, f"profile_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self._lock = threading.Lock()
+        self._phases = {}      # name -> {"count", "wall", "cpu", "max_wall", "max_traced"}
+        self._profiles = []    # (thread label, cProfile.Profile)
+        self._samples = {}     # collapsed stack -> count
+        self._sampler = None
+        self._stopping = threading.Event()
+        self._started = None
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        import tracemalloc
+
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            with self._lock:
+                stats = self._phases.setdefault(name, {"count": 0, "wall": 0.0, "cpu": 0.0,
+                                                       "max_wall": 0.0, "max_traced": 0})
+                stats["count"] += 1
+                stats["wall"] += wall
+                stats["cpu"] += cpu
+                stats["max_wall"] = max(stats["max_wall"], wall)
+                stats["max_traced"] = max(stats["max_traced"], traced)
+
+    def wrap(self, func, label):
+        """Return func wrapped to run under cProfile in whichever thread calls it (cprofile mode)"""
+        if self.mode != "cprofile":
+            return func
+
+        def profiled(*args, **kwargs):
+            import cProfile
+
+            # Already inside a profiled call on this thread: only one cProfile can be active
+            if getattr(self._local, "profiling", False):
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append((label, profile))
+            self._local.profiling = True
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._local.profiling = False
+
+        return profiled
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self._samples[key] = self._samples.get(key, 0) + 1
+
+    def start(self):
+        global _active
+        import tracemalloc
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        if self.memory:
+            tracemalloc.start()
+        self._started = (time.perf_counter(), time.process_time())
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+            self._sampler.start()
+        _active = self
+        logger.info(f"Profiling enabled ({self.mode}); results will be written to {self.prefix}*")
+        return self
+
+    def stop(self):
+        """Stop profiling and write the results. Returns the list of files written."""
+        global _active
+        import pstats
+        import tracemalloc
+
+        if _active is self:
+            _active = None
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+        wall = time.perf_counter() - self._started[0]
+        cpu = time.process_time() - self._started[1]
+        snapshot = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+        written = []
+        summary = {
+            "mode": self.mode,
+            "wall_seconds": round(wall, 3),
+            "process_cpu_seconds": round(cpu, 3),
+            "traced_memory_peak_bytes": peak if snapshot else None,
+            "traced_memory_end_bytes": current if snapshot else None,
+            "phases": {
+                name: {**stats, "wall": round(stats["wall"], 4), "cpu": round(stats["cpu"], 4),
+                       "max_wall": round(stats["max_wall"], 4)}
+                for name, stats in sorted(self._phases.items(), key=lambda item: -item[1]["wall"])
+            }
+        }
+        with open(f"{self.prefix}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        written.append(f"{self.prefix}.json")
+
+        # One stats file per label; repeated calls under the same label are merged
+        stats_by_label = {}
+        for label, profile in self._profiles:
+            if label in stats_by_label:
+                stats_by_label[label].add(profile)
+            else:
+                stats_by_label[label] = pstats.Stats(profile)
+        for label, stats in stats_by_label.items():
+            path = f"{self.prefix}_{label}.prof"
+            stats.dump_stats(path)
+            written.append(path)
+
+        if self._samples:
+            with open(f"{self.prefix}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._samples.items()):
+                    f.write(f"{stack} {count}\n")
+            written.append(f"{self.prefix}.collapsed")
+
+        if snapshot:
+            with open(f"{self.prefix}_memory.txt", "w", encoding="utf-8") as f:
+                f.write(f"Peak traced memory: {peak / 1e6:.1f} MB\n\n")
+                for stat in snapshot.statistics("lineno")[:MEMORY_TOP_SITES]:
+                    f.write(f"{stat}\n")
+            written.append(f"{self.prefix}_memory.txt")
+
+        logger.info(f"Profile written: {', '.join(written)}")
+        return written
+
+
+def start_profiling(log_dir, name, mode="cprofile", memory=False):
+    """Start a Profiler that phase() reports to. Call stop() on the result when the run ends."""
+    return Profiler(log_dir, name, mode, memory).start()
@@ -0,0 +1,231 @@
+"""
+Progress reporting for bird call downloader.
+
+The run functions report progress through a ProgressTracker. Each batch of
+files is declared with span(), which maps it onto part of the 0.0-1.0 range;
+download_file and ShardWriter.download then report every chunk received and
+whether each file was downloaded, skipped or failed, so the fraction moves
+with the bytes of a large file instead of once per file or species.
+
+bytes_total is added up from known sizes (sizes passed to span(), e.g. from a
+measured plan, and the Content-Length of the file in progress) when the last
+span is running and every file left in it has a known size. Otherwise it is
+extrapolated from the fraction, and bytes_total_estimated is True.
+
+The tracker calls progress_callback at most every interval seconds (and
+always at 1.0). A plain callback receives the fraction as a float, as
+before. A callback marked with event_callback receives a dict instead:
+
+    {
+        "source": "xeno",
+        "fraction": 0.42,
+        "files_total": 120,       # files declared so far
+        "files_done": 40,         # downloaded
+        "files_skipped": 8,       # already held or not modified
+        "files_failed": 1,
+        "bytes_done": 83886080,
+        "bytes_total": 199728000, # None until known
+        "bytes_total_estimated": True,  # extrapolated rather than added up from known sizes
+        "rate": 1048576.0,        # bytes per second over the last few seconds
+        "eta": 110.5,             # seconds (None until known)
+        "elapsed": 80.2,
+        "error": None             # why the run stopped early, in the final event
+    }
+"""
+import time
+import functools
+import threading
+from collections import deque
+
+# Least time between two callbacks (the final 1.0 is always sent)
+DEFAULT_INTERVAL = 0.5
+
+# Window the transfer rate is averaged over
+RATE_WINDOW_SECONDS = 5.0
+
+FILE_STATUSES = ("downloaded", "skipped", "failed")
+
+
+def event_callback(func):
+    """Mark a progress callback as taking event dicts rather than floats"""
+    @functools.wraps(func)
+    def callback(event):
+        return func(event)
+
+    callback.wants_events = True
+    return callback
+
+
+class ProgressTracker:
+    """Collects byte and file counts for one download run and reports them, throttled"""
+
+    def __init__(self, progress_callback=None, source=None, interval=DEFAULT_INTERVAL, clock=time.monotonic):
+        self._callback = progress_callback
+        self._wants_events = getattr(progress_callback, "wants_events", False)
+        self.source = source
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started = clock()
+        self._last_emit = None
+        self._samples = deque()         # (time, bytes_done) for the rate
+        self.fraction = 0.0
+        self.files_total = 0
+        self.counts = dict.fromkeys(FILE_STATUSES, 0)
+        self.bytes_done = 0
+        # Current span: files mapped onto [start, end] of the fraction
+        self._span = None               # [start, end, files, finished]
+        self._span_sizes = None         # Expected size of each file in the span (None if unknown)
+        self._downloads_start = None    # (time, fraction) when the first span began
+        self._current = None            # [bytes received, Content-Length or None] of the file in progress
+        self.error = None
+
+    def update(self, fraction):
+        """Report phase-level progress (0.0-1.0), e.g. while searching; usable as a float callback"""
+        with self._lock:
+            self.fraction = max(self.fraction, min(1.0, fraction))
+        self._emit(force=fraction >= 1.0)
+
+    def span(self, start, end, files, sizes=None):
+        """
+        Map the next files reported by file_finished onto the fraction range [start, end].
+        sizes optionally lists their expected sizes in bytes (None where unknown), in the
+        order they will be reported.
+        """
+        with self._lock:
+            self._span = [start, end, files, 0]
+            self._span_sizes = list(sizes) if sizes is not None else [None] * files
+            self.files_total += files
+            self.fraction = max(self.fraction, start)
+            if self._downloads_start is None:
+                self._downloads_start = (self._clock(), self.fraction)
+        self._emit()
+
+    def file_started(self, size=None):
+        """A transfer began; size is its Content-Length when known"""
+        with self._lock:
+            self._current = [0, size]
+
+    def add_bytes(self, count):
+        """Account for count bytes received"""
+        with self._lock:
+            self.bytes_done += count
+            if self._current is not None:
+                self._current[0] += count
+            self._advance()
+        self._emit()
+
+    def file_finished(self, status):
+        """A file was "downloaded", "skipped" or "failed" """
+        with self._lock:
+            self.counts[status] += 1
+            self._current = None
+            if self._span is not None:
+                self._span[3] += 1
+            self._advance()
+        self._emit()
+
+    def close(self, error=None):
+        """Report completion, or with error, that the run stopped early"""
+        with self._lock:
+            self.fraction = 1.0
+            self.error = error
+        self._emit(force=True)
+
+    def _advance(self):
+        # Called with the lock held: move the fraction through the current span
+        if self._span is None:
+            return
+        start, end, files, finished = self._span
+        partial = 0.0
+        if self._current is not None and self._current[1]:
+            partial = min(1.0, self._current[0] / self._current[1])
+        done = min(1.0, (finished + partial) / files) if files else 1.0
+        self.fraction = max(self.fraction, start + (end - start) * done)
+
+    def _remaining_bytes(self):
+        # Called with the lock held: bytes still to come when the last span is running
+        # and the size of every file left in it is known, else None
+        if self._span is None or self._span[1] < 1.0:
+            return None
+        pending = self._span_sizes[self._span[3]:self._span[2]]
+        remaining = 0
+        if self._current is not None:
+            received, length = self._current
+            if not length and pending:
+                length = pending[0]
+            if not length:
+                return None
+            remaining += max(0, length - received)
+            pending = pending[1:]
+        if any(size is None for size in pending):
+            return None
+        return remaining + sum(pending)
+
+    def snapshot(self):
+        """The current progress event"""
+        with self._lock:
+            return self._snapshot(self._clock())
+
+    def _snapshot(self, now):
+        samples = self._samples
+        rate = 0.0
+        if samples and now > samples[0][0]:
+            rate = (self.bytes_done - samples[0][1]) / (now - samples[0][0])
+
+        # Extrapolate from the share of the download phase done so far, which
+        # moves with the bytes of each file (see span)
+        eta = None
+        bytes_total = self.bytes_done if self.fraction >= 1.0 else None
+        remaining = self._remaining_bytes() if self.fraction < 1.0 else None
+        if remaining is not None:
+            bytes_total = self.bytes_done + remaining
+        estimated = False
+        if self._downloads_start is not None and self.fraction < 1.0:
+            started_at, start_fraction = self._downloads_start
+            phase_done = (self.fraction - start_fraction) / max(1e-9, 1.0 - start_fraction)
+            if phase_done > 0:
+                eta = (now - started_at) * (1 - phase_done) / phase_done
+                if self.bytes_done and remaining is None:
+                    bytes_total = int(self.bytes_done / phase_done)
+                    estimated = True
+
+        return {
+            "source": self.source,
+            "fraction": self.fraction,
+            "files_total": self.files_total,
+            "files_done": self.counts["downloaded"],
+            "files_skipped": self.counts["skipped"],
+            "files_failed": self.counts["failed"],
+            "bytes_done": self.bytes_done,
+            "bytes_total": bytes_total,
+            "bytes_total_estimated": estimated,
+            "rate": rate,
+            "eta": eta,
+            "elapsed": now - self._started,
+            "error": self.error
+        }
+
+    def _emit(self, force=False):
+        with self._lock:
+            now = self._clock()
+            if not force and self._last_emit is not None and now - self._last_emit < self.interval:
+                return
+            self._last_emit = now
+            self._samples.append((now, self.bytes_done))
+            while len(self._samples) > 1 and now - self._samples[0][0] > RATE_WINDOW_SECONDS:
+                self._samples.popleft()
+            event = self._snapshot(now)
+
+        if self._callback is not None:
+            self._callback(event if self._wants_events else event["fraction"])
+
+
+def format_duration(seconds):
+    """Short human-readable duration, e.g. "1h05m", "3m20s", "12s" """
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,85 @@
+"""
+Download scheduling for bird call downloader.
+
+By default downloads are ordered coverage-first: every species' best recording,
+then every species' second best, and so on. A run that stops part way through
+therefore has something for as many species as possible rather than complete
+coverage of only the first few species.
+
+Species can be given priority weights in config["schedule"]["species_weights"],
+keyed by common name, scientific name or eBird species code (case-insensitive).
+A species with weight 2 gets two recordings per round, and a species with
+weight 0.5 gets one every other round. Species without an entry have weight 1.
+"""
+
+SCHEDULE_ORDERS = ("coverage", "species")
+
+
+def get_schedule_settings(config):
+    """Return (order, weights) from config["schedule"], with lower-cased weight keys"""
+    settings = config.get("schedule", {})
+    order = settings.get("order", "coverage")
+    if order not in SCHEDULE_ORDERS:
+        raise ValueError(f"Unknown schedule order '{order}'. Choose from: {', '.join(SCHEDULE_ORDERS)}")
+    weights = {str(k).lower(): float(v) for k, v in (settings.get("species_weights") or {}).items()}
+    return order, weights
+
+
+def species_weight(weights, *names):
+    """Look up the weight of a species by any of its names, defaulting to 1"""
+    for name in names:
+        if name and name.lower() in weights:
+            return weights[name.lower()]
+    return 1.0
+
+
+def coverage_order(items, species_key, weight_key=None):
+    """
+    Reorder items round-robin across species.
+
+    Args:
+        items (list): Items already sorted best-first within each species
+        species_key (callable): Returns the species of an item
+        weight_key (callable, optional): Returns the priority weight of an item's species
+
+    Returns:
+        list: The same items, interleaved by species. Within a round, higher-weight
+            species come first; ties keep the order in which species first appear.
+            Species with weight <= 0 are placed after everything else.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(species_key(item), []).append(item)
+
+    queues = []
+    for species, group in groups.items():
+        weight = weight_key(group[0]) if weight_key else 1.0
+        queues.append([species, group, weight, 0.0])
+
+    # Stable sort: higher weight first, then first-appearance order
+    queues.sort(key=lambda q: -q[2])
+    active = [q for q in queues if q[2] > 0]
+    deprioritised = [q for q in queues if q[2] <= 0]
+
+    ordered = []
+    while active:
+        for queue in active:
+            _, group, weight, credit = queue
+            credit += weight
+            take = int(credit)
+            if take:
+                ordered.extend(group[:take])
+                del group[:take]
+                credit -= take
+            queue[3] = credit
+        active = [q for q in active if q[1]]
+
+    for _, group, _, _ in deprioritised:
+        ordered.extend(group)
+
+    return ordered
+
+
+def order_by_weight(species_list, weight_key):
+    """Stable-sort species so that higher-weight species come first"""
+    return sorted(species_list, key=lambda s: -weight_key(s))
@@ -0,0 +1,321 @@
+"""
+Sharded archive output for bird call downloader.
+
+Instead of one small mp3 per recording under XC/ and ML/, recordings can be
+streamed straight into size-bounded tar shards under download_dir/shards/
+(xc-000000.tar, xc-000001.tar, ..., ml-000000.tar, ...). Each sample is stored
+as two members named after its id, "<id>.mp3" and "<id>.json" (the metadata
+catalog fields plus size and SHA-256), the layout WebDataset-style loaders
+expect, so a training job can read a shard sequentially at full disk bandwidth.
+
+shards/index.jsonl has one line per sample with the shard name and the byte
+offsets and sizes of both members, for random access without scanning the tar
+headers (see read_sample).
+
+Configured from config["shards"]:
+
+    "shards": {
+        "enabled": false,
+        "max_bytes": 1073741824
+    }
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tarfile
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIRNAME = "shards"
+SHARD_INDEX_FILENAME = "index.jsonl"
+DEFAULT_SHARD_MAX_BYTES = 1 << 30
+
+# Shard name prefix for each download source
+SHARD_PREFIXES = {"xeno": "xc", "ebird": "ml"}
+
+# Responses without a Content-Length are spooled in memory up to this size, then on disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+# Writers for different sources share the index file
+_index_lock = threading.Lock()
+
+
+def _padded(size):
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def _member_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+def _entry_validators(entry):
+    """Validators an index entry was downloaded with, for a conditional re-download"""
+    validators = {"content_length": entry["size"]}
+    for field in ("etag", "last_modified"):
+        if entry.get(field):
+            validators[field] = entry[field]
+    return validators if len(validators) > 1 else {}
+
+
+def load_shard_index(download_dir):
+    """
+    Read the shard index.
+
+    Returns:
+        dict: Sample id -> latest index entry
+            {"key", "shard", "offset", "size", "json_offset", "json_size", "end", "sha256", ...}
+    """
+    entries = {}
+    path = Path(download_dir).expanduser() / SHARDS_DIRNAME / SHARD_INDEX_FILENAME
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial line from an interrupted run
+                entries[entry["key"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_sample(download_dir, entry):
+    """Return (audio_bytes, metadata_dict) for an index entry, reading only that sample"""
+    shard_path = Path(download_dir).expanduser() / SHARDS_DIRNAME / entry["shard"]
+    with open(shard_path, "rb") as f:
+        f.seek(entry["offset"])
+        audio = f.read(entry["size"])
+        f.seek(entry["json_offset"])
+        meta = json.loads(f.read(entry["json_size"]).decode("utf-8"))
+    return audio, meta
+
+
+class ShardWriter:
+    """Appends downloaded recordings to the tar shards of one source"""
+
+    def __init__(self, download_dir, prefix, max_bytes=DEFAULT_SHARD_MAX_BYTES):
+        self.root = Path(download_dir).expanduser()
+        self.dir = self.root / SHARDS_DIRNAME
+        self.index_path = self.dir / SHARD_INDEX_FILENAME
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self._shards = {}       # key -> shard name
+        self._validators = {}   # key -> ETag/Last-Modified/Content-Length it was downloaded with
+        self._shard_num = 0
+        self._end = 0           # End of the last complete sample in the current shard
+        self._file = None
+
+        for key, entry in load_shard_index(self.root).items():
+            if not entry["shard"].startswith(f"{prefix}-"):
+                continue
+            self._shards[key] = entry["shard"]
+            self._validators[key] = _entry_validators(entry)
+            num = int(entry["shard"][len(prefix) + 1:-len(".tar")])
+            if num > self._shard_num:
+                self._shard_num, self._end = num, 0
+            if num == self._shard_num:
+                self._end = max(self._end, entry["end"])
+
+    def _shard_name(self):
+        return f"{self.prefix}-{self._shard_num:06d}.tar"
+
+    def has(self, key):
+        return key in self._shards
+
+    def path_of(self, key):
+        """Path of the shard holding key, or None"""
+        shard = self._shards.get(key)
+        return self.dir / shard if shard else None
+
+    def _open(self, needed):
+        """Make sure a shard with room for needed more bytes is open"""
+        if self._end > 0 and self._end + needed > self.max_bytes:
+            if self._file is None:
+                # Resumed at a full shard: it still has to lose anything an interrupted
+                # write left after the last complete sample, and get its end marker
+                self._file = self._open_current()
+            self._finish()
+            self._shard_num += 1
+            self._end = 0
+
+        if self._file is None:
+            self._file = self._open_current()
+
+    def _open_current(self):
+        """Open the current shard positioned after its last complete sample"""
+        os.makedirs(self.dir, exist_ok=True)
+        path = self.dir / self._shard_name()
+        # Resume after the last complete sample; drops the end-of-archive marker
+        # and anything left by an interrupted write
+        f = open(path, "r+b" if path.exists() else "w+b")
+        f.truncate(self._end)
+        f.seek(self._end)
+        return f
+
+    def _finish(self):
+        if self._file is not None:
+            self._file.seek(self._end)
+            self._file.write(b"\0" * (BLOCK_SIZE * 2))
+            self._file.truncate()
+            self._file.close()
+            self._file = None
+
+    def download(self, key, download_url, meta, overwrite=False, source=None, progress=None):
+        """
+        Download one recording into the current shard.
+
+        Args:
+            key (str): Sample id, e.g. "XC123456" (used for the member names)
+            download_url (str): URL of the audio file
+            meta (dict): Metadata stored in the sample's JSON member
+            overwrite (bool): Add the sample again if it is already in a shard and changed
+                on the server since (checked with a conditional request)
+            source (str, optional): Bandwidth limiter source
+            progress (ProgressTracker, optional): Told about received bytes and the outcome
+
+        Returns:
+            bool: True if the sample was added
+        """
+        from .bandwidth import get_limiter
+        from .hosts import get_scheduler
+
+        if not overwrite and key in self._shards:
+            logger.debug(f"Skipping download: {key} (already in {self._shards[key]})")
+            if progress:
+                progress.file_finished("skipped")
+            return False
+
+        spool = None
+        start = None
+        try:
+            import requests
+            from tempfile import SpooledTemporaryFile
+            from .utils import DOWNLOAD_CHUNK_SIZE, response_validators, conditional_headers, is_unchanged
+
+            limiter = get_limiter()
+            digest = hashlib.sha256()
+            mtime = time.time()
+            validators = self._validators.get(key, {})
+
+            with get_scheduler().slot(download_url) as host, \
+                    requests.get(download_url, headers=conditional_headers(validators),
+                                 stream=True, timeout=host.timeout) as response:
+                if is_unchanged(response, validators):
+                    logger.debug(f"Skipping download: {key} (not modified)")
+                    if progress:
+                        progress.file_finished("skipped")
+                    return False
+                response.raise_for_status()
+                received = response_validators(response.headers)
+                if progress:
+                    progress.file_started(received.get("content_length"))
+                chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                size = response.headers.get("Content-Length")
+                if size is None or response.headers.get("Content-Encoding"):
+                    # Size unknown up front: spool the body so the tar header can be written first
+                    spool = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+                    for chunk in chunks:
+                        limiter.throttle(source, len(chunk))
+                        if progress:
+                            progress.add_bytes(len(chunk))
+                        spool.write(chunk)
+                    size = spool.tell()
+                    spool.seek(0)
+                    chunks = iter(lambda: spool.read(DOWNLOAD_CHUNK_SIZE), b"")
+                    throttled = True
+                else:
+                    size = int(size)
+                    throttled = False
+
+                audio_header = _member_header(f"{key}.mp3", size, mtime)
+                self._open(len(audio_header) + _padded(size) + 4 * BLOCK_SIZE)
+                start = self._end
+                self._file.write(audio_header)
+                offset = start + len(audio_header)
+
+                written = 0
+                for chunk in chunks:
+                    if not throttled:
+                        limiter.throttle(source, len(chunk))
+                        if progress:
+                            progress.add_bytes(len(chunk))
+                    self._file.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+                if written != size:
+                    raise IOError(f"Expected {size} bytes, received {written}")
+
+            self._file.write(b"\0" * (_padded(size) - size))
+
+            sample_meta = {**meta, "key": key, "size": size, "sha256": digest.hexdigest()}
+            meta_bytes = json.dumps(sample_meta, ensure_ascii=False).encode("utf-8")
+            meta_header = _member_header(f"{key}.json", len(meta_bytes), mtime)
+            json_offset = offset + _padded(size) + len(meta_header)
+            self._file.write(meta_header)
+            self._file.write(meta_bytes)
+            self._file.write(b"\0" * (_padded(len(meta_bytes)) - len(meta_bytes)))
+            self._file.flush()
+            end = json_offset + _padded(len(meta_bytes))
+
+            entry = {
+                "key": key, "shard": self._shard_name(),
+                "offset": offset, "size": size,
+                "json_offset": json_offset, "json_size": len(meta_bytes),
+                "end": end, "sha256": sample_meta["sha256"],
+                "source": meta.get("source"), "species": meta.get("species"),
+                "etag": received.get("etag"), "last_modified": received.get("last_modified")
+            }
+            with _index_lock:
+                with open(self.index_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            self._end = end
+            self._shards[key] = entry["shard"]
+            self._validators[key] = _entry_validators(entry)
+            logger.debug(f"Added {key} to {entry['shard']}")
+            if progress:
+                progress.file_finished("downloaded")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to download {key}: {str(e)}")
+            if progress:
+                progress.file_finished("failed")
+            if start is not None and self._file is not None:
+                # Drop the partial sample
+                self._file.seek(start)
+                self._file.truncate()
+            return False
+
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def close(self):
+        """Write the end-of-archive marker and close the current shard"""
+        self._finish()
+
+
+def create_shard_writer(config, source):
+    """
+    Create a ShardWriter for source ("xeno" or "ebird") from config["shards"].
+
+    Returns:
+        ShardWriter or None: None when sharded output is disabled
+    """
+    settings = config.get("shards", {})
+    if not settings.get("enabled", False):
+        return None
+    return ShardWriter(config["download_dir"], SHARD_PREFIXES[source],
+                       settings.get("max_bytes") or DEFAULT_SHARD_MAX_BYTES)
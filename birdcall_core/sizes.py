@@ -0,0 +1,157 @@
+"""
+Download size estimates and disk budgets for bird call downloader.
+
+With config["sizes"]["measure"] set, planning sends a HEAD request for every
+planned file (many at once, no bodies are transferred) and records each size
+in the plan, so the plan summary and the web preview can report the total
+bytes before anything is downloaded. Servers that do not answer HEAD with a
+Content-Length are asked for the first byte instead and report the size in
+Content-Range.
+
+config["sizes"]["max_bytes"] caps the total. The plan then keeps recordings in
+value order (the order of the schedule, best recording of every species first,
+interleaving the two sources) while they fit, and drops the rest, so a run
+on a small scratch disk ends cleanly instead of failing with ENOSPC halfway.
+
+    "sizes": {
+        "measure": false,
+        "head_workers": 16,
+        "max_bytes": null
+    }
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEAD_WORKERS = 16
+
+
+def get_size_settings(config):
+    """Return (measure, head_workers, max_bytes) from config["sizes"]; a budget implies measuring"""
+    settings = config.get("sizes", {})
+    max_bytes = settings.get("max_bytes") or None
+    measure = bool(settings.get("measure", False)) or max_bytes is not None
+    return measure, settings.get("head_workers") or DEFAULT_HEAD_WORKERS, max_bytes
+
+
+def fetch_size(url):
+    """Size in bytes of the file at url without downloading it, or None if the server doesn't say"""
+    import requests
+    from .hosts import get_scheduler, FAILURE_STATUSES
+
+    try:
+        with get_scheduler().slot(url) as host:
+            response = requests.head(url, allow_redirects=True, timeout=host.timeout)
+            if response.status_code in FAILURE_STATUSES:
+                response.raise_for_status()  # Counts against the host, like a failed download
+            if response.ok and response.headers.get("Content-Length") and \
+                    not response.headers.get("Content-Encoding"):
+                return int(response.headers["Content-Length"])
+
+            # Some servers don't support HEAD: ask for one byte and read the total from Content-Range
+            with requests.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=host.timeout) as response:
+                if response.status_code in FAILURE_STATUSES:
+                    response.raise_for_status()
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if response.status_code == 206 and total.isdigit():
+                    return int(total)
+    except Exception as e:
+        logger.debug(f"Could not get the size of {url}: {str(e)}")
+    return None
+
+
+def fetch_sizes(urls, workers=DEFAULT_HEAD_WORKERS, progress_callback=None):
+    """
+    Look up the sizes of many files concurrently.
+
+    Args:
+        urls (iterable): File URLs
+        workers (int): Requests in flight at once
+        progress_callback (callable, optional): Called with the fraction of URLs done
+
+    Returns:
+        dict: URL -> size in bytes, or None where unknown
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    urls = list(dict.fromkeys(urls))
+    sizes = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for i, (url, size) in enumerate(zip(urls, executor.map(fetch_size, urls))):
+            sizes[url] = size
+            progress_callback((i + 1) / max(1, len(urls)))
+
+    unknown = sum(1 for size in sizes.values() if size is None)
+    if unknown:
+        logger.warning(f"Size unknown for {unknown} of {len(urls)} files")
+    return sizes
+
+
+def estimated_size(entry, fallback):
+    """An entry's measured size, or fallback when it could not be measured"""
+    return entry["size"] if entry.get("size") is not None else fallback
+
+
+def free_bytes(path):
+    """Free space on the filesystem holding path (or its nearest existing parent)"""
+    import shutil
+    from pathlib import Path
+
+    path = Path(path).expanduser()
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return shutil.disk_usage(path).free
+
+
+def apply_byte_budget(entries_by_source, max_bytes):
+    """
+    Trim planned entries to a byte budget.
+
+    Entries are taken in value order: each source's list is already best-first,
+    and the sources are interleaved in proportion to their length, so both get
+    through their schedule rounds at the same pace. Entries are kept while they
+    fit; one that doesn't fit is dropped, but smaller ones after it may still be
+    kept. Entries of unknown size count as the average measured size.
+
+    Args:
+        entries_by_source (dict): Source -> list of entries with a "size" key
+        max_bytes (int): Budget in bytes
+
+    Returns:
+        tuple: (kept_by_source, dropped_count, kept_bytes)
+    """
+    known = [entry["size"] for entries in entries_by_source.values() for entry in entries
+             if entry.get("size") is not None]
+    fallback = sum(known) // len(known) if known else 0
+
+    ranked = sorted(
+        ((rank / max(1, len(entries)), source, rank)
+         for source, entries in entries_by_source.items()
+         for rank in range(len(entries))),
+        key=lambda item: item[0])
+
+    keep = {source: set() for source in entries_by_source}
+    kept_bytes = 0
+    dropped = 0
+    for _, source, rank in ranked:
+        size = estimated_size(entries_by_source[source][rank], fallback)
+        if kept_bytes + size <= max_bytes:
+            keep[source].add(rank)
+            kept_bytes += size
+        else:
+            dropped += 1
+
+    kept_by_source = {source: [entry for rank, entry in enumerate(entries) if rank in keep[source]]
+                      for source, entries in entries_by_source.items()}
+    return kept_by_source, dropped, kept_bytes
+
+
+def format_bytes(size):
+    """Human-readable size, e.g. "1.4 GB" """
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1000:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} TB"
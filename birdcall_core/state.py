@@ -0,0 +1,85 @@
+"""
+Small persistent state files for bird call downloader.
+
+State is stored as JSON files inside the download directory and is always
+written atomically (write to a temporary file, then rename), so an interrupted
+run never leaves a half-written state file behind.
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LAST_RUN_FILENAME = ".last_run.json"
+
+
+def read_json_state(path, default=None):
+    """Read a JSON state file, returning default if it is missing or unreadable"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable state file {path}: {str(e)}")
+        return default
+
+
+def write_json_state(path, data, mode=None):
+    """
+    Atomically write a JSON state file.
+
+    mode (int, optional): Permissions to create the file with (e.g. 0o600 for
+    secrets); the temporary file has them before anything is written to it.
+    """
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if mode is None:
+        f = open(tmp_path, "w", encoding="utf-8")
+    else:
+        # O_EXCL: never reuse a leftover temporary file that others may already have open
+        tmp_path.unlink(missing_ok=True)
+        f = os.fdopen(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, mode), "w", encoding="utf-8")
+    with f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def config_fingerprint(config):
+    """Stable hash of the settings that determine what a run downloads"""
+    import hashlib
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _last_run_path(config):
+    return Path(config["download_dir"]).expanduser() / LAST_RUN_FILENAME
+
+
+def is_up_to_date(config):
+    """
+    Check whether a run with this exact configuration completed recently enough
+    to skip this one. Controlled by config["min_run_interval_hours"]; always
+    False when that is unset or zero.
+    """
+    interval_hours = config.get("min_run_interval_hours")
+    if not interval_hours:
+        return False
+    last_run = read_json_state(_last_run_path(config))
+    if not last_run or last_run.get("fingerprint") != config_fingerprint(config):
+        return False
+    return time.time() - last_run.get("completed", 0) < interval_hours * 3600
+
+
+def mark_run_complete(config):
+    """Record that a run with this configuration finished successfully"""
+    write_json_state(_last_run_path(config), {
+        "fingerprint": config_fingerprint(config),
+        "completed": time.time()
+    })
@@ -0,0 +1,291 @@
+"""
+Storage backends for bird call downloader.
+
+download_file hands each response body to a storage backend instead of opening
+the target file itself. Files are addressed by key, their path relative to the
+download directory with forward slashes ("XC/Species/file.mp3"):
+
+- LocalStorage writes under download_dir, through a ".part" file that is
+  renamed into place once complete (the default).
+- S3Storage streams straight into an S3-compatible bucket. Bodies larger than
+  one part go up as multipart uploads whose parts are sent concurrently, so
+  memory stays bounded at (max_concurrency + 1) x part_size however large the
+  file. Existence checks list each directory once instead of sending a HEAD
+  per file. endpoint_url points it at MinIO, Ceph, a local moto server, etc.
+
+State files (manifest, metadata catalog, checkpoints, inventory) stay in the
+local download_dir in both cases. Configured from config["storage"]:
+
+    "storage": {
+        "backend": "local",
+        "bucket": "",
+        "prefix": "",
+        "endpoint_url": null,
+        "region": null,
+        "part_size": 8388608,
+        "max_concurrency": 4
+    }
+
+The S3 backend needs boto3 (pip install boto3) and takes credentials from the
+usual AWS environment variables or config files.
+"""
+import os
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ("local", "s3")
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts (except the last)
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class LocalStorage:
+    """Files on the local filesystem under root"""
+
+    is_local = True
+
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+
+    def key_for(self, file_path):
+        """Key of a path inside root"""
+        return Path(os.path.relpath(Path(file_path).expanduser(), self.root)).as_posix()
+
+    def path_for(self, key):
+        return self.root / key
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def exists_many(self, keys):
+        """Return the subset of keys that exist"""
+        return {key for key in keys if self.exists(key)}
+
+    def list_dir(self, directory):
+        """Keys of the files directly in directory (a key without a trailing slash)"""
+        prefix = f"{directory}/" if directory else ""
+        try:
+            with os.scandir(self.path_for(directory)) as it:
+                return [prefix + entry.name for entry in it if entry.is_file()]
+        except FileNotFoundError:
+            return []
+
+    def delete(self, key):
+        """Remove key if it exists"""
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def size(self, key):
+        """Size in bytes, or None if the file does not exist"""
+        try:
+            return os.path.getsize(self.path_for(key))
+        except OSError:
+            return None
+
+    def write_stream(self, key, chunks):
+        """
+        Write an iterable of byte chunks to key, replacing any existing file.
+
+        Returns:
+            int: Number of bytes written
+        """
+        save_file_path = self.path_for(key)
+        os.makedirs(save_file_path.parent, exist_ok=True)
+        part_file_path = save_file_path.with_name(save_file_path.name + ".part")
+        size = 0
+        try:
+            with open(part_file_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(part_file_path, save_file_path)
+        except BaseException:
+            try:
+                os.remove(part_file_path)
+            except OSError:
+                pass
+            raise
+        return size
+
+    def close(self):
+        pass
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, under an optional key prefix"""
+
+    is_local = False
+
+    def __init__(self, root, bucket, prefix="", endpoint_url=None, region=None,
+                 part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        import boto3
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.root = Path(root).expanduser()
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max(1, max_concurrency)
+        self._client = boto3.session.Session().client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="s3-part")
+        # Parts buffered or in flight, across all uploads of this storage
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._listed = {}   # directory key -> {key: size} of the objects listed in it
+
+    def key_for(self, file_path):
+        """Key of a path inside the (local) download directory"""
+        return Path(os.path.relpath(Path(file_path).expanduser(), self.root)).as_posix()
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def _listing(self, directory):
+        """Objects directly in directory (listed once, then kept up to date by write_stream)"""
+        with self._lock:
+            if directory in self._listed:
+                return self._listed[directory]
+
+        objects = {}
+        list_prefix = self._object_key(f"{directory}/" if directory else "")
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=list_prefix, Delimiter="/"):
+            for obj in page.get("Contents", []):
+                objects[obj["Key"][len(self.prefix):]] = obj["Size"]
+
+        with self._lock:
+            return self._listed.setdefault(directory, objects)
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def exists_many(self, keys):
+        """Return the subset of keys that exist, with one listing per directory"""
+        return {key for key in keys if key in self._listing(key.rpartition("/")[0])}
+
+    def list_dir(self, directory):
+        """Keys of the objects directly in directory (a key without a trailing slash)"""
+        return list(self._listing(directory))
+
+    def delete(self, key):
+        """Remove key if it exists"""
+        self._client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        with self._lock:
+            listing = self._listed.get(key.rpartition("/")[0])
+            if listing is not None:
+                listing.pop(key, None)
+
+    def size(self, key):
+        """Size in bytes, or None if the object does not exist"""
+        return self._listing(key.rpartition("/")[0]).get(key)
+
+    def _upload_part(self, object_key, upload_id, number, body):
+        response = self._client.upload_part(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                            PartNumber=number, Body=body)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def write_stream(self, key, chunks):
+        """
+        Upload an iterable of byte chunks to key, replacing any existing object.
+
+        Bodies up to part_size are sent with a single PUT. Larger ones become a
+        multipart upload: each full part is handed to the upload pool while the
+        next one is read, and reading waits when max_concurrency parts are in
+        flight. A failed upload is aborted, so no partial object is left behind.
+
+        Returns:
+            int: Number of bytes written
+        """
+        from concurrent.futures import wait
+
+        object_key = self._object_key(key)
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        futures = []
+
+        def submit(body):
+            self._slots.acquire()
+            try:
+                future = self._executor.submit(self._upload_part, object_key, upload_id, len(futures) + 1, body)
+            except BaseException:
+                self._slots.release()
+                raise
+            # Also runs for parts cancelled after a failure
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self._client.create_multipart_upload(
+                            Bucket=self.bucket, Key=object_key)["UploadId"]
+                    submit(bytes(buffer[:self.part_size]))
+                    del buffer[:self.part_size]
+
+            if upload_id is None:
+                self._client.put_object(Bucket=self.bucket, Key=object_key, Body=bytes(buffer))
+            else:
+                if buffer:
+                    submit(bytes(buffer))
+                parts = [future.result() for future in futures]
+                self._client.complete_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                                       MultipartUpload={"Parts": parts})
+        except BaseException:
+            if upload_id is not None:
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+                try:
+                    self._client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+                except Exception as e:
+                    logger.warning(f"Could not abort multipart upload of {object_key}: {str(e)}")
+            raise
+
+        with self._lock:
+            listing = self._listed.get(key.rpartition("/")[0])
+            if listing is not None:
+                listing[key] = size
+        return size
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def uses_local_storage(config):
+    """True if recordings are written under the local download_dir (the "local" backend)"""
+    return (config.get("storage", {}).get("backend") or "local") == "local"
+
+
+def create_storage(config):
+    """
+    Create the storage backend configured in config["storage"].
+
+    Raises:
+        ValueError: If the backend is unknown or S3 is selected without a bucket.
+    """
+    settings = config.get("storage", {})
+    backend = settings.get("backend") or "local"
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Choose from: {', '.join(STORAGE_BACKENDS)}")
+
+    if backend == "local":
+        return LocalStorage(config["download_dir"])
+
+    if not settings.get("bucket"):
+        raise ValueError("A bucket is required for the s3 storage backend.")
+    return S3Storage(config["download_dir"], settings["bucket"],
+                     prefix=settings.get("prefix") or "",
+                     endpoint_url=settings.get("endpoint_url"),
+                     region=settings.get("region"),
+                     part_size=settings.get("part_size") or DEFAULT_PART_SIZE,
+                     max_concurrency=settings.get("max_concurrency") or DEFAULT_MAX_CONCURRENCY)
@@ -0,0 +1,155 @@
+"""
+Incremental sync support for bird call downloader.
+
+In incremental mode each Xeno-Canto search remembers when it was last synced
+successfully, in download_dir/.sync_state.json. The next sync only asks for
+recordings uploaded since then, and new candidates are merged against the
+recordings already held for each species: a candidate is downloaded only if it
+fills a gap (fewer than max_per_species held) or beats the worst recording held.
+In the second case the recording it displaces is removed once the new one is
+downloaded (remove_held_recording), so a folder stays at max_per_species. eBird
+species that already hold max_per_species recordings are skipped without any
+catalog request.
+"""
+import re
+import time
+import logging
+from pathlib import Path
+from .state import read_json_state, write_json_state
+from .targets import get_target_species
+from .utils import sanitize_filename
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_FILENAME = ".sync_state.json"
+
+# Days of overlap when asking for recordings "since" the last sync, to allow for
+# time zone differences and uploads that were being processed during the last sync
+SINCE_OVERLAP_DAYS = 1
+
+_XC_FILENAME_RE = re.compile(r"^\((?P<q>[^)]*)\).*XC(?P<id>\d+)\.mp3$")
+
+
+def quality_rank(quality):
+    """Sort key for a Xeno-Canto quality rating (A best, unknown last)"""
+    return 'ABCDE'.index(quality[0]) if quality and quality[0] in 'ABCDE' else 999
+
+
+def _state_path(config):
+    return Path(config["download_dir"]).expanduser() / SYNC_STATE_FILENAME
+
+
+def xeno_target_key(config):
+    """Identify a Xeno-Canto search by the settings that define its scope"""
+    xeno = config["xeno"]
+    parts = [xeno.get("country") or "", xeno.get("location") or "", xeno.get("better_than_rating") or "",
+             str(xeno.get("min_length_seconds") or ""), str(xeno.get("max_length_seconds") or "")]
+    targets = get_target_species(config)
+    if targets:
+        parts.append(",".join(sorted(name.lower() for name in targets)))
+    return "xeno:" + "|".join(parts).lower()
+
+
+def get_last_sync(config, target_key):
+    """Return the unix time of the target's last successful sync, or None"""
+    state = read_json_state(_state_path(config), default={})
+    entry = state.get(target_key) if isinstance(state, dict) else None
+    return entry.get("last_sync") if entry else None
+
+
+def record_sync(config, target_key, started):
+    """Record a successful sync that started at unix time started"""
+    path = _state_path(config)
+    state = read_json_state(path, default={})
+    if not isinstance(state, dict):
+        state = {}
+    state[target_key] = {"last_sync": started}
+    write_json_state(path, state)
+
+
+def xeno_since_date(last_sync):
+    """Date (YYYY-MM-DD) for a Xeno-Canto "since" search covering uploads after last_sync"""
+    return time.strftime('%Y-%m-%d', time.gmtime(last_sync - SINCE_OVERLAP_DAYS * 86400))
+
+
+def held_xeno_recordings(storage, species_dir):
+    """
+    List the Xeno-Canto recordings already held in a species folder of a storage backend.
+
+    Returns:
+        list: (quality, xc_id, key) tuples parsed from the filenames
+    """
+    held = []
+    for key in storage.list_dir(storage.key_for(species_dir)):
+        match = _XC_FILENAME_RE.match(key.rpartition("/")[2])
+        if match:
+            held.append((match.group("q"), match.group("id"), key))
+    return held
+
+
+def count_held_files(storage, species_dir):
+    """Count the mp3 files already held in a species folder of a storage backend"""
+    return sum(1 for key in storage.list_dir(storage.key_for(species_dir)) if key.endswith(".mp3"))
+
+
+def merge_xeno_candidates(candidates, storage, download_dir_xc, max_per_species):
+    """
+    Keep only the new candidates that improve what is already held.
+
+    Args:
+        candidates (list): Xeno-Canto recording dicts, best first within each species
+        storage: Storage backend the recordings are held in (see birdcall_core.storage)
+        download_dir_xc (Path): The XC download folder
+        max_per_species (int): Target number of recordings per species
+
+    Returns:
+        tuple: (merged, displaced) where merged is the list of candidates worth
+            downloading, in their original order, and displaced maps the id of each
+            candidate that beats a held recording to the storage key of the recording
+            to remove once it is downloaded.
+    """
+    held_by_species = {}
+    accepted_ids = set()
+    displaced = {}
+
+    # Best rated first, so the gaps go to the best new recordings
+    for rec in sorted(candidates, key=lambda r: quality_rank(r["q"])):
+        species = rec["en"]
+        if species not in held_by_species:
+            held = held_xeno_recordings(storage, download_dir_xc / sanitize_filename(species))
+            # [rank, xc_id, key] slots, worst last; key is None for accepted candidates
+            held_by_species[species] = sorted(([quality_rank(q), xc_id, key] for q, xc_id, key in held),
+                                              key=lambda slot: slot[0])
+        slots = held_by_species[species]
+
+        if any(slot[1] == str(rec["id"]) for slot in slots):
+            continue
+        rank = quality_rank(rec["q"])
+        if len(slots) < max_per_species:
+            slots.append([rank, str(rec["id"]), None])          # Fills a gap
+        elif slots and rank < slots[-1][0] and slots[-1][2] is not None:
+            displaced[rec["id"]] = slots.pop()[2]               # Beats the worst recording held
+            slots.append([rank, str(rec["id"]), None])
+        else:
+            continue
+        slots.sort(key=lambda slot: slot[0])
+        accepted_ids.add(rec["id"])
+
+    merged = [rec for rec in candidates if rec["id"] in accepted_ids]
+    logger.info(f"Incremental sync: {len(merged)} of {len(candidates)} new Xeno-Canto candidates improve the library "
+                f"({len(displaced)} replace a held recording)")
+    return merged, displaced
+
+
+def remove_held_recording(storage, key, manifest=None, inventory=None):
+    """
+    Remove a recording displaced by a better one from storage, and from the
+    manifest and inventory, so verify does not report it missing.
+    """
+    file_path = storage.root / key
+    storage.delete(key)
+    if manifest is not None:
+        manifest.forget(file_path)
+    if inventory is not None and storage.is_local:
+        inventory.remove(file_path)
+    logger.info(f"Removed {key}: replaced by a better recording")
@@ -0,0 +1,86 @@
+"""
+Target species lists for bird call downloader.
+
+config["species"] restricts a run to a list of species, each given as a common
+name ("House Sparrow"), scientific name ("Passer domesticus") or eBird species
+code ("houspa"), matched case-insensitively. An empty list means every species
+in the configured region.
+
+Xeno-Canto is then searched species by species instead of paging through the
+whole region, and the eBird regional species list is filtered before any
+Macaulay Library catalog request, so a targeted run costs in proportion to the
+target list.
+"""
+import re
+
+# "Genus epithet", as opposed to a capitalised common name such as "House Sparrow"
+_SCIENTIFIC_RE = re.compile(r"^[A-Z][a-z]+ [a-z][a-z-]+$")
+
+
+def get_target_species(config):
+    """Return the configured target species, or an empty list for no filter"""
+    return [str(name).strip() for name in config.get("species") or [] if str(name).strip()]
+
+
+def split_scientific(name):
+    """Return (genus, epithet) if name looks like a binomial scientific name, else None"""
+    if name and _SCIENTIFIC_RE.match(name.strip()):
+        genus, epithet = name.strip().split(" ")
+        return genus, epithet
+    return None
+
+
+def resolve_targets(targets, taxonomy=None):
+    """
+    Look up each target in the eBird taxonomy.
+
+    Args:
+        targets (list): Names from get_target_species
+        taxonomy (iterable, optional): (species_code, common_name, scientific_name) tuples
+
+    Returns:
+        list: One dict per target with "target", "code", "common" and "scientific";
+            fields are None when the target is not in the taxonomy and cannot be
+            classified from its spelling.
+    """
+    index = {}
+    for code, common, scientific in taxonomy or ():
+        for name in (code, common, scientific):
+            if name:
+                index.setdefault(name.lower(), (code, common, scientific))
+
+    resolved = []
+    for target in targets:
+        code, common, scientific = index.get(target.lower(), (None, None, None))
+        if not (code or common or scientific):
+            if split_scientific(target):
+                scientific = target
+            elif " " in target or not taxonomy:
+                common = target
+        resolved.append({"target": target, "code": code, "common": common, "scientific": scientific})
+    return resolved
+
+
+def target_names(resolved):
+    """All lower-cased names by which the resolved targets can be matched"""
+    names = set()
+    for entry in resolved:
+        names.update(name.lower() for name in (entry["target"], entry["code"], entry["common"],
+                                               entry["scientific"]) if name)
+    return names
+
+
+def xeno_target_tags(entry):
+    """
+    Xeno-Canto search tags for one resolved target.
+
+    Returns:
+        list or None: gen/sp tags when the scientific name is known, otherwise an en
+            tag, or None when the target cannot be searched on Xeno-Canto
+    """
+    binomial = split_scientific(entry["scientific"])
+    if binomial:
+        return [f"gen:{binomial[0]}", f"sp:{binomial[1]}"]
+    if entry["common"]:
+        return [f"en:\"{entry['common']}\""]
+    return None
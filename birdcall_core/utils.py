@@ -3,10 +3,15 @@ Utility functions for bird call downloader.
 """
 import os
 import re
+import json
+import time
+import hashlib
 import logging
-import requests
+import threading
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 def sanitize_filename(filename):
     """
     Sanitize a filename to remove or replace disallowed characters.
@@ -27,67 +32,310 @@ def sanitize_filename(filename):
         
     return filename
 
-def download_file(save_loc, file_name, download_url, overwrite=False):
-    """Download a single file"""
+# Size of the chunks a download is streamed and rate-limited in
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Response validators stored with each download
+VALIDATOR_FIELDS = ("etag", "last_modified", "content_length")
+
+
+def response_validators(headers):
+    """
+    The cache validators of an HTTP response, to store with the downloaded file.
+
+    Returns:
+        dict: "etag", "last_modified" and "content_length" (int), for those the server sent
+    """
+    validators = {}
+    if headers.get("ETag"):
+        validators["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["last_modified"] = headers["Last-Modified"]
+    if headers.get("Content-Length") and not headers.get("Content-Encoding"):
+        try:
+            validators["content_length"] = int(headers["Content-Length"])
+        except ValueError:
+            pass
+    return validators
+
+
+def conditional_headers(validators):
+    """Request headers asking the server to send the file only if it changed since validators were stored"""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def is_unchanged(response, validators):
+    """
+    Whether response shows that the copy downloaded with validators is still current.
+
+    True for 304 Not Modified, and also for a 200 from a server that ignores
+    conditional requests when its headers match the stored ones (same strong ETag,
+    or same Last-Modified and Content-Length), so the body need not be read.
+    """
+    if response.status_code == 304:
+        return True
+    if not validators or response.status_code != 200:
+        return False
+
+    current = response_validators(response.headers)
+    lengths_match = (current.get("content_length") is None or validators.get("content_length") is None
+                     or current["content_length"] == validators["content_length"])
+    if validators.get("etag") and current.get("etag"):
+        return (not current["etag"].startswith("W/") and current["etag"] == validators["etag"]
+                and lengths_match)
+    if validators.get("last_modified") and current.get("last_modified") == validators["last_modified"]:
+        return current.get("content_length") is not None and lengths_match
+    return False
+
+
+def download_file(save_loc, file_name, download_url, overwrite=False, manifest=None, source=None, inventory=None,
+                  conditional=True, storage=None, progress=None):
+    """
+    Download a single file.
+
+    The response is streamed through the process-wide bandwidth limiter (see
+    birdcall_core.bandwidth) into a storage backend (see birdcall_core.storage):
+    by default a local file written via a temporary ".part" file and renamed
+    into place once complete, so an interrupted download never leaves a
+    truncated file behind. With an S3Storage the path under the download
+    directory becomes the object key.
+    If a Manifest is given, the file's size, SHA-256 hash and the response's
+    ETag/Last-Modified/Content-Length are recorded in it after a successful
+    write, and if an Inventory is given the library index of local files is
+    updated (see birdcall_core.inventory). source ("xeno", "ebird", ...)
+    identifies whose bandwidth share the transfer counts against. The transfer
+    holds a slot of its host's pool (see birdcall_core.hosts) until the body has
+    been read.
+
+    With overwrite, a file that is still as the manifest recorded it is
+    revalidated with a conditional request and only transferred again if it
+    changed on the server (pass conditional=False to always re-fetch, e.g. to
+    repair a corrupt file).
+
+    A ProgressTracker passed as progress is told about every chunk received and
+    whether the file was downloaded, skipped or failed (see birdcall_core.progress).
+    """
+    from .bandwidth import get_limiter
+    from .hosts import get_scheduler
+    from .profiling import phase
+    from .storage import LocalStorage
+
     # Sanitize the filename
     file_name = sanitize_filename(file_name)
     
-    # Create directory if it doesn't exist
-    if not os.path.isdir(save_loc):
-        os.makedirs(save_loc, exist_ok=True)
-    
-    save_file_path = save_loc / file_name
+    save_file_path = Path(save_loc) / file_name
+    if storage is None:
+        storage = LocalStorage(save_loc)
+    key = storage.key_for(save_file_path)
 
     # Check if file exists and respect overwrite flag
-    if not overwrite and os.path.exists(save_file_path):
+    if not overwrite and storage.exists(key):
         # File exists and we don't want to overwrite
-        logging.debug(f"Skipping download: {save_file_path} (already exists)")
+        logger.debug(f"Skipping download: {save_file_path} (already exists)")
+        if progress:
+            progress.file_finished("skipped")
         return False
 
+    # Validators of the stored copy, if it is intact
+    validators = {}
+    if overwrite and conditional and manifest is not None:
+        entry = manifest.get(save_file_path)
+        if entry and storage.size(key) == entry.get("size"):
+            validators = {field: entry[field] for field in VALIDATOR_FIELDS if entry.get(field) is not None}
+
     try:
+        import requests
+
+        limiter = get_limiter()
+        digest = hashlib.sha256()
+
+        def chunks(response):
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                with phase("bandwidth_wait"):
+                    limiter.throttle(source, len(chunk))
+                digest.update(chunk)
+                if progress:
+                    progress.add_bytes(len(chunk))
+                yield chunk
+
         # Only download if we need to
-        rec_file = requests.get(download_url)
-        rec_file.raise_for_status()
-        
-        with open(save_file_path, 'wb') as f:
-            f.write(rec_file.content)
+        with phase("download"), get_scheduler().slot(download_url) as host, \
+                requests.get(download_url, headers=conditional_headers(validators),
+                             stream=True, timeout=host.timeout) as rec_file:
+            if is_unchanged(rec_file, validators):
+                logger.debug(f"Skipping download: {save_file_path} (not modified)")
+                if progress:
+                    progress.file_finished("skipped")
+                return False
+            rec_file.raise_for_status()
+            if progress:
+                progress.file_started(response_validators(rec_file.headers).get("content_length"))
+            
+            size = storage.write_stream(key, chunks(rec_file))
+
+        with phase("filesystem"):
+            if manifest is not None:
+                manifest.record(save_file_path, size, digest.hexdigest(), download_url,
+                                response_validators(rec_file.headers))
+            if inventory is not None and storage.is_local:
+                inventory.record(save_file_path)
         
-        logging.debug(f"Downloaded: {save_file_path}")
+        logger.debug(f"Downloaded: {save_file_path}")
+        if progress:
+            progress.file_finished("downloaded")
         return True
     except Exception as e:
-        logging.error(f"Failed to download {file_name}: {str(e)}")
+        logger.error(f"Failed to download {file_name}: {str(e)}")
+        if progress:
+            progress.file_finished("failed")
         return False
 
-def setup_logger(log_dir, name="birdcall_downloader", level=logging.INFO):
-    """Set up and return a configured logger"""
+# Logger that birdcall_core modules log under (via logging.getLogger(__name__))
+CORE_LOGGER_NAME = "birdcall_core"
+
+# Seconds a repeated warning or error is held back before it is logged again
+DEFAULT_REPEAT_INTERVAL = 60
+
+# Queue listener thread per configured logger name
+_log_listeners = {}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Drops warnings and errors identical to one logged less than interval seconds
+    ago. The next copy let through notes how many were dropped.
+    """
+
+    def __init__(self, interval=DEFAULT_REPEAT_INTERVAL, max_messages=1024):
+        super().__init__()
+        self.interval = interval
+        self.max_messages = max_messages
+        self._seen = {}    # (logger, level, message) -> [last logged, copies dropped since]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or not self.interval:
+            return True
+
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.interval:
+                seen[1] += 1
+                return False
+            dropped = seen[1] if seen else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > self.max_messages:
+                del self._seen[next(iter(self._seen))]
+
+        if dropped:
+            record.msg = f"{message} (repeated {dropped} more times)"
+            record.args = None
+        return True
+
+
+def setup_logger(log_dir, name="birdcall_downloader", level=logging.INFO,
+                 json_lines=False, repeat_interval=DEFAULT_REPEAT_INTERVAL):
+    """
+    Set up and return a configured logger.
+
+    Records from the named logger and from every birdcall_core module are put on a
+    queue and written to the log file and console by a background listener
+    thread, so download threads never wait on disk or terminal I/O.
+
+    Args:
+        log_dir (str): Directory for the timestamped log file (None for console only)
+        name (str): Logger name, also used in the log filename
+        level (int): Logging level
+        json_lines (bool): Write the log file as JSON lines
+        repeat_interval (float): Seconds to hold back repeated warnings and errors (0 to log all)
+
+    Returns:
+        logging.Logger: The configured logger
+    """
+    import atexit
+    import queue
     from datetime import datetime
-    
-    # Create logs directory if it doesn't exist
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # Generate timestamp for log filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f"{name}_{timestamp}.log"
-    log_filepath = os.path.join(log_dir, log_filename)
-    
-    # Configure logging
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    
-    # Remove any existing handlers
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-    
-    # Add handlers
-    file_handler = logging.FileHandler(log_filepath)
-    console_handler = logging.StreamHandler()
-    
+    from logging.handlers import QueueHandler, QueueListener
+
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    logger.info(f"Log file created at: {log_filepath}")
+    handlers = [console_handler]
+
+    log_filepath = None
+    if log_dir is not None:
+        # Create logs directory if it doesn't exist
+        os.makedirs(log_dir, exist_ok=True)
+
+        # Generate timestamp for log filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_filename = f"{name}_{timestamp}.{'jsonl' if json_lines else 'log'}"
+        log_filepath = os.path.join(log_dir, log_filename)
+
+        file_handler = logging.FileHandler(log_filepath)
+        file_handler.setFormatter(JsonLinesFormatter() if json_lines else formatter)
+        handlers.append(file_handler)
+
+    # Replace the listener of an earlier call for the same logger
+    previous = _log_listeners.pop(name, None)
+    if previous is not None:
+        previous.stop()
+        for handler in previous.handlers:
+            handler.close()
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(repeat_interval))
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    if not _log_listeners:
+        atexit.register(stop_logging)
+    _log_listeners[name] = listener
+
+    # Configure logging
+    logger = logging.getLogger(name)
+    for target in (logger, logging.getLogger(CORE_LOGGER_NAME)):
+        target.setLevel(level)
+        target.propagate = False
+
+        # Remove any existing handlers
+        for handler in target.handlers[:]:
+            target.removeHandler(handler)
+        target.addHandler(queue_handler)
+
+    if log_filepath:
+        logger.info(f"Log file created at: {log_filepath}")
     return logger
+
+
+def stop_logging():
+    """Write out queued log records and stop the listener threads started by setup_logger"""
+    while _log_listeners:
+        _, listener = _log_listeners.popitem()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
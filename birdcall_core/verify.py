@@ -0,0 +1,279 @@
+"""
+Library integrity verification for bird call downloader.
+
+Walks download_dir/XC and download_dir/ML in parallel, checking every file
+against the download manifest (size and SHA-256) or, for files the manifest
+does not know about, checking that the file is a structurally valid MP3.
+Corrupt and missing files are written to a re-download queue.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from .inventory import Inventory
+from .manifest import Manifest
+from .storage import uses_local_storage
+from .utils import download_file
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIRS = ("XC", "ML")
+QUEUE_FILENAME = "redownload_queue.jsonl"
+
+# Only these files count as recordings; ".part" temporaries and anything else are ignored
+RECORDING_EXTENSIONS = (".mp3",)
+
+# MPEG audio frame header lookup tables (kbps / Hz), indexed by header fields
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],   # MPEG 1
+    2: [22050, 24000, 16000],   # MPEG 2
+    0: [11025, 12000, 8000],    # MPEG 2.5
+}
+
+# How far past the ID3 tag to look for the first frame sync
+_SYNC_SEARCH_BYTES = 8192
+
+_XC_ID_RE = re.compile(r"XC(\d+)\.mp3$")
+_ML_ID_RE = re.compile(r"ML(\d+)\.mp3$")
+
+
+def _parse_frame_header(header):
+    """Return the frame length in bytes for a 4-byte MPEG audio header, or None if invalid"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_idx = (header[2] >> 4) & 0x0F
+    sample_rate_idx = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+
+    if version_bits == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or sample_rate_idx == 3:
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(version, layer)][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_idx]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 3 and version == 2:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+
+def is_valid_mp3(file_path):
+    """
+    Check that a file looks like a structurally valid MP3.
+
+    Skips an ID3v2 tag if present, then requires two consecutive valid MPEG
+    audio frame headers (the second one where the first frame's length says it
+    should be).
+    """
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(10)
+            offset = 0
+            if len(head) == 10 and head[:3] == b"ID3":
+                tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+                offset = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+
+            f.seek(offset)
+            window = f.read(_SYNC_SEARCH_BYTES)
+            for pos in range(max(0, len(window) - 3)):
+                if window[pos] != 0xFF:
+                    continue
+                frame_len = _parse_frame_header(window[pos:pos + 4])
+                if not frame_len:
+                    continue
+                f.seek(offset + pos + frame_len)
+                if _parse_frame_header(f.read(4)):
+                    return True
+    except OSError:
+        return False
+    return False
+
+
+def _sha256_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify_directory(dir_path, rel_dir, manifest_entries):
+    """
+    Verify every file in one species directory. Runs in a worker process.
+
+    Returns:
+        tuple: (ok_count, corrupt, seen) where corrupt is a list of
+            (relative_path, reason) and seen is the list of relative paths found.
+    """
+    ok_count = 0
+    corrupt = []
+    seen = []
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if not entry.name.lower().endswith(RECORDING_EXTENSIONS):
+                    continue
+                rel_path = f"{rel_dir}/{entry.name}"
+                seen.append(rel_path)
+                expected = manifest_entries.get(rel_path)
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    if expected is not None:
+                        if size != expected["size"]:
+                            corrupt.append((rel_path, f"size {size} != {expected['size']}"))
+                        elif _sha256_file(entry.path) != expected["sha256"]:
+                            corrupt.append((rel_path, "hash mismatch"))
+                        else:
+                            ok_count += 1
+                    elif size == 0 or not is_valid_mp3(entry.path):
+                        corrupt.append((rel_path, "not a valid mp3"))
+                    else:
+                        ok_count += 1
+                except OSError as e:
+                    corrupt.append((rel_path, f"unreadable: {str(e)}"))
+    except OSError as e:
+        logger.error(f"Error scanning {dir_path}: {str(e)}")
+    return ok_count, corrupt, seen
+
+
+def guess_download_url(file_name):
+    """Derive the source URL of a recording from the XC/ML id at the end of its filename"""
+    match = _XC_ID_RE.search(file_name)
+    if match:
+        return f"https://xeno-canto.org/{match.group(1)}/download"
+    match = _ML_ID_RE.search(file_name)
+    if match:
+        return f"https://cdn.download.ams.birds.cornell.edu/api/v2/asset/{match.group(1)}/mp3"
+    return None
+
+
+def verify_library(config, workers=None, repair=False, progress_callback=None):
+    """
+    Verify the integrity of an existing download tree.
+
+    Args:
+        config (dict): Configuration dictionary
+        workers (int, optional): Number of worker processes (defaults to the CPU count)
+        repair (bool): If True, re-download queued files immediately
+        progress_callback (callable, optional): Function to call with progress updates (0.0-1.0)
+
+    Returns:
+        dict: {"checked", "ok", "corrupt", "missing", "queued", "repaired"} where
+            corrupt and missing are lists of relative paths.
+    """
+    if progress_callback is None:
+        progress_callback = lambda x: None  # No-op function
+
+    if not uses_local_storage(config):
+        # Repairs would also be written locally rather than to the bucket
+        logger.error("verify checks files under the local download_dir only and does not support "
+                     "the s3 storage backend")
+        progress_callback(1.0)
+        return {"checked": 0, "ok": 0, "corrupt": [], "missing": [], "queued": 0, "repaired": 0}
+
+    download_dir = Path(config["download_dir"]).expanduser()
+    manifest = Manifest(download_dir)
+    manifest_entries = manifest.load()
+
+    # Split the manifest by species directory so each worker only receives its own entries
+    entries_by_dir = {}
+    for rel_path, entry in manifest_entries.items():
+        rel_dir = rel_path.rsplit("/", 1)[0] if "/" in rel_path else ""
+        entries_by_dir.setdefault(rel_dir, {})[rel_path] = entry
+
+    jobs = []
+    for source in SOURCE_DIRS:
+        source_dir = download_dir / source
+        if not source_dir.is_dir():
+            continue
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    rel_dir = f"{source}/{entry.name}"
+                    jobs.append((entry.path, rel_dir, entries_by_dir.get(rel_dir, {})))
+
+    logger.info(f"Verifying {len(jobs)} species directories ({len(manifest_entries)} manifest entries)...")
+
+    ok_count = 0
+    corrupt = []
+    seen = set()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_verify_directory, *job) for job in jobs]
+            for i, future in enumerate(futures):
+                dir_ok, dir_corrupt, dir_seen = future.result()
+                ok_count += dir_ok
+                corrupt.extend(dir_corrupt)
+                seen.update(dir_seen)
+                progress_callback((i + 1) / len(futures) * (0.9 if repair else 1.0))
+
+    missing = sorted(
+        rel_path for rel_path in manifest_entries
+        if rel_path.split("/", 1)[0] in SOURCE_DIRS and rel_path not in seen
+    )
+
+    for rel_path, reason in corrupt:
+        logger.warning(f"Corrupt: {rel_path} ({reason})")
+    for rel_path in missing:
+        logger.warning(f"Missing: {rel_path}")
+
+    # Queue everything we know how to fetch again
+    queue = []
+    for rel_path in [p for p, _ in corrupt] + missing:
+        entry = manifest_entries.get(rel_path)
+        rel_dir, file_name = rel_path.rsplit("/", 1)
+        url = entry["url"] if entry else guess_download_url(file_name)
+        if url:
+            queue.append([rel_dir, file_name, url])
+        else:
+            logger.warning(f"Cannot re-download {rel_path}: unknown source URL")
+
+    queue_path = download_dir / QUEUE_FILENAME
+    if queue:
+        with open(queue_path, "w", encoding="utf-8") as f:
+            for item in queue:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        logger.info(f"Queued {len(queue)} files for re-download in {queue_path}")
+    elif queue_path.exists():
+        queue_path.unlink()
+
+    repaired = 0
+    if repair and queue:
+        inventory = Inventory(download_dir)
+        for i, (rel_dir, file_name, url) in enumerate(queue):
+            progress_callback(0.9 + (i / len(queue)) * 0.1)
+            if download_file(download_dir / rel_dir, file_name, url, overwrite=True, manifest=manifest,
+                             inventory=inventory, conditional=False):
+                repaired += 1
+        inventory.close()
+        if repaired == len(queue):
+            queue_path.unlink()
+
+    progress_callback(1.0)
+    return {
+        "checked": len(seen),
+        "ok": ok_count,
+        "corrupt": sorted(p for p, _ in corrupt),
+        "missing": missing,
+        "queued": len(queue),
+        "repaired": repaired
+    }
@@ -0,0 +1,340 @@
+"""
+Download worker process for bird call downloader.
+
+The Flask app hands downloads to a separate worker process, so catalog parsing
+and large transfers never compete with request handling. The worker listens on
+a local socket (multiprocessing.connection, authenticated with a random key)
+and answers one command per connection:
+
+    {"cmd": "start", "config": {...}, "sources": ["xeno", "ebird"], "profile": null}
+    {"cmd": "progress"}
+    {"cmd": "ping"}
+    {"cmd": "shutdown"}
+
+Its address and key are written to a state file, so a restarted web process
+reconnects to the worker that is already running; downloads carry on while the
+web process is down. Run it directly with:
+
+    python -m birdcall_core.worker --state .worker.json --log-dir logs
+"""
+import os
+import sys
+import time
+import secrets
+import logging
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+from .config import get_logging_options
+from .state import read_json_state, write_json_state
+from .utils import setup_logger
+
+logger = logging.getLogger(__name__)
+
+WORKER_STATE_FILENAME = ".worker.json"
+WORKER_SOURCES = ("xeno", "ebird")
+
+# How long a client waits for a newly spawned worker to start listening
+SPAWN_TIMEOUT_SECONDS = 10
+
+# How long the worker waits for a client to authenticate and send its command
+CONNECTION_TIMEOUT_SECONDS = 10
+
+
+def _idle_progress():
+    return {
+        'xeno': 0.0,
+        'ebird': 0.0,
+        'xeno_complete': False,
+        'ebird_complete': False,
+        'xeno_files': 0,
+        'ebird_files': 0,
+        'xeno_detail': None,
+        'ebird_detail': None,
+        'download_running': False,
+        'status': 'Not started'
+    }
+
+
+class DownloadWorker:
+    """Runs download jobs on threads of the worker process and tracks their progress"""
+
+    def __init__(self, log_dir=None):
+        self.log_dir = log_dir or "logs"
+        self._lock = threading.Lock()
+        self._progress = _idle_progress()
+        self._threads = []
+        self._profiler = None
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, config, sources, profile=None):
+        """
+        Start downloading the given sources.
+
+        Args:
+            config (dict): Configuration dictionary
+            sources (iterable): "xeno" and/or "ebird"
+            profile (str, optional): Profile the job in this mode (see birdcall_core.profiling)
+
+        Returns:
+            dict: Reply with "status" ("success" or "error") and "message"
+        """
+        from .downloader import run_xeno_download, run_ebird_download
+
+        sources = [source for source in sources if source in WORKER_SOURCES]
+        if not sources:
+            return {"status": "error", "message": "No download sources given"}
+
+        with self._lock:
+            if self.is_running():
+                return {"status": "error", "message": "A download is already running"}
+
+            self._progress = _idle_progress()
+            self._progress['download_running'] = True
+            self._progress['status'] = 'Starting downloads...'
+            for source in WORKER_SOURCES:
+                if source not in sources:
+                    self._progress[source] = 1.0
+                    self._progress[f'{source}_complete'] = True
+
+            funcs = {"xeno": run_xeno_download, "ebird": run_ebird_download}
+            if profile:
+                from .profiling import start_profiling
+                self._profiler = start_profiling(self.log_dir, "web", profile)
+                funcs = {source: self._profiler.wrap(func, source) for source, func in funcs.items()}
+            self._threads = [
+                threading.Thread(target=self._run, args=(source, funcs[source], config), daemon=True)
+                for source in sources
+            ]
+            logger.info(f"Worker starting downloads: {', '.join(sources)}")
+            for thread in self._threads:
+                thread.start()
+
+        return {"status": "success", "message": "Downloads started"}
+
+    def _run(self, source, func, config):
+        from .progress import event_callback
+
+        @event_callback
+        def progress_callback(event):
+            with self._lock:
+                self._progress[source] = event["fraction"]
+                self._progress[f'{source}_detail'] = event
+
+        try:
+            count = func(config, progress_callback)
+        except Exception as e:
+            logger.error(f"Worker {source} download failed: {str(e)}")
+            count = 0
+
+        with self._lock:
+            self._progress[source] = 1.0
+            self._progress[f'{source}_complete'] = True
+            self._progress[f'{source}_files'] = count
+            finished = self._progress['xeno_complete'] and self._progress['ebird_complete']
+            if finished:
+                self._progress['download_running'] = False
+                self._progress['status'] = 'All downloads completed!'
+            profiler, self._profiler = (self._profiler, None) if finished else (None, self._profiler)
+        logger.info(f"Worker finished {source} download: {count} files")
+        if profiler:
+            profiler.stop()
+
+    def progress(self):
+        """Return a snapshot of the current progress"""
+        with self._lock:
+            return dict(self._progress)
+
+    def handle(self, message):
+        """Answer one command message"""
+        cmd = message.get("cmd") if isinstance(message, dict) else None
+        if cmd == "start":
+            return self.start(message["config"], message.get("sources", WORKER_SOURCES), message.get("profile"))
+        if cmd == "progress":
+            return {"status": "success", "progress": self.progress()}
+        if cmd == "ping":
+            return {"status": "success", "pid": os.getpid(), "running": self.is_running()}
+        return {"status": "error", "message": f"Unknown command: {cmd}"}
+
+
+class _TimedConnection:
+    """Connection wrapper whose receives give up after timeout seconds, for the handshake"""
+
+    def __init__(self, conn, timeout):
+        self._conn = conn
+        self._timeout = timeout
+
+    def send_bytes(self, buf):
+        self._conn.send_bytes(buf)
+
+    def recv_bytes(self, maxlength=None):
+        if not self._conn.poll(self._timeout):
+            raise TimeoutError("Timed out waiting for the client")
+        return self._conn.recv_bytes(maxlength)
+
+
+def serve(state_path, log_dir=None):
+    """Listen for commands until a shutdown command arrives"""
+    state_path = Path(state_path)
+    authkey = secrets.token_bytes(32)
+    # Clients are authenticated on their own thread (see handle_connection), so
+    # a slow or stray client cannot hold up the accept loop
+    listener = Listener(("127.0.0.1", 0))
+    # Created owner-only: anyone who can read the key can send the worker pickles
+    write_json_state(state_path, {"address": list(listener.address), "authkey": authkey.hex(),
+                                  "pid": os.getpid()}, mode=0o600)
+
+    worker = DownloadWorker(log_dir)
+    stopping = threading.Event()
+    logger.info(f"Download worker {os.getpid()} listening on {listener.address[0]}:{listener.address[1]}")
+
+    def handle_connection(conn):
+        try:
+            with conn:
+                timed = _TimedConnection(conn, CONNECTION_TIMEOUT_SECONDS)
+                deliver_challenge(timed, authkey)
+                answer_challenge(timed, authkey)
+                if not conn.poll(CONNECTION_TIMEOUT_SECONDS):
+                    raise TimeoutError("Timed out waiting for a command")
+                message = conn.recv()
+                if isinstance(message, dict) and message.get("cmd") == "shutdown":
+                    if worker.is_running():
+                        conn.send({"status": "error", "message": "A download is still running"})
+                        return
+                    conn.send({"status": "success"})
+                    stopping.set()
+                    # Wake the accept() call in the main loop
+                    Client(listener.address).close()
+                    return
+                conn.send(worker.handle(message))
+        except AuthenticationError as e:
+            logger.warning(f"Rejected worker connection: {str(e)}")
+        except (EOFError, OSError) as e:
+            # Includes clients that time out (TimeoutError)
+            logger.debug(f"Worker connection closed: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error handling worker command: {str(e)}")
+
+    try:
+        while not stopping.is_set():
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                logger.warning(f"Error accepting worker connection: {str(e)}")
+                continue
+            if stopping.is_set():
+                conn.close()
+                break
+            threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+    finally:
+        listener.close()
+        state = read_json_state(state_path, default={})
+        if isinstance(state, dict) and state.get("pid") == os.getpid():
+            state_path.unlink(missing_ok=True)
+        logger.info("Download worker stopped")
+
+
+def spawn_worker(state_path, log_dir=None):
+    """Start a detached worker process that outlives the process that started it"""
+    args = [sys.executable, "-m", "birdcall_core.worker", "--state", str(state_path)]
+    if log_dir:
+        args += ["--log-dir", str(log_dir)]
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+    else:
+        kwargs["start_new_session"] = True
+
+    return subprocess.Popen(args, cwd=Path(__file__).resolve().parent.parent, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+
+class WorkerClient:
+    """Sends commands to the download worker, starting one if none is running"""
+
+    def __init__(self, state_path, log_dir=None):
+        self.state_path = Path(state_path)
+        self.log_dir = log_dir
+        # Held while checking for and spawning a worker, so concurrent requests start only one
+        self._spawn_lock = threading.Lock()
+
+    def _request(self, message):
+        state = read_json_state(self.state_path)
+        if not state:
+            raise ConnectionError("No download worker is running")
+        with Client(tuple(state["address"]), authkey=bytes.fromhex(state["authkey"])) as conn:
+            conn.send(message)
+            return conn.recv()
+
+    def request(self, message, spawn=False):
+        """
+        Send a command and return the worker's reply.
+
+        Args:
+            message (dict): Command message
+            spawn (bool): Start a worker if none is reachable
+
+        Raises:
+            ConnectionError: If no worker is reachable (and none could be started).
+        """
+        try:
+            return self._request(message)
+        except (ConnectionError, OSError, EOFError):
+            if not spawn:
+                raise ConnectionError("No download worker is running")
+
+        with self._spawn_lock:
+            # Another request may have started a worker while we waited for the lock
+            try:
+                return self._request(message)
+            except (ConnectionError, OSError, EOFError):
+                pass
+
+            # Remove any stale state file so we can tell when the new worker is listening
+            self.state_path.unlink(missing_ok=True)
+            spawn_worker(self.state_path, self.log_dir)
+            deadline = time.monotonic() + SPAWN_TIMEOUT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                try:
+                    return self._request(message)
+                except (ConnectionError, OSError, EOFError):
+                    continue
+            raise ConnectionError("Download worker did not start")
+
+    def start_download(self, config, sources, profile=None):
+        """Start downloads in the worker, spawning it if needed"""
+        return self.request({"cmd": "start", "config": config, "sources": list(sources), "profile": profile},
+                            spawn=True)
+
+    def progress(self):
+        """Return the worker's progress, or None if no worker is running"""
+        try:
+            return self.request({"cmd": "progress"})["progress"]
+        except ConnectionError:
+            return None
+
+    def shutdown(self):
+        return self.request({"cmd": "shutdown"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bird call download worker")
+    parser.add_argument("--state", default=WORKER_STATE_FILENAME,
+                        help=f"Where to write the worker address (default: {WORKER_STATE_FILENAME})")
+    parser.add_argument("--log-dir", default=None, help="Write a worker log file in this directory")
+    args = parser.parse_args(argv)
+
+    setup_logger(args.log_dir, name="worker", level=logging.INFO, **get_logging_options())
+
+    serve(args.state, args.log_dir)
+
+
+if __name__ == "__main__":
+    main()
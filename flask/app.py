@@ -2,8 +2,11 @@ import os
 import logging
 import sys
 import time
+import bisect
 import threading
-from flask import Flask, render_template, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, send_file, abort
+from werkzeug.security import safe_join
 from pathlib import Path
 from datetime import datetime
 
@@ -11,14 +14,16 @@ from datetime import datetime
 sys.path.append(str(Path(os.path.dirname(os.path.abspath(__file__))).parent))
 
 # Import from core module
-from birdcall_core.config import load_config, save_config, get_log_level
+from birdcall_core.config import load_config, save_config, get_log_level, get_logging_options
 from birdcall_core.downloader import (
-    run_xeno_download,
-    run_ebird_download,
     preview_xeno_download,
+    estimate_xeno_download,
     preview_ebird_download,
 )
+from birdcall_core.inventory import Inventory
+from birdcall_core.state import config_fingerprint
 from birdcall_core.utils import setup_logger
+from birdcall_core.worker import WorkerClient, WORKER_STATE_FILENAME
 
 # Silence Werkzeug logs
 log = logging.getLogger('werkzeug')
@@ -34,14 +39,31 @@ LOGS_DIR = BASE_DIR / "logs"
 
 # Set up logging
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-logger = setup_logger(LOGS_DIR, name="flask", level=logging.INFO)
-
-# Global progress tracking
-progress = {
+logger = setup_logger(LOGS_DIR, name="flask", level=logging.INFO, **get_logging_options())
+
+# Downloads run in a separate worker process (see birdcall_core.worker), which
+# keeps going if the web server restarts
+worker = WorkerClient(BASE_DIR / WORKER_STATE_FILENAME, log_dir=LOGS_DIR)
+
+# Exact Xeno-Canto previews computed in the background after the fast estimate,
+# keyed by job id (only the most recent PREVIEW_JOBS_KEPT are kept). A job id
+# identifies the config, so repeated previews of the same settings share one
+# running job, and at most PREVIEW_WORKERS scans run at a time.
+PREVIEW_JOBS_KEPT = 20
+PREVIEW_WORKERS = 2
+preview_jobs = {}
+preview_futures = {}
+preview_jobs_lock = threading.Lock()
+preview_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="preview")
+
+# Progress reported before any worker has been started
+idle_progress = {
     'xeno': 0.0,
     'ebird': 0.0,
     'xeno_complete': False,
     'ebird_complete': False,
+    'xeno_detail': None,
+    'ebird_detail': None,
     'download_running': False,
     'status': 'Not started'
 }
@@ -58,20 +80,6 @@ def index():
         backup_regions=','.join(config['ebird']['backup_region_codes'])
     )
 
-def update_xeno_progress(progress_value):
-    """Callback to update Xeno-Canto progress"""
-    progress['xeno'] = float(progress_value)
-    if progress_value >= 1.0:
-        progress['xeno_complete'] = True
-        logger.info("Xeno-Canto download complete")
-
-def update_ebird_progress(progress_value):
-    """Callback to update eBird progress"""
-    progress['ebird'] = float(progress_value)
-    if progress_value >= 1.0:
-        progress['ebird_complete'] = True
-        logger.info("eBird download complete")
-
 def build_config_from_form(form_data):
     """Convert submitted form data into a config dict with proper types."""
     xeno_min_length = form_data.get('xeno_min_length', '')
@@ -86,7 +94,7 @@ def build_config_from_form(form_data):
     xeno_better_than = xeno_better_than if xeno_better_than != "" else None
     backup_regions = [r.strip() for r in form_data.get('backup_regions', '').split(',') if r.strip()]
 
-    return {
+    config = {
         "download_dir": form_data.get('download_dir', str(Path.home() / "Downloads" / "BirdCalls")),
         "overwrite": False,  # Always false
         "verbosity": "warning",  # Fixed at warning
@@ -107,6 +115,15 @@ def build_config_from_form(form_data):
         }
     }
 
+    # Keep settings that the form does not expose (e.g. metadata export) from config.json
+    for key, value in load_config().items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = {**value, **config[key]}
+        else:
+            config.setdefault(key, value)
+
+    return config
+
 
 def validate_sources(config, xeno_enabled, ebird_enabled):
     """Validate enabled sources. Returns an error message string, or None if valid."""
@@ -116,8 +133,8 @@ def validate_sources(config, xeno_enabled, ebird_enabled):
     if xeno_enabled:
         if not config["xeno"]["api_key"]:
             return "Xeno-Canto API key is required for Xeno-Canto downloads."
-        if not config["xeno"]["country"] and not config["xeno"]["location"]:
-            return "For Xeno-Canto downloads, either Country or Location must be specified."
+        if not config["xeno"]["country"] and not config["xeno"]["location"] and not config.get("species"):
+            return "For Xeno-Canto downloads, either Country or Location (or a species list in config.json) must be specified."
 
     if ebird_enabled:
         if not config["ebird"]["api_key"]:
@@ -146,7 +163,9 @@ def preview_download():
 
         if xeno_enabled:
             try:
-                result["xeno"] = preview_xeno_download(config)
+                # Answer from the first page of results; the exact count follows via /preview/<job_id>
+                result["xeno"] = estimate_xeno_download(config)
+                result["xeno"]["job_id"] = start_xeno_preview_job(config)
             except Exception as e:
                 logger.error(f"Error previewing Xeno-Canto: {str(e)}")
                 return jsonify({
@@ -174,18 +193,54 @@ def preview_download():
         })
 
 
+def start_xeno_preview_job(config):
+    """
+    Compute the exact Xeno-Canto preview on the preview executor and return its job id.
+    A job still running for the same config is reused rather than started again.
+    """
+    job_id = config_fingerprint(config)[:16]
+
+    def refine():
+        try:
+            job = {"status": "success", "xeno": preview_xeno_download(config)}
+        except Exception as e:
+            logger.error(f"Error previewing Xeno-Canto: {str(e)}")
+            job = {"status": "error", "message": f"Could not preview Xeno-Canto: {str(e)}"}
+        with preview_jobs_lock:
+            if job_id in preview_jobs:
+                preview_jobs[job_id] = job
+            preview_futures.pop(job_id, None)
+
+    with preview_jobs_lock:
+        if preview_jobs.get(job_id, {}).get("status") == "running":
+            return job_id
+        preview_jobs.pop(job_id, None)
+        preview_jobs[job_id] = {"status": "running"}
+        preview_futures[job_id] = preview_executor.submit(refine)
+        while len(preview_jobs) > PREVIEW_JOBS_KEPT:
+            expired = next(iter(preview_jobs))
+            del preview_jobs[expired]
+            # Drop scans nobody can ask for any more, unless they have already started
+            future = preview_futures.pop(expired, None)
+            if future:
+                future.cancel()
+    return job_id
+
+
+@app.route('/preview/<job_id>')
+def preview_status(job_id):
+    """Return the exact Xeno-Canto preview once its background job has finished"""
+    with preview_jobs_lock:
+        job = preview_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown or expired preview"})
+    return jsonify(job)
+
+
 @app.route('/start_download', methods=['POST'])
 def start_download():
     """Update config.json and start the download process"""
     try:
-        # Reset progress
-        progress['xeno'] = 0.0
-        progress['ebird'] = 0.0
-        progress['xeno_complete'] = False
-        progress['ebird_complete'] = False
-        progress['download_running'] = True
-        progress['status'] = 'Starting downloads...'
-
         # Get form data
         form_data = request.form
 
@@ -198,7 +253,6 @@ def start_download():
 
         error = validate_sources(config, xeno_enabled, ebird_enabled)
         if error:
-            progress['download_running'] = False
             return jsonify({"status": "error", "message": error})
 
         # Save the new config to config.json
@@ -215,31 +269,22 @@ def start_download():
         os.makedirs(download_dir_xc, exist_ok=True)
         os.makedirs(download_dir_ml, exist_ok=True)
         
-        # Start download threads
-        if xeno_enabled:
-            xeno_thread = threading.Thread(
-                target=run_xeno_download,
-                args=(config, update_xeno_progress)
-            )
-            xeno_thread.daemon = True
-            xeno_thread.start()
-            logger.info("Started Xeno-Canto download thread")
-        else:
-            progress['xeno_complete'] = True
-            progress['xeno'] = 1.0
-        
-        if ebird_enabled:
-            ebird_thread = threading.Thread(
-                target=run_ebird_download,
-                args=(config, update_ebird_progress)
-            )
-            ebird_thread.daemon = True
-            ebird_thread.start()
-            logger.info("Started eBird download thread")
-        else:
-            progress['ebird_complete'] = True
-            progress['ebird'] = 1.0
-        
+        # Hand the downloads to the worker process
+        sources = [source for source, enabled in (("xeno", xeno_enabled), ("ebird", ebird_enabled)) if enabled]
+        try:
+            profile = "cprofile" if form_data.get('profile') == 'on' else None
+            reply = worker.start_download(config, sources, profile=profile)
+        except ConnectionError as e:
+            logger.error(f"Could not reach download worker: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": f"Could not start the download worker: {str(e)}"
+            })
+
+        if reply.get("status") != "success":
+            return jsonify(reply)
+
+        logger.info(f"Started downloads in worker: {', '.join(sources)}")
         return jsonify({
             "status": "success", 
             "message": "Configuration saved and downloads started"
@@ -254,28 +299,137 @@ def start_download():
 
 @app.route('/progress')
 def get_progress():
-    """API endpoint to get current progress"""
-    # Check if downloads are complete
-    if progress['download_running']:
-        if progress['xeno_complete'] and progress['ebird_complete']:
-            progress['download_running'] = False
-            progress['status'] = 'All downloads completed!'
+    """API endpoint to get current progress from the download worker"""
+    progress = worker.progress() or dict(idle_progress)
             
     # Add timestamp to help the client determine freshness
     progress['timestamp'] = time.time()
     
     return jsonify(progress)
 
+@app.route('/library')
+def library():
+    """
+    API endpoint summarising the downloaded library from the inventory index.
+
+    Query parameters: source ("XC" or "ML") restricts the summary to one source;
+    reconcile=1 rescans the download directory first.
+    """
+    try:
+        config = load_config()
+        inventory = Inventory(config["download_dir"])
+        try:
+            reconciled = None
+            if request.args.get('reconcile', '').lower() in ('1', 'true', 'yes'):
+                reconciled = inventory.reconcile()
+                logger.info(f"Library inventory reconciled: {reconciled}")
+            summary = inventory.summary(source=request.args.get('source') or None)
+        finally:
+            inventory.close()
+
+        return jsonify({
+            "status": "success",
+            "reconciled": reconciled,
+            **summary
+        })
+
+    except Exception as e:
+        logger.error(f"Error reading library inventory: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"Error reading library inventory: {str(e)}"
+        })
+
+# Recordings that /audio will serve
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a"}
+
+@app.route('/audio/<path:rel_path>')
+def serve_audio(rel_path):
+    """
+    Stream a recording from the download directory, e.g. /audio/XC/Species/file.mp3.
+
+    send_file answers Range and conditional (ETag / If-Modified-Since) requests and
+    passes the open file to the WSGI server's file wrapper, which uses sendfile()
+    where the server supports it (e.g. gunicorn); nothing is read into memory here.
+    """
+    config = load_config()
+    library_root = os.path.realpath(Path(config["download_dir"]).expanduser())
+
+    # safe_join rejects absolute paths and ".." components; the realpath check
+    # also rejects symlinks that lead out of the library
+    file_path = safe_join(library_root, rel_path)
+    if file_path is None or Path(rel_path).suffix.lower() not in AUDIO_EXTENSIONS:
+        abort(404)
+    real_path = os.path.realpath(file_path)
+    if os.path.commonpath([library_root, real_path]) != library_root or not os.path.isfile(real_path):
+        abort(404)
+
+    return send_file(real_path, conditional=True, max_age=3600)
+
+# Directory browser listing: page size limits and a short-lived cache of sorted
+# subdirectory names, invalidated when the directory's mtime changes
+BROWSE_PAGE_SIZE = 200
+BROWSE_MAX_PAGE_SIZE = 1000
+BROWSE_CACHE_TTL = 15  # seconds
+BROWSE_CACHE_MAX_ENTRIES = 256
+_browse_cache = {}
+_browse_cache_lock = threading.Lock()
+
+def list_subdirectories(path):
+    """
+    Return the sorted sort keys and names of the non-hidden subdirectories of path.
+
+    Uses os.scandir, whose entries usually know their type without an extra stat
+    call, and caches the result per directory for BROWSE_CACHE_TTL seconds or until
+    the directory's mtime changes.
+    """
+    key = str(path)
+    mtime = os.stat(path).st_mtime_ns
+    now = time.monotonic()
+
+    with _browse_cache_lock:
+        cached = _browse_cache.get(key)
+        if cached and cached["mtime"] == mtime and cached["expires"] > now:
+            return cached["keys"], cached["names"]
+
+    names = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith('.'):  # Skip hidden directories
+                continue
+            try:
+                if entry.is_dir():
+                    names.append(entry.name)
+            except OSError:
+                continue
+    names.sort(key=lambda name: (name.lower(), name))
+    keys = [(name.lower(), name) for name in names]
+
+    with _browse_cache_lock:
+        if len(_browse_cache) >= BROWSE_CACHE_MAX_ENTRIES:
+            _browse_cache.pop(next(iter(_browse_cache)))
+        _browse_cache[key] = {"mtime": mtime, "expires": now + BROWSE_CACHE_TTL, "keys": keys, "names": names}
+
+    return keys, names
+
 @app.route('/browse_directories', methods=['POST'])
 def browse_directories():
-    """List subdirectories of a specified path"""
+    """
+    List subdirectories of a specified path, one page at a time.
+
+    Request JSON: path, optional prefix (case-insensitive name filter), cursor (the
+    next_cursor of the previous page) and limit.
+    """
     try:
         data = request.json
         base_path = data.get('path', str(Path.home()))
+        prefix = (data.get('prefix') or '').lower()
+        cursor = data.get('cursor')
+        limit = min(int(data.get('limit') or BROWSE_PAGE_SIZE), BROWSE_MAX_PAGE_SIZE)
         
         # Ensure the path exists
         path = Path(base_path)
-        if not path.exists() or not path.is_dir():
+        if not path.is_dir():
             return jsonify({
                 "status": "error",
                 "message": f"Directory not found: {base_path}"
@@ -285,25 +439,30 @@ def browse_directories():
         parent = str(path.parent) if str(path.parent) != str(path) else None
         
         # List subdirectories
-        dirs = []
         try:
-            for item in path.iterdir():
-                if item.is_dir() and not item.name.startswith('.'):  # Skip hidden directories
-                    dirs.append({
-                        "path": str(item),
-                        "name": item.name
-                    })
+            keys, names = list_subdirectories(path)
         except PermissionError:
             return jsonify({
                 "status": "error",
                 "message": f"Permission denied accessing: {base_path}"
             })
+
+        # Narrow to the prefix range, then continue after the cursor
+        range_start = bisect.bisect_left(keys, (prefix,)) if prefix else 0
+        range_end = bisect.bisect_left(keys, (prefix + '\U0010ffff',)) if prefix else len(keys)
+        start = range_start
+        if cursor:
+            start = max(start, bisect.bisect_right(keys, (cursor.lower(), cursor)))
+        page = names[start:min(start + limit, range_end)]
+        has_more = start + limit < range_end
             
         return jsonify({
             "status": "success",
             "current_path": str(path),
             "parent_path": parent,
-            "directories": sorted(dirs, key=lambda x: x["name"].lower())
+            "directories": [{"path": str(path / name), "name": name} for name in page],
+            "next_cursor": page[-1] if has_more and page else None,
+            "total": range_end - range_start
         })
     except Exception as e:
         logger.error(f"Error browsing directories: {str(e)}")
@@ -95,6 +95,16 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.classList.add('error');
     }
 
+    function formatBytes(size) {
+        const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+        let unit = 0;
+        while (size >= 1000 && unit < units.length - 1) {
+            size /= 1000;
+            unit++;
+        }
+        return (unit === 0 ? size : size.toFixed(1)) + ' ' + units[unit];
+    }
+
     function buildPreviewCard(title, rows, note) {
         const rowsHtml = rows.map(r =>
             `<div class="preview-stat"><span class="preview-value">${r.value}</span>` +
@@ -111,13 +121,26 @@ document.addEventListener('DOMContentLoaded', function() {
         let totalMax = 0;   // upper bound including estimates
         let hasEstimate = false;
 
-        if (data.xeno) {
-            cards.push(buildPreviewCard('🎧 Xeno-Canto', [
+        if (data.xeno && data.xeno.exact) {
+            const rows = [
                 { value: data.xeno.species, label: 'species' },
                 { value: data.xeno.calls, label: 'recordings' }
-            ], 'Exact count based on matching recordings.'));
+            ];
+            if (data.xeno.bytes !== undefined) {
+                rows.push({ value: formatBytes(data.xeno.bytes), label: 'total size' });
+            }
+            cards.push(buildPreviewCard('🎧 Xeno-Canto', rows, 'Exact count based on matching recordings.'));
             totalMin += data.xeno.calls;
             totalMax += data.xeno.calls;
+        } else if (data.xeno) {
+            hasEstimate = true;
+            cards.push(buildPreviewCard('🎧 Xeno-Canto', [
+                { value: '~' + data.xeno.species, label: 'species' },
+                { value: 'up to ' + data.xeno.calls, label: 'recordings' }
+            ], data.xeno.refine_error
+                ? 'Estimate from the first page of results (exact count failed: ' + data.xeno.refine_error + ').'
+                : 'Estimate from the first page of results. Counting exactly…'));
+            totalMax += data.xeno.calls;
         }
 
         if (data.ebird) {
@@ -137,6 +160,37 @@ document.addEventListener('DOMContentLoaded', function() {
         previewNote.innerHTML = totalText;
     }
 
+    // Poll for the exact Xeno-Canto count and redraw the preview when it arrives
+    function refineXenoPreview(data, formData) {
+        const jobId = data.xeno && data.xeno.job_id;
+        if (!jobId) return;
+
+        setTimeout(function() {
+            // Stop if the user went back or started another preview
+            if (pendingFormData !== formData) return;
+
+            fetch('/preview/' + jobId)
+            .then(response => response.json())
+            .then(job => {
+                if (pendingFormData !== formData) return;
+                if (job.status === 'running') {
+                    refineXenoPreview(data, formData);
+                    return;
+                }
+                if (job.status === 'success') {
+                    data.xeno = job.xeno;
+                } else {
+                    data.xeno.job_id = null;
+                    data.xeno.refine_error = job.message;
+                }
+                renderPreview(data);
+            })
+            .catch(error => {
+                console.error('Error refining preview:', error);
+            });
+        }, 1000);
+    }
+
     if (downloadForm) {
         downloadForm.addEventListener('submit', function(e) {
             e.preventDefault();
@@ -163,6 +217,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     downloadForm.style.display = 'none';
                     messageDiv.classList.add('hidden');
                     previewSection.classList.remove('hidden');
+                    refineXenoPreview(data, pendingFormData);
                 } else {
                     showError(data.message);
                 }
@@ -268,6 +323,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         // Update progress bars
                         updateProgressBar('xeno', data.xeno);
                         updateProgressBar('ebird', data.ebird);
+                        updateProgressDetail('xeno', data.xeno_detail);
+                        updateProgressDetail('ebird', data.ebird_detail);
                         
                         // Update status message
                         document.getElementById('status-message').textContent = data.status;
@@ -320,6 +377,47 @@ document.addEventListener('DOMContentLoaded', function() {
         progressBar.textContent = `${progressPercent}%`;
     }
 
+    function formatDuration(seconds) {
+        seconds = Math.floor(seconds);
+        if (seconds >= 3600) {
+            return `${Math.floor(seconds / 3600)}h${String(Math.floor(seconds % 3600 / 60)).padStart(2, '0')}m`;
+        }
+        if (seconds >= 60) {
+            return `${Math.floor(seconds / 60)}m${String(seconds % 60).padStart(2, '0')}s`;
+        }
+        return `${seconds}s`;
+    }
+
+    // Function to show byte and file counts, rate and ETA under a progress bar
+    function updateProgressDetail(id, detail) {
+        const element = document.getElementById(`${id}-detail`);
+        if (!detail) {
+            element.textContent = '';
+            return;
+        }
+        const parts = [`${detail.files_done} downloaded`];
+        if (detail.files_skipped) {
+            parts.push(`${detail.files_skipped} skipped`);
+        }
+        if (detail.files_failed) {
+            parts.push(`${detail.files_failed} failed`);
+        }
+        let bytes = formatBytes(detail.bytes_done);
+        if (detail.bytes_total && detail.fraction < 1) {
+            bytes += detail.bytes_total_estimated
+                ? ` of ~${formatBytes(detail.bytes_total)} (estimated)`
+                : ` of ${formatBytes(detail.bytes_total)}`;
+        }
+        parts.push(bytes);
+        if (detail.fraction < 1) {
+            parts.push(`${formatBytes(Math.round(detail.rate))}/s`);
+            if (detail.eta !== null) {
+                parts.push(`ETA ${formatDuration(detail.eta)}`);
+            }
+        }
+        element.textContent = parts.join(' · ');
+    }
+
     // Directory browser functionality
     const browseBtn = document.getElementById('browse-btn');
     const downloadDirInput = document.getElementById('download_dir');
@@ -349,6 +447,9 @@ document.addEventListener('DOMContentLoaded', function() {
                         <div class="current-path">
                             <input type="text" id="current-path" value="${initialPath}" readonly>
                         </div>
+                        <div class="directory-filter">
+                            <input type="text" id="directory-filter" placeholder="Filter folders by name...">
+                        </div>
                         <div class="directory-actions">
                             <button class="btn" id="new-folder-btn">New Folder</button>
                         </div>
@@ -400,12 +501,32 @@ document.addEventListener('DOMContentLoaded', function() {
         });
         
         // Load initial directory listing
-        loadDirectories(initialPath);
+        loadDirectories(initialPath, null, false);
         
-        // Function to load directories from server
-        function loadDirectories(path) {
+        // Filter the listing by name prefix (debounced)
+        const filterInput = modal.querySelector('#directory-filter');
+        let filterTimer = null;
+        filterInput.addEventListener('input', function() {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => loadDirectories(currentPathDisplay.value, null, false), 250);
+        });
+
+        // Function to load directories from server, one page at a time.
+        // With a cursor and append=true, the next page is added to the existing list.
+        function loadDirectories(path, cursor, append) {
             const directoryList = document.getElementById('directory-list');
-            directoryList.innerHTML = '<p class="loading">Loading directories...</p>';
+            const loadMoreBtn = directoryList.querySelector('.load-more');
+            if (loadMoreBtn) {
+                loadMoreBtn.remove();
+            }
+            if (!append) {
+                directoryList.innerHTML = '<p class="loading">Loading directories...</p>';
+            }
+
+            // Clear the filter when navigating to a different directory
+            if (!append && path !== currentPathDisplay.value) {
+                filterInput.value = '';
+            }
             
             fetch('/browse_directories', {
                 method: 'POST',
@@ -413,7 +534,9 @@ document.addEventListener('DOMContentLoaded', function() {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    path: path
+                    path: path,
+                    prefix: filterInput.value.trim(),
+                    cursor: cursor || null
                 })
             })
             .then(response => response.json())
@@ -422,34 +545,49 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Update current path display
                     currentPathDisplay.value = data.current_path;
                     
-                    // Clear and populate directory list
-                    directoryList.innerHTML = '';
-                    
-                    // Add parent directory link if available
-                    if (data.parent_path) {
-                        const parentItem = document.createElement('div');
-                        parentItem.className = 'directory-item parent';
-                        parentItem.innerHTML = '<span class="dir-icon">📁</span> ..';
-                        parentItem.addEventListener('click', function() {
-                            loadDirectories(data.parent_path);
-                        });
-                        directoryList.appendChild(parentItem);
+                    if (!append) {
+                        // Clear and populate directory list
+                        directoryList.innerHTML = '';
+                        
+                        // Add parent directory link if available
+                        if (data.parent_path) {
+                            const parentItem = document.createElement('div');
+                            parentItem.className = 'directory-item parent';
+                            parentItem.innerHTML = '<span class="dir-icon">📁</span> ..';
+                            parentItem.addEventListener('click', function() {
+                                loadDirectories(data.parent_path, null, false);
+                            });
+                            directoryList.appendChild(parentItem);
+                        }
                     }
                     
                     // Add each directory
-                    if (data.directories.length === 0) {
+                    if (data.directories.length === 0 && !append) {
                         directoryList.innerHTML += '<p>No subdirectories found</p>';
                     } else {
                         data.directories.forEach(dir => {
                             const dirItem = document.createElement('div');
                             dirItem.className = 'directory-item';
-                            dirItem.innerHTML = `<span class="dir-icon">📁</span> ${dir.name}`;
+                            dirItem.innerHTML = '<span class="dir-icon">📁</span> ';
+                            dirItem.appendChild(document.createTextNode(dir.name));
                             dirItem.addEventListener('click', function() {
-                                loadDirectories(dir.path);
+                                loadDirectories(dir.path, null, false);
                             });
                             directoryList.appendChild(dirItem);
                         });
                     }
+
+                    // Offer the next page if there is one
+                    if (data.next_cursor) {
+                        const moreBtn = document.createElement('button');
+                        moreBtn.className = 'btn load-more';
+                        const shown = directoryList.querySelectorAll('.directory-item:not(.parent)').length;
+                        moreBtn.textContent = `Load more (${shown} of ${data.total})`;
+                        moreBtn.addEventListener('click', function() {
+                            loadDirectories(data.current_path, data.next_cursor, true);
+                        });
+                        directoryList.appendChild(moreBtn);
+                    }
                 } else {
                     directoryList.innerHTML = `<p class="error">${data.message}</p>`;
                 }
@@ -506,7 +644,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     newFolderInput.value = '';
                     
                     // Reload the directory listing
-                    loadDirectories(currentPath);
+                    loadDirectories(currentPath, null, false);
                 } else {
                     alert('Error creating folder: ' + data.message);
                 }
@@ -2,72 +2,339 @@
 Command-line interface for bird call downloader.
 """
 import os
+import argparse
 import threading
 from pathlib import Path
 import logging
-from tqdm import tqdm
 
-# Import from core module
-from birdcall_core.config import load_config, get_log_level
-from birdcall_core.downloader import run_xeno_download, run_ebird_download
-from birdcall_core.utils import setup_logger
+# Import from core module. Heavy dependencies (requests, bs4, tqdm) are only
+# imported once a command actually needs them, so no-op runs start fast.
+from birdcall_core.config import load_config, get_log_level, get_logging_options
+from birdcall_core.state import is_up_to_date, mark_run_complete
+
+LOGGER_NAME = "birdcall_downloader"
+
+# Download bars show our own file counts, transfer rate and ETA instead of tqdm's per-percent rate
+DOWNLOAD_BAR_FORMAT = "{desc}{percentage:3.0f}%|{bar}| {elapsed}{postfix}"
+
+def download_progress_callback(pbar, outcome=None):
+    """
+    Progress callback that moves a download bar and shows files, MB, MB/s and ETA.
+    If outcome (a dict) is given, it is kept updated with the latest progress event.
+    """
+    from birdcall_core.progress import event_callback, format_duration
 
-def run_with_progress_bar(func, config, desc):
-    """Wrap a download function with a progress bar"""
-    pbar = tqdm(total=100, desc=desc)
     last_progress = 0
-    downloaded_count = [0]  # Use list to make it mutable in the closure
-    
-    def progress_callback(progress):
+
+    @event_callback
+    def progress_callback(event):
         nonlocal last_progress
-        current = int(progress * 100)
+        if outcome is not None:
+            outcome.update(event)
+        current = int(event["fraction"] * 100)
         pbar.update(current - last_progress)
         last_progress = current
+
+        size = f"{event['bytes_done'] / 1e6:.1f}"
+        if event["bytes_total"] and event["fraction"] < 1:
+            size += (f"/~{event['bytes_total'] / 1e6:.1f} MB (est.)" if event["bytes_total_estimated"]
+                     else f"/{event['bytes_total'] / 1e6:.1f} MB")
+        else:
+            size += " MB"
+        postfix = f"{event['files_done']} files, {size}, {event['rate'] / 1e6:.2f} MB/s"
+        if event["files_failed"]:
+            postfix += f", {event['files_failed']} failed"
+        if event["eta"] is not None:
+            postfix += f", ETA {format_duration(event['eta'])}"
+        pbar.set_postfix_str(postfix)
+
+    return progress_callback
+
+def run_with_progress_bar(func, config, desc, outcome=None):
+    """Wrap a download function with a progress bar"""
+    from tqdm import tqdm
+
+    pbar = tqdm(total=100, desc=desc, bar_format=DOWNLOAD_BAR_FORMAT)
+    downloaded_count = [0]  # Use list to make it mutable in the closure
+    
+    progress_callback = download_progress_callback(pbar, outcome)
     
     result = func(config, progress_callback)
     downloaded_count[0] = result
     pbar.close()
     return downloaded_count[0]
 
-def main():
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Download bird call recordings from Xeno-Canto and eBird/Macaulay Library.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write phase timings and thread profiles to logs/")
+    parser.add_argument("--profile-mode", choices=["cprofile", "sample"], default="cprofile",
+                        help="Profile threads deterministically with cProfile (default) or by stack sampling")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also track memory peaks and allocation sites with tracemalloc (slow)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    download_parser = subparsers.add_parser("download", help="Download recordings (default)")
+    download_parser.add_argument("--incremental", action="store_true",
+                                 help="Only fetch recordings added since the last successful sync")
+
+    verify_parser = subparsers.add_parser("verify", help="Check downloaded files against the manifest")
+    verify_parser.add_argument("--workers", type=int, default=None,
+                               help="Number of worker processes (default: number of CPUs)")
+    verify_parser.add_argument("--repair", action="store_true",
+                               help="Re-download corrupt and missing files immediately")
+
+    subparsers.add_parser("features", help="Extract log-mel features for the downloaded library")
+
+    plan_parser = subparsers.add_parser("plan", help="Build a download plan and save it without downloading")
+    plan_parser.add_argument("-o", "--output", default="plan.json.gz",
+                             help="Where to write the plan (default: plan.json.gz)")
+    plan_parser.add_argument("--source", choices=["all", "xeno", "ebird"], default="all",
+                             help="Which source(s) to plan (default: all)")
+
+    apply_parser = subparsers.add_parser("apply", help="Download the files listed in a saved plan")
+    apply_parser.add_argument("plan", help="Plan file written by the plan command")
+
+    library_parser = subparsers.add_parser("library", help="Summarise the downloaded library from the inventory index")
+    library_parser.add_argument("--reconcile", action="store_true",
+                                help="Rescan the download directory and update the index first")
+    library_parser.add_argument("--source", choices=["XC", "ML"], default=None,
+                                help="Only summarise one source")
+    library_parser.add_argument("--json", action="store_true",
+                                help="Print the summary as JSON")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command = "download"
+    return args
+
+def run_verify(config, args):
+    """Verify the integrity of the existing download tree"""
+    from tqdm import tqdm
+    from birdcall_core.verify import verify_library
+
+    pbar = tqdm(total=100, desc="Verifying:       ")
+    last_progress = 0
+
+    def progress_callback(progress):
+        nonlocal last_progress
+        current = int(progress * 100)
+        pbar.update(current - last_progress)
+        last_progress = current
+
+    result = verify_library(config, workers=args.workers, repair=args.repair,
+                            progress_callback=progress_callback)
+    pbar.close()
+
+    print("\nVerification Summary:")
+    print(f"- Checked: {result['checked']} files")
+    print(f"- OK: {result['ok']} files")
+    print(f"- Corrupt: {len(result['corrupt'])} files")
+    print(f"- Missing: {len(result['missing'])} files")
+    print(f"- Queued for re-download: {result['queued']} files")
+    if args.repair:
+        print(f"- Repaired: {result['repaired']} files")
+
+def run_features(config, args):
+    """Extract features for every downloaded recording that is not up to date"""
+    from tqdm import tqdm
+    from birdcall_core.features import extract_library_features
+
+    pbar = tqdm(total=100, desc="Features:        ")
+    last_progress = 0
+
+    def progress_callback(progress):
+        nonlocal last_progress
+        current = int(progress * 100)
+        pbar.update(current - last_progress)
+        last_progress = current
+
+    result = extract_library_features(config, progress_callback=progress_callback)
+    pbar.close()
+
+    print("\nFeature Extraction Summary:")
+    print(f"- Extracted: {result['extracted']} files")
+    print(f"- Up to date: {result['skipped']} files")
+    print(f"- Failed: {result['failed']} files")
+
+def run_library(config, args):
+    """Print per-source and per-species counts from the library inventory index"""
+    from birdcall_core.inventory import Inventory
+    from birdcall_core.storage import uses_local_storage
+
+    inventory = Inventory(config["download_dir"])
+    try:
+        reconciled = inventory.reconcile() if args.reconcile else None
+        summary = inventory.summary(source=args.source)
+    finally:
+        inventory.close()
+
+    if args.json:
+        import json
+        print(json.dumps({"reconciled": reconciled, **summary}, indent=2, ensure_ascii=False))
+        return
+
+    if reconciled:
+        print(f"Reconciled index: {reconciled['added']} added, {reconciled['removed']} removed, "
+              f"{reconciled['updated']} updated")
+    if summary["last_reconciled"] is None and not summary["total_files"]:
+        print("The inventory is empty. Run 'library --reconcile' to index an existing library.")
+    if not uses_local_storage(config):
+        print("Note: the inventory indexes files under the local download_dir only; "
+              "recordings in the S3 bucket are not included.")
+
+    print("\nLibrary Summary:")
+    for source, totals in sorted(summary["sources"].items()):
+        print(f"- {source}: {totals['files']} files, {totals['species']} species, "
+              f"{totals['bytes'] / 1e6:.1f} MB")
+    print(f"- Total: {summary['total_files']} files, {summary['total_species']} species, "
+          f"{summary['total_bytes'] / 1e6:.1f} MB")
+
+    if summary["species"]:
+        print("\nPer species:")
+        for row in summary["species"]:
+            print(f"  {row['source']}  {row['files']:>4}  {row['species']}")
+
+def main(argv=None):
     """Main entry point for command line interface"""
+    args = parse_args(argv)
+
     # Load configuration
     config = load_config()
+    if getattr(args, "incremental", False):
+        config["incremental"] = True
+
+    if not args.profile:
+        run_command(config, args)
+        return
+
+    from birdcall_core.profiling import start_profiling
+
+    profiler = start_profiling(get_logs_dir(), args.command, args.profile_mode, args.profile_memory)
+    try:
+        profiler.wrap(run_command, "main")(config, args, profiler)
+    finally:
+        written = profiler.stop()
+        print("\nProfile written to:")
+        for path in written:
+            print(f"- {path}")
+
+def run_command(config, args, profiler=None):
+    """Run the selected command"""
+    if args.command == "verify":
+        start_logging(config)
+        run_verify(config, args)
+        return
+
+    if args.command == "features":
+        start_logging(config)
+        run_features(config, args)
+        return
+
+    if args.command == "apply":
+        start_logging(config)
+        run_apply(config, args, profiler)
+        return
+
+    if args.command == "library":
+        run_library(config, args)
+        return
     
-    # Setup logging
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    logs_dir = os.path.join(script_dir, "logs")
-    log_level = get_log_level(config)
-    logger = setup_logger(logs_dir, level=log_level)
+    # Validate Xeno-Canto settings
+    xc_valid = bool(config["xeno"]["country"] or config["xeno"]["location"] or config.get("species"))
     
+    # Validate eBird settings
+    ml_valid = bool(config["ebird"]["api_key"] and config["ebird"]["region_code"])
+
+    # Fast exit paths: nothing to do, so don't create log files or import download code
+    if not xc_valid and not ml_valid:
+        logging.getLogger(LOGGER_NAME).warning("Nothing to download: no valid Xeno-Canto or eBird settings")
+        return
+    if args.command == "download" and is_up_to_date(config):
+        print("Downloads are up to date (last run completed within min_run_interval_hours).")
+        return
+
+    logger = start_logging(config)
+
+    if args.command == "plan":
+        run_plan(config, args, xc_valid, ml_valid)
+        return
+
+    if not xc_valid:
+        logger.warning("Skipping Xeno-Canto download: no country, location or species list specified")
+    if not ml_valid:
+        logger.warning("Skipping eBird download: API key or region code not specified")
+
+    from birdcall_core.downloader import run_xeno_download, run_ebird_download
+
     # Create download directories
-    download_dir = Path(config["download_dir"])
+    download_dir = Path(config["download_dir"]).expanduser()
     download_dir_xc = download_dir / "XC"
     download_dir_ml = download_dir / "ML"
     os.makedirs(download_dir_xc, exist_ok=True)
     os.makedirs(download_dir_ml, exist_ok=True)
     
+    outcomes = {}
+    xc_files, ml_files = run_sources(
+        config,
+        run_xeno_download if xc_valid else None,
+        run_ebird_download if ml_valid else None,
+        profiler,
+        outcomes
+    )
+    
+    # Print summary
+    print("\nDownload Summary:")
+    print(f"- Xeno-Canto: {xc_files} files")
+    print(f"- eBird/ML: {ml_files} files")
+    print(f"- Total: {xc_files + ml_files} files")
+
+    # Only a clean run may let min_run_interval_hours skip the next ones
+    failed = [source for source, event in outcomes.items()
+              if event.get("fraction", 0) < 1.0 or event.get("error") or event.get("files_failed")]
+    if failed:
+        logger.warning(f"Downloads finished with errors ({', '.join(failed)}); not recording the run as complete")
+        print("\nDownloads finished with errors; see the log file for details.")
+        return
+    print("\nAll downloads completed!")
+    mark_run_complete(config)
+
+def run_sources(config, xeno_func, ebird_func, profiler=None, outcomes=None):
+    """
+    Run the Xeno-Canto and eBird download functions with progress bars, in parallel
+    threads when both are given. Either function may be None to skip that source.
+    With a profiler, each function is profiled in the thread that runs it. If
+    outcomes (a dict) is given, it receives the final progress event of each
+    source that ran, under "xeno" and "ebird".
+
+    Returns:
+        tuple: (xc_files, ml_files)
+    """
+    if profiler:
+        xeno_func = profiler.wrap(xeno_func, "xeno") if xeno_func else None
+        ebird_func = profiler.wrap(ebird_func, "ebird") if ebird_func else None
+
+    if outcomes is None:
+        outcomes = {}
+    if xeno_func:
+        outcomes["xeno"] = {}
+    if ebird_func:
+        outcomes["ebird"] = {}
+
     # Initialize counters
     xc_count, ml_count = 0, 0
     
-    # Validate Xeno-Canto settings
-    xc_valid = bool(config["xeno"]["country"] or config["xeno"]["location"])
-    if not xc_valid:
-        logger.warning("Skipping Xeno-Canto download: neither country nor location specified")
-    
-    # Validate eBird settings
-    ml_valid = bool(config["ebird"]["api_key"] and config["ebird"]["region_code"])
-    if not ml_valid:
-        logger.warning("Skipping eBird download: API key or region code not specified")
-    
     # Use threads for parallel downloads
-    if xc_valid and ml_valid:
+    if xeno_func and ebird_func:
         # If both are valid, use threading for parallel downloads
         xeno_thread = threading.Thread(
-            target=lambda: run_with_tqdm(run_xeno_download, config, "XC download:     ", lambda x: setattr(xc_count, 'value', x))
+            target=lambda: run_with_tqdm(xeno_func, config, "XC download:     ", lambda x: setattr(xc_count, 'value', x),
+                                         outcomes["xeno"])
         )
         ebird_thread = threading.Thread(
-            target=lambda: run_with_tqdm(run_ebird_download, config, "eBird download: ", lambda x: setattr(ml_count, 'value', x))
+            target=lambda: run_with_tqdm(ebird_func, config, "eBird download: ", lambda x: setattr(ml_count, 'value', x),
+                                         outcomes["ebird"])
         )
         
         # Class to hold mutable value
@@ -83,31 +350,92 @@ def main():
         xeno_thread.join()
         ebird_thread.join()
         
-        xc_files = xc_count.value
-        ml_files = ml_count.value
-    else:
-        # If only one is valid, run it directly
-        xc_files = run_with_progress_bar(run_xeno_download, config, "XC download:     ") if xc_valid else 0
-        ml_files = run_with_progress_bar(run_ebird_download, config, "eBird download: ") if ml_valid else 0
-    
-    # Print summary
-    print("\nDownload Summary:")
-    print(f"- Xeno-Canto: {xc_files} files")
-    print(f"- eBird/ML: {ml_files} files")
-    print(f"- Total: {xc_files + ml_files} files")
-    print("\nAll downloads completed!")
+        return xc_count.value, ml_count.value
 
-# Define a simpler version of run_with_tqdm for threading usage
-def run_with_tqdm(func, config, desc, setter_func):
-    """Run function with tqdm progress bar and set the result using a setter function"""
-    pbar = tqdm(total=100, desc=desc)
+    # If only one is valid, run it directly
+    xc_files = run_with_progress_bar(xeno_func, config, "XC download:     ", outcomes.get("xeno")) if xeno_func else 0
+    ml_files = run_with_progress_bar(ebird_func, config, "eBird download: ", outcomes.get("ebird")) if ebird_func else 0
+    return xc_files, ml_files
+
+def run_plan(config, args, xc_valid, ml_valid):
+    """Build a download plan and save it without downloading anything"""
+    from tqdm import tqdm
+    from birdcall_core.plan import build_plan, save_plan
+    from birdcall_core.sizes import format_bytes
+
+    sources = [source for source, valid in (("xeno", xc_valid), ("ebird", ml_valid))
+               if valid and args.source in (source, "all")]
+    if not sources:
+        print(f"Nothing to plan: no valid settings for source '{args.source}'")
+        return
+
+    pbar = tqdm(total=100, desc="Planning:        ")
     last_progress = 0
-    
+
     def progress_callback(progress):
         nonlocal last_progress
         current = int(progress * 100)
         pbar.update(current - last_progress)
         last_progress = current
+
+    plan = build_plan(config, sources, progress_callback)
+    pbar.close()
+    path = save_plan(plan, args.output)
+
+    print("\nPlan Summary:")
+    print(f"- Xeno-Canto: {len(plan['xeno'])} files")
+    print(f"- eBird/ML: {len(plan['ebird'])} files")
+    if "bytes" in plan:
+        unknown = f" ({plan['unknown_sizes']} files of unknown size)" if plan["unknown_sizes"] else ""
+        print(f"- Total size: {format_bytes(plan['bytes'])}{unknown}")
+    if plan.get("held"):
+        print(f"- Already held: {plan['held']} files ({format_bytes(plan['held_bytes'])}), "
+              f"not counted in the total or budget")
+    if plan.get("dropped"):
+        print(f"- Dropped to fit the byte budget: {plan['dropped']} files")
+    print(f"- Saved to: {path}")
+
+def run_apply(config, args, profiler=None):
+    """Download the files listed in a saved plan"""
+    from birdcall_core.plan import load_plan, apply_plan
+
+    plan = load_plan(args.plan)
+
+    # Create download directories
+    download_dir = Path(config["download_dir"]).expanduser()
+    os.makedirs(download_dir / "XC", exist_ok=True)
+    os.makedirs(download_dir / "ML", exist_ok=True)
+
+    xc_files, ml_files = run_sources(
+        config,
+        (lambda cfg, cb: apply_plan(cfg, plan, "xeno", cb)) if plan["xeno"] else None,
+        (lambda cfg, cb: apply_plan(cfg, plan, "ebird", cb)) if plan["ebird"] else None,
+        profiler
+    )
+
+    print("\nApply Summary:")
+    print(f"- Xeno-Canto: {xc_files} files")
+    print(f"- eBird/ML: {ml_files} files")
+    print(f"- Total: {xc_files + ml_files} files")
+
+def get_logs_dir():
+    """Directory for log files and profiles"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+def start_logging(config):
+    """Create the timestamped log file and return the CLI logger"""
+    from birdcall_core.utils import setup_logger
+
+    return setup_logger(get_logs_dir(), name=LOGGER_NAME, level=get_log_level(config),
+                        **get_logging_options(config))
+
+# Define a simpler version of run_with_tqdm for threading usage
+def run_with_tqdm(func, config, desc, setter_func, outcome=None):
+    """Run function with tqdm progress bar and set the result using a setter function"""
+    from tqdm import tqdm
+
+    pbar = tqdm(total=100, desc=desc, bar_format=DOWNLOAD_BAR_FORMAT)
+    progress_callback = download_progress_callback(pbar, outcome)
     
     result = func(config, progress_callback)
     setter_func(result)  # Set the result using the provided function
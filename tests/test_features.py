@@ -0,0 +1,61 @@
+"""
+Feature extraction checks: the spawned process pool gives the same features as inline extraction.
+
+Run with: python -m pytest tests (needs numpy; skipped otherwise)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+np = pytest.importorskip("numpy")
+
+from birdcall_core.features import FeatureExtractor, extract_library_features, load_feature_index, read_features
+
+
+def decode_tone(path, sample_rate, max_seconds=None):
+    """Test decoder: a one-second tone whose pitch comes from the file's first byte"""
+    pitch = 200 + 10 * Path(path).read_bytes()[0]
+    return np.sin(2 * np.pi * pitch * np.arange(sample_rate) / sample_rate).astype(np.float32)
+
+
+def _library(root):
+    folder = root / "XC" / "Robin"
+    folder.mkdir(parents=True)
+    for n in range(1, 4):
+        (folder / f"(A) Robin XC{n}.mp3").write_bytes(bytes([n * 20]))
+    (folder / "(A) Robin XC9.mp3.part").write_bytes(b"\0")
+
+
+def _config(root, processes):
+    return {"download_dir": str(root), "features": {
+        "enabled": True, "decoder": f"{__name__}:decode_tone", "sample_rate": 8000, "n_fft": 256,
+        "hop_length": 128, "n_mels": 16, "dtype": "float32", "processes": processes}}
+
+
+def _features(root):
+    index = load_feature_index(root)
+    return {path: np.asarray(read_features(root, entry)) for path, entry in index.items()}
+
+
+def test_pool_uses_spawn_and_matches_inline_extraction(tmp_path):
+    inline_root, pool_root = tmp_path / "inline", tmp_path / "pool"
+    _library(inline_root)
+    _library(pool_root)
+
+    extractor = FeatureExtractor(_config(pool_root, 1))
+    assert extractor._executor._mp_context.get_start_method() == "spawn"
+    extractor.close()
+
+    assert extract_library_features(_config(inline_root, 0))["extracted"] == 3
+    assert extract_library_features(_config(pool_root, 1))["extracted"] == 3
+
+    inline, pooled = _features(inline_root), _features(pool_root)
+    assert sorted(inline) == [f"XC/Robin/(A) Robin XC{n}.mp3" for n in range(1, 4)]
+    for path in inline:
+        np.testing.assert_allclose(pooled[path], inline[path], rtol=1e-6)
+
+    # Up-to-date files are skipped on the next run
+    assert extract_library_features(_config(pool_root, 1)) == {"extracted": 0, "skipped": 3, "failed": 0}
@@ -0,0 +1,93 @@
+"""
+Shard writer checks: resuming after an interrupted run and rolling over to a new shard.
+
+Run with: python -m pytest tests
+"""
+import sys
+import types
+import tarfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from birdcall_core.shards import ShardWriter, SHARDS_DIRNAME, load_shard_index, read_sample
+
+BODIES = {f"https://example.org/{n}.mp3": bytes([n]) * (700 + n) for n in range(1, 5)}
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.headers = {"Content-Length": str(len(body))}
+        self._body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+
+@pytest.fixture(autouse=True)
+def fake_requests(monkeypatch):
+    module = types.ModuleType("requests")
+    module.RequestException = type("RequestException", (Exception,), {})
+    module.HTTPError = type("HTTPError", (module.RequestException,), {})
+    module.get = lambda url, **kwargs: FakeResponse(BODIES[url])
+    monkeypatch.setitem(sys.modules, "requests", module)
+
+
+def _add(writer, n):
+    assert writer.download(f"XC{n}", f"https://example.org/{n}.mp3", {"source": "xeno"})
+
+
+def _members(path):
+    with tarfile.open(path) as tar:
+        return tar.getnames()
+
+
+def test_resumed_writer_finishes_the_old_shard_before_rolling_over(tmp_path):
+    shards = tmp_path / SHARDS_DIRNAME
+    writer = ShardWriter(tmp_path, "xc", max_bytes=6 * 512)
+    _add(writer, 1)
+    # Interrupted run: a partial member after the last complete sample and no end marker
+    writer._file.write(b"\xff" * 300)
+    writer._file.flush()
+    writer._file.close()
+
+    resumed = ShardWriter(tmp_path, "xc", max_bytes=6 * 512)
+    assert resumed.has("XC1")
+    _add(resumed, 2)  # Does not fit next to XC1: forces a rollover
+    resumed.close()
+
+    assert _members(shards / "xc-000000.tar") == ["XC1.mp3", "XC1.json"]
+    assert (shards / "xc-000000.tar").stat().st_size % 512 == 0
+    assert _members(shards / "xc-000001.tar") == ["XC2.mp3", "XC2.json"]
+
+
+def test_resumed_writer_appends_after_the_last_complete_sample(tmp_path):
+    writer = ShardWriter(tmp_path, "xc")
+    _add(writer, 1)
+    writer._file.write(b"\xff" * 300)
+    writer._file.flush()
+    writer._file.close()
+
+    resumed = ShardWriter(tmp_path, "xc")
+    _add(resumed, 3)
+    resumed.close()
+
+    assert _members(tmp_path / SHARDS_DIRNAME / "xc-000000.tar") == ["XC1.mp3", "XC1.json", "XC3.mp3", "XC3.json"]
+    index = load_shard_index(tmp_path)
+    for n in (1, 3):
+        audio, meta = read_sample(tmp_path, index[f"XC{n}"])
+        assert audio == BODIES[f"https://example.org/{n}.mp3"]
+        assert meta["key"] == f"XC{n}"
@@ -0,0 +1,86 @@
+"""
+Size lookup checks: HEAD failure statuses count against the host, like failed downloads.
+
+Run with: python -m pytest tests
+"""
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from birdcall_core import hosts
+from birdcall_core.sizes import fetch_size
+
+URL = "https://example.org/1.mp3"
+
+
+class FakeResponse:
+    def __init__(self, requests, status_code, headers=None):
+        self._requests = requests
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise self._requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+@pytest.fixture
+def fake_requests(monkeypatch):
+    module = types.ModuleType("requests")
+    module.RequestException = type("RequestException", (Exception,), {})
+
+    class HTTPError(module.RequestException):
+        def __init__(self, *args, response=None):
+            super().__init__(*args)
+            self.response = response
+
+    module.HTTPError = HTTPError
+    module.statuses = []
+    module.head = lambda url, **kwargs: FakeResponse(module, module.statuses.pop(0), {"Content-Length": "1234"})
+    module.get = lambda url, **kwargs: FakeResponse(module, module.statuses.pop(0), {"Content-Range": "bytes 0-0/1234"})
+    monkeypatch.setitem(sys.modules, "requests", module)
+    scheduler = hosts.HostScheduler()
+    monkeypatch.setattr(hosts, "get_scheduler", lambda: scheduler)
+    return module, scheduler
+
+
+def _failures(scheduler):
+    return scheduler.pool_for(URL).status()["failures"]
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_failure_status_counts_against_the_host(fake_requests, status):
+    requests, scheduler = fake_requests
+    requests.statuses = [status]
+
+    assert fetch_size(URL) is None
+    assert _failures(scheduler) == 1
+
+
+def test_failure_status_on_the_range_fallback_counts_against_the_host(fake_requests):
+    requests, scheduler = fake_requests
+    requests.statuses = [405, 502]  # HEAD not supported, then the ranged GET fails
+
+    assert fetch_size(URL) is None
+    assert _failures(scheduler) == 1
+
+
+def test_sizes_are_read_and_successes_reset_the_count(fake_requests):
+    requests, scheduler = fake_requests
+    requests.statuses = [503, 200, 405, 206]
+
+    assert fetch_size(URL) is None
+    assert fetch_size(URL) == 1234
+    assert _failures(scheduler) == 0
+    assert fetch_size(URL) == 1234  # From Content-Range
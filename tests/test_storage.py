@@ -0,0 +1,119 @@
+"""
+S3Storage checks against an in-memory S3 (moto).
+
+Run with: python -m pytest tests (needs boto3 and moto; skipped otherwise)
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from birdcall_core.storage import S3Storage, MIN_PART_SIZE
+
+BUCKET = "birdcalls"
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        storage = S3Storage(tmp_path, BUCKET, prefix="library", part_size=MIN_PART_SIZE, max_concurrency=2)
+        try:
+            yield storage, client
+        finally:
+            storage.close()
+
+
+def _chunks(data, size=1024 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_small_body_is_a_single_put(s3):
+    storage, client = s3
+    body = b"ID3" + b"\x00" * 1000
+
+    assert storage.write_stream("XC/Robin/a.mp3", _chunks(body)) == len(body)
+
+    obj = client.get_object(Bucket=BUCKET, Key="library/XC/Robin/a.mp3")
+    assert obj["Body"].read() == body
+    assert "-" not in obj["ETag"]  # Multipart ETags end in -<parts>
+
+
+def test_large_body_is_a_multipart_upload(s3):
+    storage, client = s3
+    body = os.urandom(2 * MIN_PART_SIZE + 12345)
+
+    assert storage.write_stream("ML/Wren/b.mp3", _chunks(body)) == len(body)
+
+    obj = client.get_object(Bucket=BUCKET, Key="library/ML/Wren/b.mp3")
+    assert obj["Body"].read() == body
+    assert obj["ETag"].strip('"').endswith("-3")
+
+
+def test_failed_upload_is_aborted(s3):
+    storage, client = s3
+
+    def failing():
+        yield os.urandom(MIN_PART_SIZE + 1)
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        storage.write_stream("XC/Robin/c.mp3", failing())
+
+    assert "Contents" not in client.list_objects_v2(Bucket=BUCKET, Prefix="library/XC/Robin/")
+    assert not client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+def test_delete_updates_the_listing(s3):
+    storage, client = s3
+    storage.write_stream("XC/Robin/d.mp3", [b"x"])
+    assert storage.exists("XC/Robin/d.mp3")
+
+    storage.delete("XC/Robin/d.mp3")
+
+    assert not storage.exists("XC/Robin/d.mp3")
+    assert "Contents" not in client.list_objects_v2(Bucket=BUCKET, Prefix="library/XC/Robin/")
+
+
+def test_exists_many_and_list_dir(s3, tmp_path):
+    storage, client = s3
+    client.put_object(Bucket=BUCKET, Key="library/XC/Robin/(A) Robin XC1.mp3", Body=b"x")
+    client.put_object(Bucket=BUCKET, Key="library/XC/Robin/sub/nested.mp3", Body=b"x")
+    client.put_object(Bucket=BUCKET, Key="other/XC/Robin/(B) Robin XC2.mp3", Body=b"x")
+
+    keys = ["XC/Robin/(A) Robin XC1.mp3", "XC/Robin/(B) Robin XC2.mp3", "XC/Wren/(A) Wren XC3.mp3"]
+    assert storage.exists_many(keys) == {"XC/Robin/(A) Robin XC1.mp3"}
+    assert storage.list_dir("XC/Robin") == ["XC/Robin/(A) Robin XC1.mp3"]
+    assert storage.key_for(tmp_path / "XC" / "Robin") == "XC/Robin"
+
+    # Writes keep the cached listing up to date
+    storage.write_stream("XC/Robin/(B) Robin XC2.mp3", [b"y"])
+    assert storage.exists_many(keys) == {"XC/Robin/(A) Robin XC1.mp3", "XC/Robin/(B) Robin XC2.mp3"}
+    assert storage.size("XC/Robin/(B) Robin XC2.mp3") == 1
+
+
+def test_incremental_merge_sees_recordings_held_in_s3(s3, tmp_path):
+    from birdcall_core.sync import merge_xeno_candidates, count_held_files
+
+    storage, client = s3
+    for name in ("(B) Robin XC1.mp3", "(C) Robin XC2.mp3"):
+        client.put_object(Bucket=BUCKET, Key=f"library/XC/Robin/{name}", Body=b"x")
+
+    candidates = [{"id": 1, "en": "Robin", "q": "B"}, {"id": 5, "en": "Robin", "q": "C"},
+                  {"id": 6, "en": "Robin", "q": "A"}]
+    merged, displaced = merge_xeno_candidates(candidates, storage, tmp_path / "XC", max_per_species=3)
+
+    assert [rec["id"] for rec in merged] == [6]
+    assert displaced == {}
+    assert count_held_files(storage, tmp_path / "XC" / "Robin") == 2
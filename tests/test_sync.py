@@ -0,0 +1,75 @@
+"""
+Incremental merge checks: gap filling, replacement ranking and removal of displaced recordings.
+
+Run with: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from birdcall_core.inventory import Inventory
+from birdcall_core.manifest import Manifest
+from birdcall_core.storage import LocalStorage
+from birdcall_core.sync import merge_xeno_candidates, remove_held_recording
+
+
+def _hold(root, species, *names):
+    folder = root / "XC" / species
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (folder / name).write_bytes(b"ID3")
+
+
+def _candidate(xc_id, quality, species="Robin"):
+    return {"id": xc_id, "en": species, "q": quality}
+
+
+def test_candidates_fill_gaps_best_first(tmp_path):
+    _hold(tmp_path, "Robin", "(B) Robin XC1.mp3")
+    candidates = [_candidate(10, "D"), _candidate(11, "A"), _candidate(12, "C"), _candidate(1, "B")]
+
+    merged, displaced = merge_xeno_candidates(candidates, LocalStorage(tmp_path), tmp_path / "XC", 3)
+
+    # Two gaps go to the best two new recordings, in the candidates' original order
+    assert [rec["id"] for rec in merged] == [11, 12]
+    assert displaced == {}
+
+
+def test_better_candidate_replaces_the_worst_held(tmp_path):
+    _hold(tmp_path, "Robin", "(A) Robin XC1.mp3", "(C) Robin XC2.mp3", "(E) Robin XC3.mp3")
+    candidates = [_candidate(20, "B"), _candidate(21, "D"), _candidate(22, "B")]
+
+    merged, displaced = merge_xeno_candidates(candidates, LocalStorage(tmp_path), tmp_path / "XC", 3)
+
+    # The two Bs displace E and then C; D no longer beats anything held
+    assert [rec["id"] for rec in merged] == [20, 22]
+    assert displaced == {20: "XC/Robin/(E) Robin XC3.mp3", 22: "XC/Robin/(C) Robin XC2.mp3"}
+
+
+def test_species_are_merged_independently(tmp_path):
+    _hold(tmp_path, "Robin", "(A) Robin XC1.mp3")
+    _hold(tmp_path, "Wren", "(C) Wren XC2.mp3")
+    candidates = [_candidate(30, "B", "Wren"), _candidate(31, "B", "Robin"), _candidate(32, "D", "Wren")]
+
+    merged, displaced = merge_xeno_candidates(candidates, LocalStorage(tmp_path), tmp_path / "XC", 1)
+
+    assert [rec["id"] for rec in merged] == [30]
+    assert displaced == {30: "XC/Wren/(C) Wren XC2.mp3"}
+
+
+def test_remove_held_recording_updates_manifest_and_inventory(tmp_path):
+    _hold(tmp_path, "Robin", "(E) Robin XC3.mp3")
+    path = tmp_path / "XC" / "Robin" / "(E) Robin XC3.mp3"
+    manifest = Manifest(tmp_path)
+    manifest.record(path, 3, "0" * 64, "https://xeno-canto.org/3/download")
+    inventory = Inventory(tmp_path)
+    inventory.record(path)
+
+    remove_held_recording(LocalStorage(tmp_path), "XC/Robin/(E) Robin XC3.mp3", manifest, inventory)
+
+    assert not path.exists()
+    assert manifest.get(path) is None
+    assert Manifest(tmp_path).load() == {}
+    assert inventory.summary()["total_files"] == 0
+    inventory.close()
@@ -0,0 +1,67 @@
+"""
+Download worker checks: state file permissions and connection handling.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import stat
+import threading
+from pathlib import Path
+from multiprocessing import AuthenticationError
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from birdcall_core import worker
+from birdcall_core.state import write_json_state, read_json_state
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_state_file_is_created_owner_only(tmp_path):
+    old_umask = os.umask(0)
+    try:
+        write_json_state(tmp_path / "secret.json", {"authkey": "00"}, mode=0o600)
+    finally:
+        os.umask(old_umask)
+
+    assert _mode(tmp_path / "secret.json") == 0o600
+    assert list(tmp_path.iterdir()) == [tmp_path / "secret.json"]
+
+
+@pytest.fixture
+def running_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, "CONNECTION_TIMEOUT_SECONDS", 1)
+    state_path = tmp_path / worker.WORKER_STATE_FILENAME
+    thread = threading.Thread(target=worker.serve, args=(state_path,), daemon=True)
+    thread.start()
+    client = worker.WorkerClient(state_path)
+    for _ in range(50):
+        if read_json_state(state_path):
+            break
+        thread.join(0.1)
+    yield state_path, client
+    client.shutdown()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_worker_state_is_owner_only(running_worker):
+    state_path, _ = running_worker
+    assert _mode(state_path) == 0o600
+
+
+def test_bad_key_does_not_stop_the_worker(running_worker):
+    state_path, client = running_worker
+    address = tuple(read_json_state(state_path)["address"])
+
+    with pytest.raises(AuthenticationError):
+        worker.Client(address, authkey=b"wrong key")
+
+    assert client.request({"cmd": "ping"})["status"] == "success"